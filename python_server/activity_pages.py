@@ -0,0 +1,214 @@
+"""
+活动流分页工具模块 - 流水线分页与按时间窗口定位上游活动页
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from activity_records import ActivityIndex, ActivityRecord
+
+logger = logging.getLogger(__name__)
+
+# 拉取单页活动的协程函数 (page, per_page) -> 活动记录列表或None（请求失败）
+FetchPage = Callable[[int, int], Awaitable[Optional[List[ActivityRecord]]]]
+
+# 按时间范围拉取活动时的每页数量（上游允许的最大值）
+PAGE_SIZE = 100
+
+
+def page_concurrency() -> int:
+    """并发拉取活动页的上限"""
+    return max(int(os.getenv('CODEUP_ACTIVITY_PAGE_CONCURRENCY', '4')), 1)
+
+
+def oldest_epoch(data: List[ActivityRecord]) -> Optional[int]:
+    """页内最早活动的时间戳"""
+    timestamps = [activity.epoch for activity in data if activity.epoch is not None]
+    return min(timestamps) if timestamps else None
+
+
+class ActivityPager:
+    """
+    流水线式活动页异步迭代器
+
+    消费方处理第n页时，后台已预取第n+1页，隐藏一次上游往返延迟。
+    到达活动流末尾（空页或不满一页）时停止；请求失败时停止并设置 failed。
+    提前退出（break / aclose）会取消尚未使用的预取请求。
+
+    Example:
+        async with ActivityPager(fetch_page, prefetch_while=lambda page: ...) as pager:
+            async for data in pager:
+                ...
+    """
+
+    def __init__(self, fetch_page: FetchPage, per_page: int = PAGE_SIZE, start_page: int = 1,
+                 prefetch_while: Optional[Callable[[List[ActivityRecord]], bool]] = None):
+        """
+        Args:
+            fetch_page: 拉取单页的协程函数
+            per_page: 每页数量
+            start_page: 起始页码
+            prefetch_while: 根据刚拿到的页判断是否值得预取下一页（默认总是预取），
+                例如下一页必然早于截止时间时返回False，避免浪费一次上游请求
+        """
+        self.fetch_page = fetch_page
+        self.per_page = per_page
+        self.page = start_page
+        self.prefetch_while = prefetch_while
+        self.failed = False
+        self.requests = 0
+        self.prefetch_cancelled = 0
+        self._pending: Optional[asyncio.Task] = None
+        self._done = False
+
+    def __aiter__(self) -> "ActivityPager":
+        return self
+
+    async def __aenter__(self) -> "ActivityPager":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _request(self, page: int) -> asyncio.Task:
+        self.requests += 1
+        return asyncio.ensure_future(self.fetch_page(page, self.per_page))
+
+    async def __anext__(self) -> List[ActivityRecord]:
+        if self._done:
+            raise StopAsyncIteration
+
+        task, self._pending = self._pending or self._request(self.page), None
+        data = await task
+        if data is None:
+            self.failed = True
+            self._done = True
+            raise StopAsyncIteration
+        if not data:
+            self._done = True
+            raise StopAsyncIteration
+
+        self.page += 1
+        if len(data) < self.per_page:
+            self._done = True
+        elif self.prefetch_while is None or self.prefetch_while(data):
+            # 在消费方处理当前页的同时预取下一页
+            self._pending = self._request(self.page)
+        return data
+
+    async def aclose(self):
+        """停止迭代并取消未使用的预取请求"""
+        self._done = True
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            if not pending.done():
+                self.prefetch_cancelled += 1
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+
+
+class PageProber:
+    """带缓存的页探测器，同一页在一次定位过程中只请求一次"""
+
+    def __init__(self, fetch_page: FetchPage, per_page: int):
+        self.fetch_page = fetch_page
+        self.per_page = per_page
+        self.pages: Dict[int, List[ActivityRecord]] = {}
+        self.requests = 0
+
+    async def probe(self, page: int) -> Optional[List[ActivityRecord]]:
+        if page not in self.pages:
+            self.requests += 1
+            data = await self.fetch_page(page, self.per_page)
+            if data is None:
+                return None
+            self.pages[page] = data
+        return self.pages[page]
+
+    async def first_page_where(self, predicate: Callable[[List[ActivityRecord]], bool], known_false: int = 0) -> Optional[int]:
+        """
+        返回满足predicate的最小页码
+
+        活动流按时间倒序，predicate随页码单调（一旦满足，之后的页都满足），
+        因此先指数递增步长找到上界，再在区间内二分。
+
+        Args:
+            predicate: 页内容判定函数
+            known_false: 已知不满足predicate的页码（0表示未知）
+        """
+        lo, step = known_false, 1
+        hi = lo + step
+        while True:
+            data = await self.probe(hi)
+            if data is None:
+                return None
+            if predicate(data):
+                break
+            lo = hi
+            step *= 2
+            hi = lo + step
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            data = await self.probe(mid)
+            if data is None:
+                return None
+            if predicate(data):
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+
+async def fetch_activity_window(fetch_page: FetchPage, start_ts: float, end_ts: float,
+                                per_page: int = PAGE_SIZE,
+                                concurrency: Optional[int] = None) -> Optional[List[ActivityRecord]]:
+    """
+    获取 [start_ts, end_ts] 时间窗口内的全部活动
+
+    先用指数+二分探测定位覆盖窗口的首页和末页（O(log n)次请求），
+    再并发拉取两者之间尚未探测过的页。
+
+    Returns:
+        窗口内的活动（按时间倒序、按id去重），任一页请求失败时返回None
+    """
+    prober = PageProber(fetch_page, per_page)
+
+    def reaches_end(data: List[ActivityRecord]) -> bool:
+        oldest = oldest_epoch(data)
+        return not data or oldest is None or oldest <= end_ts
+
+    def reaches_start(data: List[ActivityRecord]) -> bool:
+        oldest = oldest_epoch(data)
+        return not data or len(data) < per_page or oldest is None or oldest < start_ts
+
+    first_page = await prober.first_page_where(reaches_end)
+    if first_page is None:
+        return None
+    last_page = await prober.first_page_where(reaches_start, known_false=first_page - 1)
+    if last_page is None:
+        return None
+
+    semaphore = asyncio.Semaphore(concurrency or page_concurrency())
+
+    async def fetch(page: int) -> Optional[List[ActivityRecord]]:
+        async with semaphore:
+            return await prober.probe(page)
+
+    missing = [page for page in range(first_page, last_page + 1) if page not in prober.pages]
+    results = await asyncio.gather(*(fetch(page) for page in missing))
+    if any(result is None for result in results):
+        return None
+
+    # 翻页期间有新活动插入时，页边界的活动可能重复出现
+    unique = {}
+    for page in range(first_page, last_page + 1):
+        for activity in prober.pages[page]:
+            unique.setdefault(activity.key, activity)
+
+    logger.debug(f"时间窗口定位到第 {first_page}-{last_page} 页，共请求 {prober.requests} 页")
+    return ActivityIndex(unique.values()).between(start_ts, end_ts)
@@ -0,0 +1,181 @@
+"""
+活动记录模块 - 精简的活动/提交记录、时间戳工具，以及按时间二分查找的活动索引
+"""
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Codeup返回的时间均为北京时间，未带时区的日期参数按此时区解释
+CODEUP_TZ = timezone(timedelta(hours=8))
+_TZ_OFFSET = 8 * 3600
+_DAY_SECONDS = 86400
+
+
+def codeup_now() -> datetime:
+    """当前北京时间（不带时区，与未带时区日期参数的解释一致，不受服务器时区影响）"""
+    return datetime.now(CODEUP_TZ).replace(tzinfo=None)
+
+
+def to_epoch(value: datetime) -> int:
+    """将datetime转为整数时间戳（秒），未带时区的按北京时间处理"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=CODEUP_TZ)
+    return int(value.timestamp())
+
+
+def epoch_day(epoch: int) -> int:
+    """时间戳所在的北京时间自然日编号（可直接比较和分桶）"""
+    return (epoch + _TZ_OFFSET) // _DAY_SECONDS
+
+
+def epoch_time_str(epoch: int) -> str:
+    """时间戳对应的北京时间时刻 HH:MM:SS"""
+    seconds = (epoch + _TZ_OFFSET) % _DAY_SECONDS
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _intern(value: Any) -> Any:
+    """驻留重复出现的短字符串（用户名、项目名、分支等），多条记录共享同一对象"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class CommitRecord:
+    """精简的提交记录（只保留接口和报告需要的字段）"""
+    id: str
+    message: str
+    author_name: Optional[str] = None
+    author_email: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, commit: Dict) -> "CommitRecord":
+        """从上游的 dataMap[':commits'] 条目构建"""
+        author = commit.get(':author') or {}
+        return cls(
+            id=commit.get(':id', ''),
+            message=commit.get(':message', ''),
+            author_name=_intern(author.get(':name')),
+            author_email=_intern(author.get(':email')),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为上游提交结构"""
+        return {
+            ':id': self.id,
+            ':message': self.message,
+            ':author': {':name': self.author_name, ':email': self.author_email},
+        }
+
+
+@dataclass(slots=True)
+class ActivityRecord:
+    """
+    精简的项目活动记录
+
+    拉取上游数据时构建：时间解析为带时区的整数时间戳，用户、项目、分支字符串驻留共享，
+    其余未使用的上游字段直接丢弃。to_dict() 还原为接口原有的响应结构。
+    """
+    id: Any
+    created_at: str
+    epoch: Optional[int]
+    action: Optional[int]
+    user_name: Optional[str]
+    member_name: Optional[str] = None
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+    ref: Optional[str] = None
+    commits: Tuple[CommitRecord, ...] = ()
+    note: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, activity: Dict) -> "ActivityRecord":
+        """从上游活动（或 to_dict 的输出）构建"""
+        created_at = activity.get('createdAt') or ''
+        user = activity.get('user') or {}
+        project = activity.get('project') or {}
+        data_map = activity.get('dataMap')
+        if not isinstance(data_map, dict):
+            data_map = {}
+        commits = data_map.get(':commits')
+        if not isinstance(commits, list):
+            commits = []
+        return cls(
+            id=activity.get('id'),
+            created_at=created_at,
+            epoch=to_epoch(datetime.fromisoformat(created_at)) if created_at else None,
+            action=activity.get('action'),
+            user_name=_intern(user.get('name')),
+            member_name=_intern(user.get('memberName')),
+            project_id=project.get('id'),
+            project_name=_intern(project.get('name')),
+            ref=_intern(data_map.get(':ref')) or None,
+            commits=tuple(CommitRecord.from_dict(commit) for commit in commits if isinstance(commit, dict)),
+            note=activity.get('note'),
+        )
+
+    @property
+    def key(self) -> str:
+        """活动的唯一标识（缺少id时退化为时间+用户）"""
+        if self.id is not None:
+            return str(self.id)
+        return f"{self.created_at}|{self.user_name or ''}"
+
+    @property
+    def branch(self) -> Optional[str]:
+        """活动所在分支（去掉refs/heads/前缀）"""
+        return self.ref.replace('refs/heads/', '') if self.ref else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为接口响应结构（id、createdAt、action、user、project、dataMap）"""
+        user = {'name': self.user_name}
+        if self.member_name is not None:
+            user['memberName'] = self.member_name
+        data_map: Dict[str, Any] = {':commits': [commit.to_dict() for commit in self.commits]}
+        if self.ref:
+            data_map[':ref'] = self.ref
+        activity = {
+            'id': self.id,
+            'createdAt': self.created_at,
+            'action': self.action,
+            'user': user,
+            'project': {'id': self.project_id, 'name': self.project_name},
+            'dataMap': data_map,
+        }
+        if self.note is not None:
+            activity['note'] = self.note
+        return activity
+
+
+def to_records(data: Iterable[Dict]) -> List[ActivityRecord]:
+    """将上游活动列表转换为精简记录"""
+    return [ActivityRecord.from_dict(activity) for activity in data if isinstance(activity, dict)]
+
+
+class ActivityIndex:
+    """
+    按时间排序的活动索引
+
+    时间保存为升序整数数组，时间区间切片为二分查找 O(log n)。
+    缺少时间的活动不进入索引。
+    """
+
+    __slots__ = ('epochs', 'activities')
+
+    def __init__(self, activities: Iterable[ActivityRecord]):
+        # 上游按时间倒序返回，逆序后稳定排序，使同一时间的活动在输出时保持原顺序
+        entries = [activity for activity in reversed(list(activities)) if activity.epoch is not None]
+        entries.sort(key=lambda activity: activity.epoch)
+        self.epochs = array('q', (activity.epoch for activity in entries))
+        self.activities = entries
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    def between(self, start_ts: float, end_ts: float) -> List[ActivityRecord]:
+        """返回 [start_ts, end_ts] 内的活动（按时间倒序）"""
+        lo = bisect_left(self.epochs, start_ts)
+        hi = bisect_right(self.epochs, end_ts)
+        return self.activities[lo:hi][::-1]
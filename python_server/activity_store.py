@@ -0,0 +1,338 @@
+"""
+项目活动本地存储模块 - 基于SQLite的增量同步
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from activity_records import ActivityRecord, to_epoch
+from activity_pages import PAGE_SIZE, ActivityPager, FetchPage, oldest_epoch
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    project_id   INTEGER NOT NULL,
+    activity_id  TEXT    NOT NULL,
+    created_ts   REAL    NOT NULL,
+    user_name    TEXT,
+    branch       TEXT,
+    payload      TEXT    NOT NULL,
+    PRIMARY KEY (project_id, activity_id)
+);
+CREATE INDEX IF NOT EXISTS idx_activities_project_ts ON activities (project_id, created_ts);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    project_id   INTEGER PRIMARY KEY,
+    covered_from REAL    NOT NULL,
+    newest_ts    REAL    NOT NULL,
+    synced_at    REAL    NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS coverage (
+    project_id   INTEGER NOT NULL,
+    from_ts      REAL    NOT NULL,
+    to_ts        REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_coverage_project ON coverage (project_id);
+"""
+
+
+class ActivityStore:
+    """
+    项目活动的本地持久化存储
+
+    Codeup的活动流只追加且按时间倒序返回，因此每个项目记录一段从最新活动
+    向前连续的头部覆盖范围 [covered_from, synced_at]，以及若干段历史覆盖区间：
+    - 增量同步从第1页开始拉取，遇到已知的最新活动即停止（稳态下只需1页）
+    - 历史时间窗口由调用方按窗口定位拉取后通过 add_range 写入
+    - 覆盖范围内的日期/用户/分支查询直接在本地完成
+
+    所有数据库读写都在一个专用线程中串行执行（不阻塞事件循环，也不会有两个事务交错使用同一连接）。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='activity-store')
+        # 只保留正在使用的项目锁（同步结束、没有等待者后自动释放）
+        self._locks: 'weakref.WeakValueDictionary[int, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    def close(self):
+        """关闭数据库连接和数据库线程"""
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """在数据库线程中执行同步的数据库操作"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args))
+
+    def _lock(self, project_id: int) -> asyncio.Lock:
+        lock = self._locks.get(project_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[project_id] = lock
+        return lock
+
+    def _get_state(self, project_id: int) -> Optional[Dict[str, float]]:
+        row = self._conn.execute(
+            "SELECT covered_from, newest_ts, synced_at FROM sync_state WHERE project_id = ?",
+            (project_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'covered_from': row[0], 'newest_ts': row[1], 'synced_at': row[2]}
+
+    def _save_state(self, project_id: int, covered_from: float, newest_ts: float, synced_at: float):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (project_id, covered_from, newest_ts, synced_at) VALUES (?, ?, ?, ?)",
+            (project_id, covered_from, newest_ts, synced_at)
+        )
+
+    def _known_ids(self, project_id: int, keys: List[str]) -> set:
+        if not keys:
+            return set()
+        placeholders = ','.join('?' * len(keys))
+        rows = self._conn.execute(
+            f"SELECT activity_id FROM activities WHERE project_id = ? AND activity_id IN ({placeholders})",
+            (project_id, *keys)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def _insert(self, project_id: int, activities: List[ActivityRecord]) -> int:
+        # payload只保存精简记录的序列化结果，不保存完整的上游JSON
+        rows = [
+            (project_id, activity.key, activity.epoch, activity.user_name, activity.branch,
+             json.dumps(activity.to_dict(), ensure_ascii=False, separators=(',', ':')))
+            for activity in activities if activity.epoch is not None
+        ]
+        cursor = self._conn.executemany(
+            "INSERT OR IGNORE INTO activities (project_id, activity_id, created_ts, user_name, branch, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return cursor.rowcount
+
+    async def sync(self, project_id: int, since: Optional[datetime], fetch_page: FetchPage) -> bool:
+        """
+        增量同步项目活动，保证 [since, 现在] 范围已在本地
+
+        Args:
+            project_id: 项目 ID
+            since: 需要覆盖到的最早时间，None表示只追上最新活动
+            fetch_page: 拉取上游活动页的协程函数 (page, per_page) -> 活动记录列表或None
+
+        Returns:
+            同步是否成功（失败时调用方应回退到直接请求上游）
+        """
+        target_ts = to_epoch(since) if since is not None else float('inf')
+        async with self._lock(project_id):
+            return await self._sync_locked(project_id, target_ts, fetch_page)
+
+    async def _sync_locked(self, project_id: int, target_ts: float, fetch_page: FetchPage) -> bool:
+        state = await self._run(self._get_state, project_id)
+        started_at = time.time()
+        caught_up = state is None  # 无历史状态时无需追赶头部
+        covered_from = state['covered_from'] if state else started_at
+        newest_ts = state['newest_ts'] if state else 0.0
+        reached_end = False
+
+        def needs_next_page(data: List[ActivityRecord]) -> bool:
+            """预取提示：本页仍未接上已知活动，或仍未到达需要覆盖的时间"""
+            oldest = oldest_epoch(data)
+            if oldest is None:
+                return False
+            if state is None:
+                return oldest > target_ts
+            if oldest > state['newest_ts']:
+                return True
+            return min(state['covered_from'], oldest) > target_ts
+
+        # 先拉取全部需要的页，不在 await 期间持有未提交的写入：
+        # 所有项目共用一个连接，跨 await 的事务会被其他项目的提交或回滚波及
+        pages: List[List[ActivityRecord]] = []
+        async with ActivityPager(fetch_page, PAGE_SIZE, prefetch_while=needs_next_page) as pager:
+            async for data in pager:
+                pages.append(data)
+                known = await self._run(self._known_ids, project_id, [activity.key for activity in data])
+
+                timestamps = [activity.epoch for activity in data if activity.epoch is not None]
+                if timestamps:
+                    newest_ts = max(newest_ts, max(timestamps))
+                oldest_on_page = min(timestamps) if timestamps else covered_from
+
+                if not caught_up and (known or oldest_on_page <= state['newest_ts']):
+                    # 已接上上次同步的位置，新增活动全部入库
+                    caught_up = True
+
+                if caught_up:
+                    if state is None or oldest_on_page < covered_from:
+                        covered_from = oldest_on_page
+                    if covered_from <= target_ts:
+                        break
+            else:
+                # 迭代自然结束：到达活动流末尾或请求失败
+                reached_end = not pager.failed
+
+        if pager.failed:
+            # 本次未写入任何数据，覆盖范围保持不变
+            logger.warning(f"项目 {project_id} 活动同步失败（第 {pager.page} 页）")
+            return False
+        if reached_end:
+            # 已到达活动流末尾，全部历史均已覆盖
+            covered_from = 0.0
+
+        inserted = await self._run(self._write_pages, project_id, pages, covered_from, newest_ts, started_at)
+        logger.debug(f"项目 {project_id} 活动同步完成: 请求 {pager.requests} 页，新增 {inserted} 条"
+                     f"，取消预取 {pager.prefetch_cancelled} 次")
+        return True
+
+    def _write_pages(self, project_id: int, pages: List[List[ActivityRecord]], covered_from: float,
+                     newest_ts: float, synced_at: float) -> int:
+        # 活动与覆盖范围在同一个事务中写入，失败时只回滚本次写入
+        inserted = 0
+        with self._conn:
+            for data in pages:
+                inserted += self._insert(project_id, data)
+            self._save_state(project_id, covered_from, newest_ts, synced_at)
+        return inserted
+
+    async def head_covered_from(self, project_id: int) -> Optional[float]:
+        """头部覆盖范围的起点（未同步过时返回None）"""
+        return await self._run(self._head_covered_from, project_id)
+
+    def _head_covered_from(self, project_id: int) -> Optional[float]:
+        state = self._get_state(project_id)
+        return state['covered_from'] if state else None
+
+    async def is_covered(self, project_id: int, start_ts: float, end_ts: float) -> bool:
+        """检查时间窗口是否已完整保存在本地"""
+        return await self._run(self._is_covered, project_id, start_ts, end_ts)
+
+    def _is_covered(self, project_id: int, start_ts: float, end_ts: float) -> bool:
+        covered_from = self._head_covered_from(project_id)
+        if covered_from is not None and start_ts >= covered_from:
+            return True
+        row = self._conn.execute(
+            "SELECT 1 FROM coverage WHERE project_id = ? AND from_ts <= ? AND to_ts >= ? LIMIT 1",
+            (project_id, start_ts, end_ts)
+        ).fetchone()
+        return row is not None
+
+    async def add_range(self, project_id: int, activities: List[ActivityRecord], from_ts: float, to_ts: float):
+        """
+        写入一段完整拉取的历史时间窗口，并合并覆盖区间
+
+        与头部覆盖范围相接的区间会直接并入头部。
+        """
+        await self._run(self._add_range, project_id, activities, from_ts, to_ts)
+
+    def _add_range(self, project_id: int, activities: List[ActivityRecord], from_ts: float, to_ts: float):
+        with self._conn:
+            self._write_range(project_id, activities, from_ts, to_ts)
+
+    def _write_range(self, project_id: int, activities: List[ActivityRecord], from_ts: float, to_ts: float):
+        self._insert(project_id, activities)
+
+        rows = self._conn.execute(
+            "SELECT from_ts, to_ts FROM coverage WHERE project_id = ? AND to_ts >= ? AND from_ts <= ?",
+            (project_id, from_ts, to_ts)
+        ).fetchall()
+        for row_from, row_to in rows:
+            from_ts, to_ts = min(from_ts, row_from), max(to_ts, row_to)
+        self._conn.execute(
+            "DELETE FROM coverage WHERE project_id = ? AND to_ts >= ? AND from_ts <= ?",
+            (project_id, from_ts, to_ts)
+        )
+
+        state = self._get_state(project_id)
+        if state and to_ts >= state['covered_from']:
+            self._save_state(project_id, min(from_ts, state['covered_from']), state['newest_ts'], state['synced_at'])
+        else:
+            self._conn.execute(
+                "INSERT INTO coverage (project_id, from_ts, to_ts) VALUES (?, ?, ?)",
+                (project_id, from_ts, to_ts)
+            )
+
+    async def query(self, project_id: int, start_date: datetime, end_date: datetime,
+                    user_name: Optional[str] = None, branch: Optional[str] = None) -> List[ActivityRecord]:
+        """
+        查询本地活动（按时间倒序）
+
+        Args:
+            project_id: 项目 ID
+            start_date: 开始时间
+            end_date: 结束时间
+            user_name: 只返回该用户的活动
+            branch: 只返回该分支的活动
+        """
+        return await self._run(self._query, project_id, start_date, end_date, user_name, branch)
+
+    def _query(self, project_id: int, start_date: datetime, end_date: datetime,
+               user_name: Optional[str], branch: Optional[str]) -> List[ActivityRecord]:
+        sql = ("SELECT payload FROM activities WHERE project_id = ? AND created_ts >= ? AND created_ts <= ?")
+        params: List[Any] = [project_id, to_epoch(start_date), to_epoch(end_date)]
+        if user_name:
+            sql += " AND user_name = ?"
+            params.append(user_name)
+        if branch:
+            sql += " AND branch = ?"
+            params.append(branch)
+        sql += " ORDER BY created_ts DESC"
+        return [ActivityRecord.from_dict(json.loads(row[0])) for row in self._conn.execute(sql, params)]
+
+    async def stats(self) -> Dict[str, Any]:
+        """返回存储统计信息"""
+        return await self._run(self._stats)
+
+    def _stats(self) -> Dict[str, Any]:
+        activities = self._conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+        projects = self._conn.execute("SELECT COUNT(*) FROM sync_state").fetchone()[0]
+        ranges = self._conn.execute("SELECT COUNT(*) FROM coverage").fetchone()[0]
+        return {'db_path': self.db_path, 'projects': projects, 'activities': activities, 'history_ranges': ranges}
+
+
+# 进程级共享的活动存储实例（按需创建）
+_activity_store: Optional[ActivityStore] = None
+
+
+def get_activity_store() -> Optional[ActivityStore]:
+    """
+    获取活动存储实例
+
+    环境变量:
+        CODEUP_ACTIVITY_STORE: 是否启用本地活动存储（默认true）
+        CODEUP_ACTIVITY_DB: SQLite数据库路径（默认data/activities.db）
+    """
+    global _activity_store
+    if os.getenv('CODEUP_ACTIVITY_STORE', 'true').lower() != 'true':
+        return None
+    if _activity_store is None:
+        _activity_store = ActivityStore(os.getenv('CODEUP_ACTIVITY_DB', 'data/activities.db'))
+    return _activity_store
+
+
+def close_activity_store():
+    """关闭活动存储（应用关闭时调用）"""
+    global _activity_store
+    if _activity_store is not None:
+        _activity_store.close()
+        _activity_store = None
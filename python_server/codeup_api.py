@@ -1,18 +1,34 @@
-from fastapi import FastAPI, HTTPException, Header, Query, Path
+from fastapi import FastAPI, HTTPException, Header, Query, Path, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from typing import Optional
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 import uvicorn
-import json
 import asyncio
 import os
 
 # 导入分离的模块
 from models import *
 from utils import *
-from dify_client import dify_client
-from codeup_client import CodeupClient, AuthenticationError, UserInfo
+from dify_client import dify_client, close_dify_http_client
+from codeup_client import (
+    AsyncCodeupClient, AuthenticationError, UserInfo, UserInfoUnavailableError,
+    get_async_http_client, close_async_http_client
+)
+from metadata_cache import metadata_cache
+from activity_store import get_activity_store, close_activity_store
+from singleflight import codeup_singleflight
+from activity_records import codeup_now
+from commit_scrubber import commit_scrubber
+from sse_streams import resumable_streams, stream_stats
+from report_hub import report_hub, report_key
+from report_cache import get_report_cache, close_report_cache
+from report_pipeline import report_pipeline
+from report_service import report_events, report_time_range
+from report_jobs import report_jobs, ReportJobQueueFullError, owner_id
+from dify_dispatcher import dify_dispatcher, DifySaturatedError, INTERACTIVE, REPORT
+from report_scheduler import report_scheduler
 from logger_config import setup_logger, INFO, DEBUG, WARNING
 
 # 配置日志
@@ -25,12 +41,30 @@ logger = setup_logger(
     filter_libs=True
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时建立共享连接池，关闭时释放（接口只使用异步客户端，同步连接池仅供脚本按需创建）"""
+    get_async_http_client()
+    logger.info("🔌 Codeup共享HTTP连接池已初始化")
+    report_scheduler.start()
+    yield
+    await report_scheduler.close()
+    await close_async_http_client()
+    resumable_streams.close()
+    report_jobs.close()
+    await close_dify_http_client()
+    close_activity_store()
+    close_report_cache()
+    logger.info("🔌 Codeup共享HTTP连接池已关闭")
+
+
 app = FastAPI(
     title="Codeup API v1",
     description="阿里云Codeup代码仓库API服务 - 重构版",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -95,6 +129,23 @@ async def general_exception_handler(request, exc):
         status_code=500
     )
 
+def dify_saturated_response(e: DifySaturatedError):
+    """Dify调用饱和时的429响应"""
+    response = create_error_response(str(e), "DIFY_SATURATED", status_code=429)
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def dify_saturated_stream(e: DifySaturatedError):
+    """Dify调用饱和时的SSE响应（EventSource不读取非200响应体，以error事件告知前端）"""
+    async def saturated_stream():
+        yield format_sse({'type': 'error', 'message': str(e), 'retry_after': e.retry_after})
+    
+    return StreamingResponse(
+        saturated_stream(),
+        media_type="text/event-stream",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 # ===== API端点 =====
 
 @app.get("/", response_model=SuccessResponse)
@@ -109,11 +160,17 @@ async def root():
             "docs": "/docs",
             "auth": "/api/v1/auth",
             "users": "/api/v1/users",
+            "my_activities": "/api/v1/users/me/activities",
             "projects": "/api/v1/projects",
             "ai_reports": "/api/v1/projects/{project_id}/reports/ai-generate",
             "ai_reports_stream": "/api/v1/projects/{project_id}/reports/ai-generate-stream",
+            "ai_report_jobs": "/api/v1/projects/{project_id}/reports/jobs",
+            "ai_report_job": "/api/v1/reports/jobs/{job_id}",
+            "ai_report_schedule": "/api/v1/reports/schedule",
             "ai_chat": "/api/v1/ai/chat",
-            "ai_chat_stream": "/api/v1/ai/chat-stream"
+            "ai_chat_stream": "/api/v1/ai/chat-stream",
+            "metrics": "/api/v1/metrics",
+            "cache": "/api/v1/cache"
         }
     }, "欢迎使用Codeup API v1")
 
@@ -126,6 +183,46 @@ async def health_check():
         "version": "1.0.0"
     }, "服务运行正常")
 
+@app.get("/api/v1/metrics", response_model=SuccessResponse)
+async def get_metrics(cookies: str = Header(..., alias="X-Codeup-Cookies")):
+    """运行指标（缓存命中率等），用于调优；需要有效的登录凭证"""
+    client = get_client_from_cookies(cookies)
+    try:
+        user_info = await client.get_user_info(cached=True)
+    except AuthenticationError as e:
+        raise HTTPException(status_code=401, detail=f"认证失败: {str(e)}")
+    if not user_info:
+        raise HTTPException(status_code=401, detail="认证失败: 无法验证登录凭证")
+    
+    activity_store = get_activity_store()
+    report_cache = get_report_cache()
+    return create_success_response({
+        "codeup_cache": metadata_cache.stats(),
+        "activity_store": await activity_store.stats() if activity_store else None,
+        "codeup_singleflight": codeup_singleflight.stats(),
+        "commit_scrubber": commit_scrubber.stats(),
+        "ai_streams": dict(stream_stats.stats(), resumable=resumable_streams.stats()),
+        "report_hub": report_hub.stats(),
+        "report_cache": report_cache.stats() if report_cache else None,
+        "report_pipeline": report_pipeline.stats(),
+        "report_jobs": report_jobs.stats(),
+        "report_scheduler": report_scheduler.stats(),
+        "dify_dispatcher": dify_dispatcher.stats()
+    }, "获取运行指标成功")
+
+@app.delete("/api/v1/cache", response_model=SuccessResponse)
+async def invalidate_cache(
+    endpoint: Optional[str] = Query(None, description="只清除指定接口的缓存：user_info、project_counts、authorized_projects、project_overview"),
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """清除当前用户的Codeup元数据缓存"""
+    client = get_client_from_cookies(cookies)
+    removed = client.invalidate_cache(endpoint)
+    return create_success_response({
+        "removed": removed,
+        "endpoint": endpoint
+    }, f"已清除{removed}条缓存")
+
 # ===== 认证相关接口 =====
 
 
@@ -150,8 +247,10 @@ async def login_with_cookies(request: CookieAuthRequest):
             )
         
         # 使用提取的login_ticket创建客户端并验证
-        client = CodeupClient(login_ticket)
-        user_info = client.get_user_info()
+        # 重新登录时丢弃该凭证下的旧缓存，确保凭证被真实校验
+        client = AsyncCodeupClient(login_ticket)
+        client.invalidate_cache()
+        user_info = await client.get_user_info()
         
         if user_info:
             # 保存客户端实例
@@ -186,7 +285,7 @@ async def get_current_user(cookies: str = Header(..., alias="X-Codeup-Cookies"))
     """获取当前用户信息"""
     try:
         client = get_client_from_cookies(cookies)
-        user_info = client.get_user_info()
+        user_info = await client.get_user_info()
         
         if user_info:
             return create_success_response({
@@ -206,6 +305,64 @@ async def get_current_user(cookies: str = Header(..., alias="X-Codeup-Cookies"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取用户信息失败: {str(e)}")
 
+@app.get("/api/v1/users/me/activities", response_model=SuccessResponse)
+async def get_my_activities(
+    time_range: str = Query("week", description="时间范围：today、week、month"),
+    start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)，与end_date一起指定时优先于time_range"),
+    end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
+    per_project: int = Query(100, ge=1, le=500, description="每个项目最多返回的活动数"),
+    max_projects: Optional[int] = Query(None, ge=1, description="最多扫描的近期活跃项目数"),
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """
+    获取当前用户跨项目的活动
+    
+    按最近活动时间只扫描时间范围内有活动的项目，并发获取各项目中当前用户的活动，按时间倒序合并返回。
+    活动结构与单项目活动接口相同（含所属项目），可作为跨项目AI报告的数据源。
+    """
+    try:
+        client = get_client_from_cookies(cookies)
+        if start_date and end_date:
+            try:
+                start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+                end_dt = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+            except ValueError:
+                return create_error_response(
+                    "日期格式错误，应为 YYYY-MM-DD",
+                    "INVALID_DATE_FORMAT",
+                    status_code=400
+                )
+            period = "custom"
+        else:
+            start_dt, end_dt, _ = report_time_range(client, time_range)
+            period = time_range if time_range in ("today", "month") else "week"
+        
+        result = await client.get_my_activities(
+            start_date=start_dt,
+            end_date=end_dt,
+            per_project=per_project,
+            max_projects=max_projects
+        )
+        
+        return create_success_response({
+            "activities": result['activities'],
+            "projects": result['projects'],
+            "scanned_projects": result['scanned_projects'],
+            "failed_projects": result['failed_projects'],
+            "filters": {
+                "date_range": result['date_range'],
+                "period": period
+            }
+        }, f"获取跨项目活动成功，{len(result['projects'])}个项目共{len(result['activities'])}条记录")
+        
+    except AuthenticationError as e:
+        raise HTTPException(status_code=401, detail=f"认证失败: {str(e)}")
+    except UserInfoUnavailableError as e:
+        # 无法确认当前用户时拒绝请求，不退化为返回所有人的活动
+        raise HTTPException(status_code=401, detail=f"获取跨项目活动失败: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取跨项目活动失败: {str(e)}")
+
 # ===== 项目相关接口 =====
 
 @app.get("/api/v1/projects/stats", response_model=SuccessResponse)
@@ -217,7 +374,7 @@ async def get_project_statistics(
     """获取项目统计信息"""
     try:
         client = get_client_from_cookies(cookies)
-        stats = client.get_project_counts(search=search, archived=archived)
+        stats = await client.get_project_counts(search=search, archived=archived)
         
         return create_success_response({
             "total": stats.get('all', 0),
@@ -247,9 +404,12 @@ async def get_projects(
     try:
         client = get_client_from_cookies(cookies)
         
+        failed_pages = []
         if all_pages:
-            # 获取所有项目
-            projects = client.get_all_projects(archived=archived, search=search)
+            # 并发获取所有项目
+            detail = await client.get_all_projects_detail(archived=archived, search=search)
+            projects = detail['projects']
+            failed_pages = detail['failed_pages']
             total = len(projects)
             pagination = PaginationInfo(
                 page=1,
@@ -258,15 +418,16 @@ async def get_projects(
                 total_pages=1
             )
         else:
-            # 获取指定页的项目
-            projects = client.get_authorized_projects(
-                page=page, 
-                per_page=per_page, 
-                archived=archived,
-                search=search
+            # 并发获取指定页的项目与总数（用于分页计算）
+            projects, stats = await asyncio.gather(
+                client.get_authorized_projects(
+                    page=page, 
+                    per_page=per_page, 
+                    archived=archived,
+                    search=search
+                ),
+                client.get_project_counts(search=search, archived=archived)
             )
-            # 获取总数用于分页计算
-            stats = client.get_project_counts(search=search, archived=archived)
             total = stats.get('authorized', 0)
             total_pages = (total + per_page - 1) // per_page
             
@@ -284,8 +445,9 @@ async def get_projects(
                 "search": search,
                 "archived": archived,
                 "all_pages": all_pages
-            }
-        }, f"获取项目列表成功，共{len(projects or [])}个项目")
+            },
+            "failed_pages": failed_pages
+        }, f"获取项目列表成功，共{len(projects or [])}个项目" + (f"（{len(failed_pages)}页获取失败）" if failed_pages else ""))
         
     except AuthenticationError as e:
         raise HTTPException(status_code=401, detail=f"认证失败: {str(e)}")
@@ -301,7 +463,7 @@ async def get_project_overview(
     """获取项目概览信息"""
     try:
         client = get_client_from_cookies(cookies)
-        overview = client.get_project_overview(project_id, revision=revision)
+        overview = await client.get_project_overview(project_id, revision=revision)
         
         if overview:
             return create_success_response({
@@ -327,12 +489,14 @@ async def get_project_activities(
     per_page: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
+    branch: Optional[str] = Query(None, description="分支名（不含refs/heads/）"),
+    include_overview: bool = Query(True, description="是否返回项目概览（提交总数），不需要时可跳过以减少上游请求"),
     cookies: str = Header(..., alias="X-Codeup-Cookies")
 ):
     """
     获取项目活动记录
     
-    支持日期范围筛选和用户过滤
+    支持日期范围、分支筛选和用户过滤
     """
     try:
         # 验证日期格式
@@ -360,13 +524,15 @@ async def get_project_activities(
                 )
         
         client = get_client_from_cookies(cookies)
-        result = client.get_project_activities(
+        result = await client.get_project_activities(
             project_id=project_id,
             page=page,
             per_page=per_page,
             start_date=start_dt,
             end_date=end_dt,
-            filter_by_user=True
+            filter_by_user=True,
+            branch=branch,
+            include_overview=include_overview
         )
         
         return create_success_response({
@@ -388,31 +554,36 @@ async def get_project_activities(
 @app.get("/api/v1/projects/{project_id}/activities/today", response_model=SuccessResponse)
 async def get_today_activities(
     project_id: int = Path(..., description="项目ID"),
+    include_overview: bool = Query(True, description="是否返回项目概览"),
     cookies: str = Header(..., alias="X-Codeup-Cookies")
 ):
     """获取今日项目活动"""
     
-    today = datetime.now().strftime('%Y-%m-%d')
+    today = codeup_now().strftime('%Y-%m-%d')
     return await get_project_activities(
         project_id=project_id,
         page=1,
         per_page=50,
         start_date=today,
         end_date=today,
+        branch=None,
+        include_overview=include_overview,
         cookies=cookies
     )
 
 @app.get("/api/v1/projects/{project_id}/activities/week", response_model=SuccessResponse)
 async def get_week_activities(
     project_id: int = Path(..., description="项目ID"),
+    include_overview: bool = Query(True, description="是否返回项目概览"),
     cookies: str = Header(..., alias="X-Codeup-Cookies")
 ):
     """获取本周项目活动"""
     try:
         client = get_client_from_cookies(cookies)
-        result = client.get_week_activities(
+        result = await client.get_week_activities(
             project_id=project_id,
-            filter_by_user=True
+            filter_by_user=True,
+            include_overview=include_overview
         )
         
         return create_success_response({
@@ -434,27 +605,18 @@ async def get_week_activities(
 @app.get("/api/v1/projects/{project_id}/activities/month", response_model=SuccessResponse)
 async def get_month_activities(
     project_id: int = Path(..., description="项目ID"),
+    include_overview: bool = Query(True, description="是否返回项目概览"),
     cookies: str = Header(..., alias="X-Codeup-Cookies")
 ):
     """获取本月项目活动"""
     try:
         client = get_client_from_cookies(cookies)
-        today = datetime.now()
-        start_dt = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        start_dt, end_dt = client.month_range()
         
-        # 计算下个月第一天
-        if today.month == 12:
-            end_dt = today.replace(year=today.year+1, month=1, day=1)
-        else:
-            end_dt = today.replace(month=today.month+1, day=1)
-        end_dt = end_dt - timedelta(seconds=1)  # 本月最后一秒
-        
-        result = client.get_project_activities(
+        result = await client.get_month_activities(
             project_id=project_id,
-            start_date=start_dt,
-            end_date=end_dt,
-            per_page=100,
-            filter_by_user=True
+            filter_by_user=True,
+            include_overview=include_overview
         )
         
         return create_success_response({
@@ -490,46 +652,45 @@ async def generate_ai_report(
     支持多种报告类型：活动总结、代码审查、进度报告
     """
     try:
-        # 直接使用Dify API，参考test_ai_report.py的成功实现
-        import requests
-        import os
-        
-        dify_url = os.getenv("DIFY_BASE_URL", "https://dify.hetunai.cn/v1") + "/chat-messages"
-        api_key = os.getenv("DIFY_API_KEY")
-        
-        if not api_key:
-            raise HTTPException(status_code=500, detail="DIFY_API_KEY环境变量未设置")
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
         # 直接使用前端传过来的数据构建prompt
         additional_context = request_body.get('additional_context', '')
 
         # 阻塞式请求数据
-        test_data = {
-            "inputs": {},
-            "query": additional_context,
-            "response_mode": "blocking",
-            "conversation_id": "",
-            "user": request_body.get('user', 'frontend_user'),
-            "files": [],
-            "auto_generate_name": False
-        }
+        dify_request = DifyRequest(
+            query=additional_context,
+            inputs={},
+            response_mode="blocking",
+            user=request_body.get('user', 'frontend_user'),
+            conversation_id="",
+            files=None,
+            auto_generate_name=False
+        )
         
-        logger.info(f"🤖 调用Dify API生成项目 {project_id} 的AI报告")
+        report_type = request_body.get('report_type', 'activity_summary')
+        time_range = request_body.get('time_range', 'custom')
         
-        response = requests.post(dify_url, json=test_data, headers=headers, timeout=60)
-        response.raise_for_status()
+        # 提示词由前端构建，以提示词本身作为报告内容键
+        key = report_key(project_id, report_type, time_range, '', [], prompt=additional_context)
+        report_cache = get_report_cache()
+        refresh = bool(request_body.get('refresh', False))
+        if report_cache and refresh:
+            report_cache.bypass()
+        cached_answer = report_cache.get(key) if report_cache and not refresh else None
         
-        result = response.json()
+        if cached_answer is not None:
+            logger.info(f"📦 命中项目 {project_id} 的AI报告缓存")
+            result = {'answer': cached_answer, 'cached': True}
+        else:
+            logger.info(f"🤖 调用Dify API生成项目 {project_id} 的AI报告")
+            result = await dify_client.create_blocking_response(
+                dify_request, REPORT, owner_id(extract_login_ticket_from_cookies(cookies) or cookies))
+            if report_cache:
+                report_cache.put(key, result.get('answer', ''), project_id, report_type)
         
         return create_success_response({
             "project_id": project_id,
-            "report_type": request_body.get('report_type', 'activity_summary'),
-            "time_range": request_body.get('time_range', 'custom'), 
+            "report_type": report_type,
+            "time_range": time_range, 
             "answer": result.get('answer', ''),
             "ai_response": result,
             "request_info": {
@@ -537,6 +698,9 @@ async def generate_ai_report(
                 "user": request_body.get('user', 'frontend_user')
             }
         }, f"项目 {project_id} AI报告生成成功")
+    
+    except DifySaturatedError as e:
+        return dify_saturated_response(e)
             
     except Exception as e:
         logger.error(f"AI报告生成失败: {str(e)}", exc_info=True)
@@ -563,7 +727,7 @@ async def ai_chat(chat_request: AIReportRequest):
         )
         
         # 调用Dify API - 阻塞响应
-        response_data = dify_client.create_blocking_response(dify_request)
+        response_data = await dify_client.create_blocking_response(dify_request)
         
         return create_success_response({
             "ai_response": response_data,
@@ -572,6 +736,9 @@ async def ai_chat(chat_request: AIReportRequest):
                 "user": chat_request.user
             }
         }, "AI对话成功")
+    
+    except DifySaturatedError as e:
+        return dify_saturated_response(e)
             
     except Exception as e:
         logger.error(f"AI对话失败: {str(e)}", exc_info=True)
@@ -579,21 +746,26 @@ async def ai_chat(chat_request: AIReportRequest):
 
 @app.get("/api/v1/projects/{project_id}/reports/ai-generate-stream")
 async def generate_ai_report_stream(
+    http_request: Request,
     project_id: int = Path(..., description="项目ID"),
     report_type: str = Query("activity_summary", description="报告类型"),
     time_range: str = Query("week", description="时间范围"),
     additional_context: str = Query("", description="额外上下文"),
     user: str = Query("frontend_user", description="用户标识"),
+    refresh: bool = Query(False, description="跳过AI报告缓存，重新生成"),
     cookies: Optional[str] = Query(None, alias="X-Codeup-Cookies", description="认证Cookies")
 ):
     """
     AI生成项目报告 - 流式响应
+    
+    活动数据在流内获取；事件带id，断线后EventSource携带Last-Event-ID重连会回放错过的内容并接上原生成，
+    宽限期内没有重连时取消尚未完成的Codeup请求和Dify生成
     """
     try:
         # 验证认证
         if not cookies:
             async def auth_error_stream():
-                yield f"data: {json.dumps({'type': 'error', 'message': '缺少认证信息'}, ensure_ascii=False)}\n\n"
+                yield format_sse({'type': 'error', 'message': '缺少认证信息'})
             
             return StreamingResponse(
                 auth_error_stream(),
@@ -601,147 +773,192 @@ async def generate_ai_report_stream(
             )
         
         client = get_client_from_cookies(cookies)
-        
-        # 构建请求对象
-        request = AIReportRequest(
-            project_id=project_id,
-            report_type=report_type,
-            time_range=time_range,
-            additional_context=additional_context,
-            response_mode="streaming",
-            user=user,
-            start_date=None,
-            end_date=None,
-            conversation_id=""
-        )
-        
-        # 获取项目信息
-        projects = client.get_authorized_projects(per_page=100)
-        project_info = None
-        for project in projects:
-            if project.get('id') == project_id:
-                project_info = project
-                break
-        
-        if not project_info:
-            async def error_stream():
-                yield f"data: {json.dumps({'type': 'error', 'message': f'项目 {project_id} 未找到或无权限访问'}, ensure_ascii=False)}\n\n"
-            
-            return StreamingResponse(
-                error_stream(),
-                media_type="text/event-stream"
-            )
-        
-        project_name = project_info.get('name', f'Project-{project_id}')
-        
-        # 根据时间范围获取活动数据
-        activities_data = []
-        time_range_desc = ""
-        
-        if request.time_range == "today":
-            today = datetime.now().strftime('%Y-%m-%d')
-            start_dt = datetime.strptime(today, '%Y-%m-%d')
-            end_dt = start_dt.replace(hour=23, minute=59, second=59)
-            time_range_desc = "今日"
-        elif request.time_range == "week":
-            result = client.get_week_activities(project_id=project_id, filter_by_user=True)
-            activities_data = result.get('activities', [])
-            time_range_desc = "本周"
-        elif request.time_range == "month":
-            today = datetime.now()
-            start_dt = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if today.month == 12:
-                end_dt = today.replace(year=today.year+1, month=1, day=1)
-            else:
-                end_dt = today.replace(month=today.month+1, day=1)
-            end_dt = end_dt - timedelta(seconds=1)
-            time_range_desc = "本月"
-        else:
-            # 默认使用本周数据
-            result = client.get_week_activities(project_id=project_id, filter_by_user=True)
-            activities_data = result.get('activities', [])
-            time_range_desc = "本周"
-        
-        # 如果不是从week活动获取的数据，需要手动获取
-        if not activities_data and request.time_range != "week":
-            result = client.get_project_activities(
-                project_id=project_id,
-                start_date=start_dt if 'start_dt' in locals() else None,
-                end_date=end_dt if 'end_dt' in locals() else None,
-                per_page=100,
-                filter_by_user=True
-            )
-            activities_data = result.get('activities', [])
-        
-        # 生成AI报告提示词
-        prompt = dify_client.generate_report_prompt(
-            report_type=request.report_type,
-            activities_data=activities_data,
-            project_name=project_name,
-            time_range_desc=time_range_desc,
-            additional_context=request.additional_context
-        )
-        
-        # 构建Dify请求
-        dify_request = DifyRequest(
-            query=prompt,
-            inputs={
-                "project_name": project_name,
-                "project_id": str(project_id),
-                "report_type": request.report_type,
-                "time_range": time_range_desc,
-                "activities_count": len(activities_data)
-            },
-            response_mode="streaming",
-            user=request.user,
-            conversation_id=None,
-            files=None,
-            auto_generate_name=True,
-            workflow_id=None,
-            trace_id=None
-        )
-        
-        # 调用Dify API - 流式响应
-        return StreamingResponse(
-            dify_client.create_streaming_response(dify_request),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
-        
-    except AuthenticationError as e:
-        async def auth_error_stream():
-            yield f"data: {json.dumps({'type': 'error', 'message': f'认证失败: {str(e)}'}, ensure_ascii=False)}\n\n"
-        
-        return StreamingResponse(
-            auth_error_stream(),
-            media_type="text/event-stream"
-        )
-        
     except Exception as e:
         logger.error(f"AI报告生成失败: {str(e)}", exc_info=True)
         error_msg = str(e)
         
         async def general_error_stream():
-            yield f"data: {json.dumps({'type': 'error', 'message': f'服务器错误: {error_msg}'}, ensure_ascii=False)}\n\n"
+            yield format_sse({'type': 'error', 'message': f'服务器错误: {error_msg}'})
         
         return StreamingResponse(
             general_error_stream(),
             media_type="text/event-stream"
         )
+    
+    owner = owner_id(client.login_ticket)
+    if not http_request.headers.get('last-event-id'):
+        # 新请求在排队已满时快速拒绝（续传的请求接上已有的生成，不做准入检查）
+        try:
+            dify_dispatcher.admit(REPORT, owner)
+        except DifySaturatedError as e:
+            return dify_saturated_stream(e)
+    
+    def start_report():
+        return report_events(client, project_id, report_type, time_range, additional_context, user, refresh,
+                             owner=owner)
+    
+    return StreamingResponse(
+        sse_stream_with_ids(resumable_streams.open(http_request, start_report, f"项目 {project_id} 的AI报告")),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+# ===== AI报告任务接口 =====
+
+@app.post("/api/v1/projects/{project_id}/reports/jobs", response_model=SuccessResponse)
+async def submit_ai_report_job(
+    request_body: dict,
+    project_id: int = Path(..., description="项目ID"),
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """
+    提交AI报告任务
+    
+    立即返回任务ID，报告在后台生成；通过任务查询接口轮询，或订阅任务事件流获取进度和结果。
+    相同参数且未结束的任务会直接返回已有任务。
+    """
+    client = get_client_from_cookies(cookies)
+    try:
+        job, created = report_jobs.submit(
+            client,
+            project_id,
+            report_type=request_body.get('report_type', 'activity_summary'),
+            time_range=request_body.get('time_range', 'week'),
+            additional_context=request_body.get('additional_context', ''),
+            user=request_body.get('user', 'frontend_user'),
+            refresh=bool(request_body.get('refresh', False))
+        )
+    except ReportJobQueueFullError as e:
+        response = create_error_response(str(e), "REPORT_JOB_QUEUE_FULL", status_code=429)
+        response.headers["Retry-After"] = "30"
+        return response
+    
+    return create_success_response(
+        dict(job.to_dict(report_jobs.queue_position(job)), deduplicated=not created),
+        "报告任务已提交" if created else "已有相同的报告任务在进行中"
+    )
+
+@app.get("/api/v1/reports/jobs/{job_id}", response_model=SuccessResponse)
+async def get_ai_report_job(
+    job_id: str = Path(..., description="任务ID"),
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """查询AI报告任务的状态、进度和结果"""
+    client = get_client_from_cookies(cookies)
+    job = report_jobs.get(job_id, client.login_ticket)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"报告任务 {job_id} 不存在或已过期")
+    return create_success_response(job.to_dict(report_jobs.queue_position(job)), "获取报告任务成功")
+
+@app.delete("/api/v1/reports/jobs/{job_id}", response_model=SuccessResponse)
+async def cancel_ai_report_job(
+    job_id: str = Path(..., description="任务ID"),
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """取消未结束的AI报告任务"""
+    client = get_client_from_cookies(cookies)
+    job = report_jobs.get(job_id, client.login_ticket)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"报告任务 {job_id} 不存在或已过期")
+    cancelled = report_jobs.cancel(job)
+    return create_success_response({"job_id": job_id, "cancelled": cancelled},
+                                   "报告任务已取消" if cancelled else "报告任务已结束")
+
+@app.get("/api/v1/reports/jobs/{job_id}/events")
+async def stream_ai_report_job(
+    http_request: Request,
+    job_id: str = Path(..., description="任务ID"),
+    cookies: Optional[str] = Query(None, alias="X-Codeup-Cookies", description="认证Cookies")
+):
+    """
+    订阅AI报告任务的事件流（SSE）
+    
+    先回放任务已产生的事件再接收实时事件，事件格式与流式报告接口相同；支持Last-Event-ID续传。
+    订阅断开不影响任务继续执行。
+    """
+    login_ticket = extract_login_ticket_from_cookies(cookies or '')
+    job = report_jobs.get(job_id, login_ticket) if login_ticket else None
+    if job is None:
+        async def not_found_stream():
+            yield format_sse({'type': 'error', 'message': f'报告任务 {job_id} 不存在或已过期'})
+        
+        return StreamingResponse(not_found_stream(), media_type="text/event-stream")
+    
+    return StreamingResponse(
+        sse_stream_with_ids(report_jobs.events(http_request, job)),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+# ===== 报告预生成接口 =====
+
+@app.post("/api/v1/reports/schedule", response_model=SuccessResponse)
+async def register_report_schedule(
+    request_body: dict,
+    cookies: str = Header(..., alias="X-Codeup-Cookies")
+):
+    """
+    登记每周报告预生成
+    
+    登记后调度器在每周的低峰时段为当前用户所有有活动的项目预生成本周报告并写入缓存，
+    之后的本周报告请求直接命中缓存。凭证只保存在内存中，服务重启后需要重新登记。
+    请求体可选 report_types（默认 ["activity_summary"]）、user，以及 run_now（立即执行一次）。
+    未启用报告缓存时预生成的结果无法保存，返回503。
+    """
+    client = get_client_from_cookies(cookies)
+    if not report_scheduler.cache_enabled:
+        raise HTTPException(status_code=503, detail="未启用AI报告缓存（AI_REPORT_CACHE=false），报告预生成不可用")
+    registration = report_scheduler.register(
+        client.login_ticket,
+        report_types=request_body.get('report_types'),
+        user=request_body.get('user', 'frontend_user')
+    )
+    if request_body.get('run_now'):
+        report_scheduler.run_soon(registration)
+    return create_success_response(
+        dict(registration.to_dict(), next_run=report_scheduler.next_run().strftime('%Y-%m-%d %H:%M')),
+        "报告预生成已登记"
+    )
+
+@app.get("/api/v1/reports/schedule", response_model=SuccessResponse)
+async def get_report_schedule(cookies: str = Header(..., alias="X-Codeup-Cookies")):
+    """查询当前用户的报告预生成登记和最近一次执行结果"""
+    client = get_client_from_cookies(cookies)
+    registration = report_scheduler.get(client.login_ticket)
+    if registration is None:
+        raise HTTPException(status_code=404, detail="未登记报告预生成")
+    return create_success_response(
+        dict(registration.to_dict(), next_run=report_scheduler.next_run().strftime('%Y-%m-%d %H:%M')),
+        "获取报告预生成登记成功"
+    )
+
+@app.delete("/api/v1/reports/schedule", response_model=SuccessResponse)
+async def unregister_report_schedule(cookies: str = Header(..., alias="X-Codeup-Cookies")):
+    """取消当前用户的报告预生成登记"""
+    client = get_client_from_cookies(cookies)
+    removed = report_scheduler.unregister(client.login_ticket)
+    return create_success_response({"unregistered": removed},
+                                   "报告预生成已取消" if removed else "未登记报告预生成")
 
 @app.get("/api/v1/ai/chat-stream")
 async def ai_chat_stream(
+    http_request: Request,
     query: str = Query(..., description="聊天内容"),
     user: str = Query("frontend_user", description="用户标识"),
     conversation_id: Optional[str] = Query(None, description="会话ID")
 ):
     """
-    AI聊天 - 流式响应
+    AI聊天 - 流式响应（支持Last-Event-ID断线续传）
     """
     try:
         # 构建Dify请求
@@ -757,9 +974,13 @@ async def ai_chat_stream(
             trace_id=None
         )
         
-        # 调用Dify API - 流式响应
+        if not http_request.headers.get('last-event-id'):
+            dify_dispatcher.admit(INTERACTIVE)
+        
+        # 调用Dify API - 流式响应（重连时接上原生成，不重复调用Dify）
         return StreamingResponse(
-            dify_client.create_streaming_response(dify_request),
+            sse_stream_with_ids(resumable_streams.open(
+                http_request, lambda: dify_client.stream_events(dify_request), "AI聊天")),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -768,12 +989,16 @@ async def ai_chat_stream(
                 "Access-Control-Allow-Headers": "*"
             }
         )
+    
+    except DifySaturatedError as e:
+        return dify_saturated_stream(e)
         
     except Exception as e:
         logger.error(f"AI聊天失败: {str(e)}", exc_info=True)
+        error_msg = str(e)
         
         async def chat_error_stream():
-            yield f"data: {json.dumps({'type': 'error', 'message': f'服务器错误: {str(e)}'}, ensure_ascii=False)}\n\n"
+            yield format_sse({'type': 'error', 'message': f'服务器错误: {error_msg}'})
         
         return StreamingResponse(
             chat_error_stream(),
@@ -785,9 +1010,9 @@ async def test_stream():
     """测试流式响应端点"""
     async def test_generator():
         for i in range(5):
-            yield f"data: {json.dumps({'type': 'content', 'content': f'测试消息 {i+1}'}, ensure_ascii=False)}\n\n"
+            yield format_sse({'type': 'content', 'content': f'测试消息 {i+1}'})
             await asyncio.sleep(1)  # 模拟延迟
-        yield f"data: {json.dumps({'type': 'done', 'message': '测试完成'}, ensure_ascii=False)}\n\n"
+        yield format_sse({'type': 'done', 'message': '测试完成'})
     
     return StreamingResponse(
         test_generator(),
@@ -1,16 +1,95 @@
 import httpx
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from dataclasses import dataclass
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+import os
 import re
 import logging
 
+from metadata_cache import MetadataCache, metadata_cache
+from singleflight import codeup_singleflight
+from activity_store import ActivityStore, get_activity_store
+from activity_records import (
+    CODEUP_TZ, ActivityRecord, codeup_now, epoch_day, epoch_time_str, to_epoch, to_records
+)
+from activity_pages import PAGE_SIZE, ActivityPager, fetch_activity_window, oldest_epoch
+from commit_scrubber import commit_scrubber
+
+
+logger = logging.getLogger(__name__)
+
+# 进程级共享的异步HTTP客户端（连接池），由所有AsyncCodeupClient实例复用
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """检查是否安装了HTTP/2依赖(h2)"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_http_client_options() -> Dict[str, Any]:
+    """
+    从环境变量读取连接池配置
+
+    环境变量:
+        CODEUP_HTTP_MAX_CONNECTIONS: 最大连接数（默认100）
+        CODEUP_HTTP_MAX_KEEPALIVE: 最大保活连接数（默认20）
+        CODEUP_HTTP_KEEPALIVE_EXPIRY: 保活连接空闲过期秒数（默认30）
+        CODEUP_HTTP_TIMEOUT: 请求超时秒数（默认5）
+        CODEUP_HTTP2: 是否启用HTTP/2（默认false，需要安装 httpx[http2]）
+    """
+    http2 = os.getenv('CODEUP_HTTP2', 'false').lower() == 'true'
+    if http2 and not _http2_available():
+        logger.warning("CODEUP_HTTP2已开启但未安装h2依赖，回退到HTTP/1.1（pip install 'httpx[http2]'）")
+        http2 = False
+
+    return {
+        'limits': httpx.Limits(
+            max_connections=int(os.getenv('CODEUP_HTTP_MAX_CONNECTIONS', '100')),
+            max_keepalive_connections=int(os.getenv('CODEUP_HTTP_MAX_KEEPALIVE', '20')),
+            keepalive_expiry=float(os.getenv('CODEUP_HTTP_KEEPALIVE_EXPIRY', '30')),
+        ),
+        'timeout': float(os.getenv('CODEUP_HTTP_TIMEOUT', '5')),
+        'http2': http2,
+        # 共享连接池被多个用户复用，禁止把响应中的Set-Cookie写回客户端，避免凭证串号
+        'cookies': CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+    }
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """获取（必要时创建）进程级共享的异步HTTP客户端"""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        options = _build_http_client_options()
+        _async_http_client = httpx.AsyncClient(**options)
+        logger.debug(f"创建共享异步HTTP连接池: {options['limits']}, http2={options['http2']}")
+    return _async_http_client
+
+
+async def close_async_http_client():
+    """关闭进程级共享的异步HTTP客户端（应用关闭时调用）"""
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+
 
 class AuthenticationError(Exception):
     """认证失败异常"""
     pass
 
 
+class UserInfoUnavailableError(Exception):
+    """无法获取当前用户信息（不能按用户过滤活动）"""
+    pass
+
+
 @dataclass
 class UserInfo:
     """用户信息数据类"""
@@ -20,19 +99,13 @@ class UserInfo:
     avatar_url: str
 
 
-@dataclass
-class ProjectActivity:
-    """项目活动数据类"""
-    action: int
-    created_at: datetime
-    user_name: str
-    project_name: str
-    branch: str
-    commits: List[Dict[str, Any]]
-
-
-class CodeupClient:
-    """阿里云 Codeup 代码仓库客户端"""
+class CodeupClientBase:
+    """
+    Codeup 客户端的公共部分
+    
+    URL、请求参数构建、响应解析和活动筛选/组装都与传输方式无关，由同步客户端 CodeupClient
+    和异步客户端 AsyncCodeupClient 共用；两者各自实现发送请求和获取数据的方法。
+    """
     
     BASE_URL = "https://codeup.aliyun.com/api/v3"
     DEVOPS_URL = "https://devops.aliyun.com/uiless/api/sdk"
@@ -69,17 +142,338 @@ class CodeupClient:
     
     def __init__(self, login_ticket: str):
         """
-        初始化 Codeup 客户端
+        初始化客户端的公共状态
         
         Args:
             login_ticket: 登录凭证
         """
+        self.login_ticket = login_ticket
         self.cookies = {
             'login_aliyunid_ticket': login_ticket
         }
+        # 凭证通过请求头携带，连接池本身不保存任何cookie
+        self.headers = {
+            'Cookie': f'login_aliyunid_ticket={login_ticket}'
+        }
         self._current_user: Optional[UserInfo] = None
         self.logger = logging.getLogger(__name__)
+    
+    def _handle_response(self, response: httpx.Response) -> Optional[Dict]:
+        """
+        处理响应状态码（同步/异步客户端共用）
+        
+        Raises:
+            AuthenticationError: 当返回 302 状态码时（通常表示认证失败）
+        """
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 302:
+            print(f"认证失败: cookies已过期 (状态码: 302)")
+            raise AuthenticationError("登录凭证已过期，请重新登录")
+        else:
+            print(f"请求失败: {response.status_code}")
+            return None
+    
+    def _parse_user_info(self, data: Optional[Dict]) -> Optional[UserInfo]:
+        """解析用户信息响应并缓存到实例上"""
+        if data and data.get('success') and data.get('result'):
+            user_data = data['result'].get('user', {})
+            self._current_user = UserInfo(
+                id=user_data.get('id', ''),
+                name=user_data.get('name', ''),
+                email=user_data.get('email', ''),
+                avatar_url=user_data.get('avatarUrl', '')
+            )
+            return self._current_user
+        
+        print("获取用户信息失败")
+        return None
+    
+    @staticmethod
+    def _project_counts_params(search: str, archived: bool) -> Dict[str, str]:
+        """构建项目统计请求参数"""
+        return {
+            'search': search,
+            'contains_sub_projects': 'true',
+            'archived': str(archived).lower()
+        }
+    
+    @staticmethod
+    def _authorized_projects_params(page: int, per_page: int, archived: bool, search: str) -> Dict[str, str]:
+        """构建授权项目列表请求参数"""
+        params = {
+            'page': str(page),
+            'per_page': str(per_page),
+            'order_by': 'last_activity_at',
+            'contains_sub_projects': 'true',
+            'archived': str(archived).lower()
+        }
+        
+        if search.strip():
+            params['search'] = search.strip()
+        return params
+    
+    @staticmethod
+    def _project_page_size() -> int:
+        """获取项目列表时的每页数量（上游允许的最大值为100）"""
+        return min(int(os.getenv('CODEUP_PROJECT_PAGE_SIZE', '100')), 100)
+    
+    @staticmethod
+    def _project_page_concurrency() -> int:
+        """获取项目列表时的并发页数上限"""
+        return max(int(os.getenv('CODEUP_PROJECT_PAGE_CONCURRENCY', '5')), 1)
+    
+    @staticmethod
+    def _assemble_project_pages(counts: Dict[str, int], pages: List[Optional[List[Dict]]]) -> Dict[str, Any]:
+        """按页码顺序合并各页项目，记录获取失败的页"""
+        all_projects = []
+        failed_pages = []
+        for page, projects in enumerate(pages, start=1):
+            if projects is None:
+                print(f"第 {page} 页获取失败")
+                failed_pages.append(page)
+            else:
+                all_projects.extend(projects)
+        
+        print(f"\n实际获取到 {len(all_projects)} 个项目")
+        return {
+            'projects': all_projects,
+            'expected_total': counts.get('authorized', 0),
+            'failed_pages': failed_pages
+        }
+    
+    @staticmethod
+    def _plan_project_pages(counts: Dict[str, int], per_page: int, search: str) -> int:
+        """根据项目统计计算需要获取的页数"""
+        authorized_count = counts.get('authorized', 0)
+        
+        if authorized_count == 0:
+            if search.strip():
+                print(f"没有找到匹配 '{search}' 的项目")
+            else:
+                print("没有找到您有权限访问的项目")
+            return 0
+        
+        total_pages = (authorized_count + per_page - 1) // per_page
+        
+        if search.strip():
+            print(f"搜索 '{search}' 找到 {authorized_count} 个项目，需要获取 {total_pages} 页")
+        else:
+            print(f"您有权限访问 {authorized_count} 个项目，需要获取 {total_pages} 页")
+        print("-" * 80)
+        return total_pages
+    
+    @staticmethod
+    def _normalize_date_range(start_date, end_date):
+        """处理日期参数并自动补全日期范围"""
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, '%Y-%m-%d')
+        if isinstance(end_date, str):
+            end_date = datetime.strptime(end_date, '%Y-%m-%d')
+            end_date = end_date.replace(hour=23, minute=59, second=59)
+        
+        # 自动补全日期范围
+        if start_date and not end_date:
+            end_date = codeup_now()
+        if end_date and not start_date:
+            start_date = end_date - timedelta(days=30)
+        return start_date, end_date
+    
+    def _build_activities_result(self, project_id: int, all_activities: List[ActivityRecord],
+                                 overview_info: Optional[Dict], page: int, per_page: int,
+                                 start_date: Optional[datetime], end_date: Optional[datetime],
+                                 current_user_name: Optional[str]) -> Dict[str, Any]:
+        """显示、清理活动数据并组装返回结果（活动记录在此序列化为响应结构）"""
+        total_commits = overview_info.get('commit_count', 0) if overview_info else 0
+        total_pages = (total_commits + per_page - 1) // per_page if total_commits > 0 else 0
+        
+        # 显示结果（逐条明细只在DEBUG级别下生成，其余级别不产生任何解析和格式化开销）
+        if all_activities:
+            self.logger.info(f"共 {len(all_activities)} 条活动记录")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self._display_activities_summary(
+                    project_id, all_activities, start_date, end_date, current_user_name
+                )
+                self._parse_and_display_activities(all_activities)
+        
+        # 清理提交消息中自动生成的尾注（未改动的活动不复制）
+        cleaned_activities = commit_scrubber.scrub_activities(all_activities)
+        
+        # 返回结果
+        filtered_count = len(cleaned_activities)
+        return {
+            'activities': [activity.to_dict() for activity in cleaned_activities],
+            'overview': overview_info,
+            'pagination': {
+                'current_page': page,
+                'total_pages': total_pages if not (start_date and end_date) else (filtered_count + per_page - 1) // per_page,
+                'per_page': per_page,
+                'total_commits': total_commits,
+                'filtered_count': filtered_count
+            },
+            'date_range': {
+                'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
+                'end_date': end_date.strftime('%Y-%m-%d') if end_date else None
+            }
+        }
+    
+    def _activities_request(self, project_id: int, current_page: int, per_page: int,
+                            start_date: Optional[datetime], end_date: Optional[datetime]):
+        """构建活动列表请求的URL和参数"""
+        url = f"{self.BASE_URL}/projects/{project_id}/activities"
+        params = {
+            'page': str(current_page),
+            'per_page': str(per_page if not (start_date and end_date) else 100)
+        }
+        return url, params
+    
+    @staticmethod
+    def _filter_activities_page(data: List[ActivityRecord], start_date: datetime, end_date: datetime,
+                                current_user_name: Optional[str], branch: Optional[str] = None) -> List[ActivityRecord]:
+        """按日期范围（整数时间戳）、用户和分支筛选单页活动（单页直接线性扫描，不为其建立索引）"""
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        window = [activity for activity in data
+                  if activity.epoch is not None and start_ts <= activity.epoch <= end_ts]
+        return CodeupClientBase._filter_activities_by_user(window, current_user_name, branch)
+    
+    @staticmethod
+    def _should_fetch_next_page(data: List[ActivityRecord], filtered_count: int, page: int,
+                                per_page: int, start_date: datetime) -> bool:
+        """检查是否需要继续获取下一页"""
+        if data and filtered_count < page * per_page:
+            last_activity_ts = data[-1].epoch
+            if last_activity_ts is not None:
+                return last_activity_ts >= to_epoch(start_date)
+        return False
+    
+    @staticmethod
+    def _slice_page(activities: List[ActivityRecord], page: int, per_page: int) -> List[ActivityRecord]:
+        """只保留当前页需要的记录"""
+        if len(activities) >= page * per_page:
+            return activities[(page - 1) * per_page:page * per_page]
+        return activities
+    
+    @staticmethod
+    def _filter_activities_by_user(data: List[ActivityRecord], current_user_name: Optional[str],
+                                   branch: Optional[str] = None) -> List[ActivityRecord]:
+        """没有日期筛选，但可能有用户或分支筛选"""
+        if not current_user_name and not branch:
+            return data
+        return [activity for activity in data
+                if (not current_user_name or activity.user_name == current_user_name)
+                and (not branch or activity.branch == branch)]
+    
+    def _display_activities_summary(self, project_id: int, activities: List[ActivityRecord],
+                                   start_date: Optional[datetime], end_date: Optional[datetime],
+                                   current_user_name: Optional[str]):
+        """显示活动摘要信息"""
+        # 仅在调试模式下显示详细信息
+        self.logger.debug(f"项目 {project_id} - 共 {len(activities)} 条活动记录")
+        if start_date and end_date:
+            self.logger.debug(f"日期范围: {start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}")
+    
+    def _parse_and_display_activities(self, activities: List[ActivityRecord]):
+        """解析并显示活动数据（按日期分组，调用方需先检查DEBUG级别）"""
+        weekdays = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+        # 活动已按时间倒序，按日分桶为一次线性整数运算
+        buckets: List[List[ActivityRecord]] = []
+        last_day = None
+        for activity in activities:
+            if activity.epoch is None:
+                continue
+            day_number = epoch_day(activity.epoch)
+            if day_number != last_day:
+                buckets.append([])
+                last_day = day_number
+            buckets[-1].append(activity)
+        for day_activities in buckets:
+            day = datetime.fromtimestamp(day_activities[0].epoch, CODEUP_TZ)
+            self._display_date_activities(day.strftime('%Y-%m-%d'), weekdays[day.weekday()], day_activities)
+    
+    def _display_date_activities(self, date: str, weekday: str, date_activities: List[ActivityRecord]):
+        """显示某一天的活动"""
+        # 简化输出
+        self.logger.debug(f"{date} ({weekday}) - {len(date_activities)} 条记录")
         
+        for activity in date_activities:
+            self._display_single_activity(activity)
+    
+    def _display_single_activity(self, activity: ActivityRecord):
+        """显示单个活动详情"""
+        # 活动类型
+        action_type = "Push" if activity.action == 5 else f"Action {activity.action}"
+        
+        # 时间
+        time_str = epoch_time_str(activity.epoch) if activity.epoch is not None else 'N/A'
+        
+        # 简化单行输出
+        self.logger.debug(f"  {time_str} - {action_type} | {activity.user_name or 'N/A'} | {activity.project_name or 'N/A'}")
+        
+        # 提交信息
+        if activity.branch:
+            self.logger.debug(f"     分支: {activity.branch}")
+        
+        if activity.commits:
+            self.logger.debug(f"     {len(activity.commits)} 个提交")
+            for i, commit in enumerate(activity.commits):
+                lines = commit.message.split('\n') if commit.message else ['N/A']
+                # 只输出第一行消息的前50个字符
+                msg_summary = lines[0][:50] + '...' if len(lines[0]) > 50 else lines[0]
+                self.logger.debug(f"       [{i+1}] {(commit.id or 'N/A')[:8]} - {commit.author_name or 'N/A'}: {msg_summary}")
+        
+        # 移除空行输出
+    
+    @staticmethod
+    def week_range():
+        """本周一 00:00:00 至本周日 23:59:59（北京时间）"""
+        today = codeup_now()
+        monday = today - timedelta(days=today.weekday())
+        monday = monday.replace(hour=0, minute=0, second=0, microsecond=0)
+        sunday = monday + timedelta(days=6)
+        sunday = sunday.replace(hour=23, minute=59, second=59)
+        return monday, sunday
+    
+    @staticmethod
+    def month_range():
+        """本月第一天 00:00:00 至本月最后一秒（北京时间）"""
+        today = codeup_now()
+        start_dt = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        
+        # 计算下个月第一天 00:00:00
+        if start_dt.month == 12:
+            end_dt = start_dt.replace(year=start_dt.year+1, month=1)
+        else:
+            end_dt = start_dt.replace(month=start_dt.month+1)
+        end_dt = end_dt - timedelta(seconds=1)  # 本月最后一秒
+        return start_dt, end_dt
+
+
+class CodeupClient(CodeupClientBase):
+    """阿里云 Codeup 代码仓库客户端"""
+    
+    def __init__(self, login_ticket: str, http_client: Optional[httpx.Client] = None):
+        """
+        初始化 Codeup 客户端
+        
+        Args:
+            login_ticket: 登录凭证
+            http_client: 自定义HTTP客户端，默认在首次请求时创建本实例的连接（用完调用 close）
+        """
+        super().__init__(login_ticket)
+        self._http_client = http_client
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """关闭本实例创建的HTTP连接"""
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+    
     def _make_request(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
         """
         发送 HTTP 请求的通用方法
@@ -98,22 +492,16 @@ class CodeupClient:
             params = {}
         params['_input_charset'] = 'utf-8'
         
-        with httpx.Client() as client:
-            try:
-                response = client.get(url, params=params, cookies=self.cookies)
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code == 302:
-                    print(f"认证失败: cookies已过期 (状态码: 302)")
-                    raise AuthenticationError("登录凭证已过期，请重新登录")
-                else:
-                    print(f"请求失败: {response.status_code}")
-                    return None
-            except AuthenticationError:
-                raise
-            except Exception as e:
-                print(f"请求异常: {e}")
-                return None
+        if self._http_client is None:
+            self._http_client = httpx.Client(**_build_http_client_options())
+        try:
+            response = self._http_client.get(url, params=params, headers=self.headers)
+            return self._handle_response(response)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            print(f"请求异常: {e}")
+            return None
     
     def get_user_info(self) -> Optional[UserInfo]:
         """
@@ -127,19 +515,7 @@ class CodeupClient:
             
         url = f"{self.DEVOPS_URL}/users/me"
         data = self._make_request(url)
-        
-        if data and data.get('success') and data.get('result'):
-            user_data = data['result'].get('user', {})
-            self._current_user = UserInfo(
-                id=user_data.get('id', ''),
-                name=user_data.get('name', ''),
-                email=user_data.get('email', ''),
-                avatar_url=user_data.get('avatarUrl', '')
-            )
-            return self._current_user
-        
-        print("获取用户信息失败")
-        return None
+        return self._parse_user_info(data)
     
     def get_project_counts(self, search: str = "", archived: bool = False) -> Dict[str, int]:
         """
@@ -153,11 +529,7 @@ class CodeupClient:
             包含 'all' 和 'authorized' 的字典
         """
         url = f"{self.BASE_URL}/projects/counts"
-        params = {
-            'search': search,
-            'contains_sub_projects': 'true',
-            'archived': str(archived).lower()
-        }
+        params = self._project_counts_params(search, archived)
         
         data = self._make_request(url, params)
         if data:
@@ -179,16 +551,7 @@ class CodeupClient:
             项目列表或 None
         """
         url = f"{self.BASE_URL}/projects/authorized/list"
-        params = {
-            'page': str(page),
-            'per_page': str(per_page),
-            'order_by': 'last_activity_at',
-            'contains_sub_projects': 'true',
-            'archived': str(archived).lower()
-        }
-        
-        if search.strip():
-            params['search'] = search.strip()
+        params = self._authorized_projects_params(page, per_page, archived, search)
         
         data = self._make_request(url, params)
         return data
@@ -204,38 +567,23 @@ class CodeupClient:
         Returns:
             所有项目列表
         """
-        counts = self.get_project_counts(archived=archived, search=search)
-        authorized_count = counts.get('authorized', 0)
-        
-        if authorized_count == 0:
-            if search.strip():
-                print(f"没有找到匹配 '{search}' 的项目")
-            else:
-                print("没有找到您有权限访问的项目")
-            return []
-        
-        per_page = 20
-        total_pages = (authorized_count + per_page - 1) // per_page
-        
-        if search.strip():
-            print(f"搜索 '{search}' 找到 {authorized_count} 个项目，需要获取 {total_pages} 页")
-        else:
-            print(f"您有权限访问 {authorized_count} 个项目，需要获取 {total_pages} 页")
-        print("-" * 80)
-        
-        all_projects = []
-        for page in range(1, total_pages + 1):
-            print(f"正在获取第 {page}/{total_pages} 页...")
-            projects = self.get_authorized_projects(page=page, per_page=per_page, archived=archived, search=search)
-            
-            if projects:
-                all_projects.extend(projects)
-            else:
-                print(f"第 {page} 页获取失败")
-                break
+        return self.get_all_projects_detail(archived, search)['projects']
+    
+    def get_all_projects_detail(self, archived: bool = False, search: str = '') -> Dict[str, Any]:
+        """
+        逐页获取所有授权项目，并报告获取失败的页（并发获取见 AsyncCodeupClient）
         
-        print(f"\n实际获取到 {len(all_projects)} 个项目")
-        return all_projects
+        Returns:
+            包含 'projects'、'expected_total'、'failed_pages' 的字典
+        """
+        counts = self.get_project_counts(archived=archived, search=search)
+        per_page = self._project_page_size()
+        total_pages = self._plan_project_pages(counts, per_page, search)
+        pages = [
+            self.get_authorized_projects(page=page, per_page=per_page, archived=archived, search=search)
+            for page in range(1, total_pages + 1)
+        ]
+        return self._assemble_project_pages(counts, pages)
     
     def get_project_overview(self, project_id: int, revision: str = "refs/heads/master") -> Optional[Dict]:
         """
@@ -271,23 +619,10 @@ class CodeupClient:
         Returns:
             包含活动记录、概览信息和分页信息的字典
         """
-        # 处理日期参数
-        if isinstance(start_date, str):
-            start_date = datetime.strptime(start_date, '%Y-%m-%d')
-        if isinstance(end_date, str):
-            end_date = datetime.strptime(end_date, '%Y-%m-%d')
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-        
-        # 自动补全日期范围
-        if start_date and not end_date:
-            end_date = datetime.now()
-        if end_date and not start_date:
-            start_date = end_date - timedelta(days=30)
+        start_date, end_date = self._normalize_date_range(start_date, end_date)
         
         # 获取项目概览
         overview_info = self.get_project_overview(project_id)
-        total_commits = overview_info.get('commit_count', 0) if overview_info else 0
-        total_pages = (total_commits + per_page - 1) // per_page if total_commits > 0 else 0
         
         # 获取当前用户信息（如果需要过滤）
         current_user_name = None
@@ -303,287 +638,513 @@ class CodeupClient:
             project_id, page, per_page, start_date, end_date, current_user_name
         )
         
-        # 显示结果
-        if all_activities:
-            self._display_activities_summary(
-                project_id, all_activities, start_date, end_date, current_user_name
-            )
-            self._parse_and_display_activities(all_activities)
-        
-        # 过滤Claude Code相关内容
-        cleaned_activities = self._filter_claude_code_content(all_activities)
-        
-        # 返回结果
-        filtered_count = len(cleaned_activities)
-        return {
-            'activities': cleaned_activities,
-            'overview': overview_info,
-            'pagination': {
-                'current_page': page,
-                'total_pages': total_pages if not (start_date and end_date) else (filtered_count + per_page - 1) // per_page,
-                'per_page': per_page,
-                'total_commits': total_commits,
-                'filtered_count': filtered_count
-            },
-            'date_range': {
-                'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
-                'end_date': end_date.strftime('%Y-%m-%d') if end_date else None
-            }
-        }
+        return self._build_activities_result(
+            project_id, all_activities, overview_info, page, per_page,
+            start_date, end_date, current_user_name
+        )
     
     def _fetch_activities(self, project_id: int, page: int, per_page: int,
                          start_date: Optional[datetime], end_date: Optional[datetime],
-                         current_user_name: Optional[str]) -> List[Dict]:
+                         current_user_name: Optional[str]) -> List[ActivityRecord]:
         """
         获取活动记录的内部方法
         """
         all_activities = []
         current_page = page
-        filtered_count = 0
         
         while True:
-            url = f"{self.BASE_URL}/projects/{project_id}/activities"
-            params = {
-                'page': str(current_page),
-                'per_page': str(per_page if not (start_date and end_date) else 100)
-            }
-            
+            url, params = self._activities_request(project_id, current_page, per_page, start_date, end_date)
             data = self._make_request(url, params)
             if not data:
                 break
+            data = to_records(data)
             
-            # 应用筛选条件
             if start_date and end_date:
-                for activity in data:
-                    # 用户过滤
-                    if current_user_name:
-                        user = activity.get('user', {})
-                        if user.get('name') != current_user_name:
-                            continue
-                    
-                    # 日期过滤
-                    created_at_str = activity.get('createdAt', '')
-                    if created_at_str:
-                        created_at = datetime.fromisoformat(created_at_str.replace('+08:00', ''))
-                        if start_date <= created_at <= end_date:
-                            all_activities.append(activity)
-                            filtered_count += 1
-                        elif created_at < start_date:
-                            break
-                
-                # 检查是否需要继续获取下一页
-                if data and filtered_count < page * per_page:
-                    last_activity_time_str = data[-1].get('createdAt', '')
-                    if last_activity_time_str:
-                        last_activity_time = datetime.fromisoformat(last_activity_time_str.replace('+08:00', ''))
-                        if last_activity_time >= start_date:
-                            current_page += 1
-                            continue
-                
-                # 只保留当前页需要的记录
-                if filtered_count >= page * per_page:
-                    start_idx = (page - 1) * per_page
-                    end_idx = page * per_page
-                    all_activities = all_activities[start_idx:end_idx]
-                break
+                all_activities.extend(
+                    self._filter_activities_page(data, start_date, end_date, current_user_name)
+                )
+                if self._should_fetch_next_page(data, len(all_activities), page, per_page, start_date):
+                    current_page += 1
+                    continue
+                all_activities = self._slice_page(all_activities, page, per_page)
             else:
-                # 没有日期筛选，但可能有用户筛选
-                if current_user_name:
-                    for activity in data:
-                        user = activity.get('user', {})
-                        if user.get('name') == current_user_name:
-                            all_activities.append(activity)
-                else:
-                    all_activities = data
-                break
+                all_activities = self._filter_activities_by_user(data, current_user_name)
+            break
         
         return all_activities
     
-    def _display_activities_summary(self, project_id: int, activities: List[Dict],
-                                   start_date: Optional[datetime], end_date: Optional[datetime],
-                                   current_user_name: Optional[str]):
-        """显示活动摘要信息"""
-        # 仅在调试模式下显示详细信息
-        self.logger.debug(f"项目 {project_id} - 共 {len(activities)} 条活动记录")
-        if start_date and end_date:
-            self.logger.debug(f"日期范围: {start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}")
+    def get_week_activities(self, project_id: int, filter_by_user: bool = False) -> Dict[str, Any]:
+        """
+        获取本周的项目活动
+        
+        Args:
+            project_id: 项目 ID
+            filter_by_user: 是否只显示当前用户的活动
+            
+        Returns:
+            活动数据
+        """
+        monday, sunday = self.week_range()
+        
+        # 仅在调试时输出
+        self.logger.info(f"获取本周的项目活动 ({monday.strftime('%Y-%m-%d')} 至 {sunday.strftime('%Y-%m-%d')})")
+        
+        return self.get_project_activities(
+            project_id,
+            start_date=monday,
+            end_date=sunday,
+            per_page=50,
+            filter_by_user=filter_by_user
+        )
     
-    def _parse_and_display_activities(self, activities: List[Dict]):
-        """解析并显示活动数据（按日期分组）"""
-        self.logger.info(f"共 {len(activities)} 条活动记录")
+    def get_month_activities(self, project_id: int, filter_by_user: bool = False) -> Dict[str, Any]:
+        """
+        获取本月的项目活动
         
-        # 按日期分组活动
-        activities_by_date = {}
-        for activity in activities:
-            created_at_str = activity.get('createdAt', '')
-            if created_at_str:
-                created_at = datetime.fromisoformat(created_at_str.replace('+08:00', ''))
-                date_key = created_at.strftime('%Y-%m-%d')
-                weekday = ['周一', '周二', '周三', '周四', '周五', '周六', '周日'][created_at.weekday()]
-                
-                if date_key not in activities_by_date:
-                    activities_by_date[date_key] = {'weekday': weekday, 'activities': []}
-                activities_by_date[date_key]['activities'].append(activity)
-        
-        # 按日期排序并显示
-        for date in sorted(activities_by_date.keys(), reverse=True):
-            date_info = activities_by_date[date]
-            self._display_date_activities(date, date_info)
-    
-    def _display_date_activities(self, date: str, date_info: Dict):
-        """显示某一天的活动"""
-        date_activities = date_info['activities']
-        weekday = date_info['weekday']
+        Args:
+            project_id: 项目 ID
+            filter_by_user: 是否只显示当前用户的活动
+            
+        Returns:
+            活动数据
+        """
+        start_dt, end_dt = self.month_range()
         
-        # 简化输出
-        self.logger.debug(f"{date} ({weekday}) - {len(date_activities)} 条记录")
+        return self.get_project_activities(
+            project_id,
+            start_date=start_dt,
+            end_date=end_dt,
+            per_page=100,
+            filter_by_user=filter_by_user
+        )
+
+
+class AsyncCodeupClient(CodeupClientBase):
+    """
+    阿里云 Codeup 代码仓库异步客户端
+    
+    基于 httpx.AsyncClient，与同步客户端 CodeupClient 同级（共用 CodeupClientBase），
+    提供相同的接口（均需 await），供 FastAPI 异步接口使用，避免同步网络请求阻塞事件循环。
+    """
+    
+    def __init__(self, login_ticket: str, http_client: Optional[httpx.AsyncClient] = None,
+                 cache: Optional[MetadataCache] = None, activity_store: Optional[ActivityStore] = None):
+        """
+        初始化异步 Codeup 客户端
         
-        for activity in date_activities:
-            self._display_single_activity(activity)
+        Args:
+            login_ticket: 登录凭证
+            http_client: 自定义异步HTTP客户端，默认使用进程级共享连接池
+            cache: 元数据缓存，默认使用进程级共享缓存
+            activity_store: 本地活动存储，默认使用进程级共享存储（可通过环境变量关闭）
+        """
+        super().__init__(login_ticket)
+        self._async_http_client = http_client
+        self.cache = cache or metadata_cache
+        self.activity_store = activity_store or get_activity_store()
     
-    def _display_single_activity(self, activity: Dict):
-        """显示单个活动详情"""
-        # 活动类型
-        action_type = "Push" if activity.get('action') == 5 else f"Action {activity.get('action')}"
+    async def _cached_request(self, endpoint: str, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """通过元数据缓存发送请求（按登录凭证、接口和参数缓存）"""
+        request_params = dict(params or {})
+        return await self.cache.get_or_fetch(
+            self.login_ticket, endpoint, params,
+            lambda: self._make_request(url, dict(request_params))
+        )
+    
+    def invalidate_cache(self, endpoint: Optional[str] = None) -> int:
+        """清除当前用户的元数据缓存"""
+        self._current_user = None
+        return self.cache.invalidate(self.login_ticket, endpoint)
+    
+    async def _make_request(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        发送 HTTP 请求的通用方法（异步）
         
-        # 时间
-        created_at_str = activity.get('createdAt', '')
-        if created_at_str:
-            created_at = datetime.fromisoformat(created_at_str.replace('+08:00', ''))
-            time_str = created_at.strftime('%H:%M:%S')
+        相同凭证、URL和参数的并发请求会合并为一次上游请求，结果由各调用方共享。
+        
+        Raises:
+            AuthenticationError: 当返回 302 状态码时（通常表示认证失败）
+        """
+        if params is None:
+            params = {}
+        params['_input_charset'] = 'utf-8'
+        
+        key = (self.login_ticket, url, tuple(sorted(params.items())))
+        return await codeup_singleflight.do(key, lambda: self._send_request(url, params))
+    
+    async def _send_request(self, url: str, params: Dict) -> Optional[Dict]:
+        """实际发送异步 HTTP 请求"""
+        client = self._async_http_client or get_async_http_client()
+        try:
+            response = await client.get(url, params=params, headers=self.headers)
+            return self._handle_response(response)
+        except AuthenticationError:
+            raise
+        except Exception as e:
+            logger.error(f"Codeup请求异常: {url}: {e}")
+            return None
+    
+    async def get_user_info(self, cached: bool = False) -> Optional[UserInfo]:
+        """
+        获取当前用户信息
+        
+        默认总是请求上游：接口层用它校验凭证是否仍然有效，不能被缓存掩盖。
+        只需要用户名做活动过滤的内部调用传 cached=True，走元数据缓存。
+        """
+        url = f"{self.DEVOPS_URL}/users/me"
+        if cached:
+            data = await self._cached_request('user_info', url)
         else:
-            time_str = 'N/A'
+            data = await self._make_request(url)
+        return self._parse_user_info(data)
+    
+    async def get_project_counts(self, search: str = "", archived: bool = False) -> Dict[str, int]:
+        """获取项目统计信息（带缓存）"""
+        url = f"{self.BASE_URL}/projects/counts"
+        params = self._project_counts_params(search, archived)
+        
+        data = await self._cached_request('project_counts', url, params)
+        if data:
+            return data
+        return {'all': 0, 'authorized': 0}
+    
+    async def get_authorized_projects(self, page: int = 1, per_page: int = 20,
+                                      archived: bool = False, search: str = '') -> Optional[List[Dict]]:
+        """获取授权的项目列表（支持分页和搜索，带缓存）"""
+        url = f"{self.BASE_URL}/projects/authorized/list"
+        params = self._authorized_projects_params(page, per_page, archived, search)
         
-        # 用户和项目信息
-        user_name = activity.get('user', {}).get('name', 'N/A')
-        project_name = activity.get('project', {}).get('name', 'N/A')
+        return await self._cached_request('authorized_projects', url, params)
+    
+    async def get_all_projects(self, archived: bool = False, search: str = '',
+                               concurrency: Optional[int] = None) -> List[Dict]:
+        """获取所有授权项目（自动分页和搜索）"""
+        detail = await self.get_all_projects_detail(archived, search, concurrency)
+        return detail['projects']
+    
+    async def get_all_projects_detail(self, archived: bool = False, search: str = '',
+                                      concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """并发获取所有授权项目，并报告获取失败的页"""
+        counts = await self.get_project_counts(archived=archived, search=search)
+        per_page = self._project_page_size()
+        total_pages = self._plan_project_pages(counts, per_page, search)
+        if total_pages == 0:
+            return self._assemble_project_pages(counts, [])
         
-        # 简化单行输出
-        self.logger.debug(f"  {time_str} - {action_type} | {user_name} | {project_name}")
+        semaphore = asyncio.Semaphore(concurrency or self._project_page_concurrency())
         
-        # 解析提交信息
-        if 'dataMap' in activity:
-            data_map = activity['dataMap']
-            ref = data_map.get(':ref', '').replace('refs/heads/', '')
-            commits = data_map.get(':commits', [])
-            
-            if ref:
-                self.logger.debug(f"     分支: {ref}")
-            
-            if commits:
-                self.logger.debug(f"     {len(commits)} 个提交")
-                # 仅在DEBUG模式下显示提交详情
-                for i, commit in enumerate(commits):
-                    commit_id = commit.get(':id', 'N/A')[:8]
-                    message = commit.get(':message', '')
-                    lines = message.split('\n') if message else ['N/A']
-                    author_name = commit.get(':author', {}).get(':name', 'N/A')
-                    # 只输出第一行消息的前50个字符
-                    msg_summary = lines[0][:50] + '...' if len(lines[0]) > 50 else lines[0]
-                    self.logger.debug(f"       [{i+1}] {commit_id} - {author_name}: {msg_summary}")
+        async def fetch(page: int) -> Optional[List[Dict]]:
+            async with semaphore:
+                return await self.get_authorized_projects(page=page, per_page=per_page, archived=archived, search=search)
         
-        # 移除空行输出
+        pages = await asyncio.gather(
+            *(fetch(page) for page in range(1, total_pages + 1)),
+            return_exceptions=True
+        )
+        for result in pages:
+            if isinstance(result, BaseException):
+                raise result
+        
+        return self._assemble_project_pages(counts, pages)
     
-    def get_week_activities(self, project_id: int, filter_by_user: bool = False) -> Dict[str, Any]:
+    async def get_project_overview(self, project_id: int, revision: str = "refs/heads/master") -> Optional[Dict]:
+        """获取项目概览信息（带缓存）"""
+        url = f"{self.BASE_URL}/projects/{project_id}/overview"
+        params = {'revision': revision}
+        
+        return await self._cached_request('project_overview', url, params)
+    
+    async def get_project_activities(self, project_id: int, page: int = 1, per_page: int = 10,
+                                     start_date: Optional[datetime] = None,
+                                     end_date: Optional[datetime] = None,
+                                     filter_by_user: bool = False,
+                                     branch: Optional[str] = None,
+                                     include_overview: bool = True) -> Dict[str, Any]:
         """
-        获取本周的项目活动
+        获取项目活动（支持日期范围、用户和分支筛选）
+        
+        项目概览与活动记录互不依赖，两者并发请求。
         
         Args:
-            project_id: 项目 ID
-            filter_by_user: 是否只显示当前用户的活动
+            include_overview: 是否获取项目概览（只在需要total_commits时才需要）
+        """
+        start_date, end_date = self._normalize_date_range(start_date, end_date)
+        
+        async def load_activities():
+            # 获取当前用户信息（如果需要过滤）
+            current_user_name = None
+            if filter_by_user:
+                user_info = await self.get_user_info(cached=True)
+                if user_info:
+                    current_user_name = user_info.name
+                    self.logger.debug(f"当前用户: {current_user_name}")
             
-        Returns:
-            活动数据
+            # 获取活动记录
+            activities = await self._fetch_activities(
+                project_id, page, per_page, start_date, end_date, current_user_name, branch
+            )
+            return current_user_name, activities
+        
+        if include_overview:
+            overview_info, (current_user_name, all_activities) = await asyncio.gather(
+                self.get_project_overview(project_id), load_activities()
+            )
+        else:
+            overview_info = None
+            current_user_name, all_activities = await load_activities()
+        
+        return self._build_activities_result(
+            project_id, all_activities, overview_info, page, per_page,
+            start_date, end_date, current_user_name
+        )
+    
+    async def _fetch_activities(self, project_id: int, page: int, per_page: int,
+                                start_date: Optional[datetime], end_date: Optional[datetime],
+                                current_user_name: Optional[str], branch: Optional[str] = None) -> List[ActivityRecord]:
+        """获取活动记录的内部方法（异步，日期范围查询优先走本地增量存储）"""
+        if start_date and end_date:
+            if self.activity_store:
+                activities = await self._fetch_activities_from_store(
+                    project_id, start_date, end_date, current_user_name, branch
+                )
+            else:
+                activities = await self._fetch_activity_window(
+                    project_id, to_epoch(start_date), to_epoch(end_date)
+                )
+                if activities is not None:
+                    activities = self._filter_activities_by_user(activities, current_user_name, branch)
+            if activities is not None:
+                return self._slice_page(activities, page, per_page)
+        
+        # 不带日期范围时只需请求一页
+        if not (start_date and end_date):
+            url, params = self._activities_request(project_id, page, per_page, start_date, end_date)
+            data = await self._make_request(url, params)
+            return self._filter_activities_by_user(to_records(data), current_user_name, branch) if data else []
+        
+        # 按窗口定位失败时，流水线逐页请求上游（处理当前页时已预取下一页）
+        start_ts = to_epoch(start_date)
+        all_activities = []
+        pager = self.iter_activity_pages(
+            project_id, start_page=page,
+            prefetch_while=lambda data: (oldest_epoch(data) or 0) >= start_ts
+        )
+        async with pager:
+            async for data in pager:
+                all_activities.extend(
+                    self._filter_activities_page(data, start_date, end_date, current_user_name, branch)
+                )
+                if not self._should_fetch_next_page(data, len(all_activities), page, per_page, start_date):
+                    break
+        return self._slice_page(all_activities, page, per_page)
+    
+    def iter_activity_pages(self, project_id: int, start_page: int = 1, per_page: int = PAGE_SIZE,
+                            prefetch_while=None) -> ActivityPager:
         """
-        today = datetime.now()
-        monday = today - timedelta(days=today.weekday())
-        monday = monday.replace(hour=0, minute=0, second=0, microsecond=0)
-        sunday = monday + timedelta(days=6)
-        sunday = sunday.replace(hour=23, minute=59, second=59)
+        以异步迭代器的形式逐页读取项目活动流（自动预取下一页）
+        
+        Example:
+            async with client.iter_activity_pages(project_id) as pager:
+                async for page in pager:
+                    ...
+        """
+        return ActivityPager(
+            lambda page_no, size: self._fetch_activity_page(project_id, page_no, size),
+            per_page=per_page, start_page=start_page, prefetch_while=prefetch_while
+        )
+    
+    async def _fetch_activity_page(self, project_id: int, page: int,
+                                   per_page: int) -> Optional[List[ActivityRecord]]:
+        """获取上游活动流的单页数据（转换为精简记录）"""
+        url = f"{self.BASE_URL}/projects/{project_id}/activities"
+        data = await self._make_request(url, {'page': str(page), 'per_page': str(per_page)})
+        return to_records(data) if isinstance(data, list) else None
+    
+    async def _fetch_activities_from_store(self, project_id: int, start_date: datetime, end_date: datetime,
+                                           current_user_name: Optional[str],
+                                           branch: Optional[str]) -> Optional[List[ActivityRecord]]:
+        """
+        先增量同步本地存储，再在本地完成日期/用户/分支查询
+        
+        同步总是使用当前用户的凭证请求上游第1页，因此权限校验与直接请求一致；
+        同步失败时返回None，由调用方回退到直接请求上游。
+        """
+        store = self.activity_store
+        # 先追上最新活动（稳态下只请求第1页），同一用户对同一项目的并发同步合并为一次
+        synced = await codeup_singleflight.do(
+            ('activity_sync', self.login_ticket, project_id),
+            lambda: store.sync(
+                project_id, None,
+                lambda page, per_page: self._fetch_activity_page(project_id, page, per_page)
+            )
+        )
+        if not synced:
+            return None
+        
+        # 查询范围早于已覆盖范围时，只定位并拉取缺失的时间窗口
+        start_ts, end_ts = to_epoch(start_date), to_epoch(end_date)
+        if not await store.is_covered(project_id, start_ts, end_ts):
+            missing_end = min(end_ts, await store.head_covered_from(project_id))
+            window = await self._fetch_activity_window(project_id, start_ts, missing_end)
+            if window is None:
+                return None
+            await store.add_range(project_id, window, start_ts, missing_end)
+        
+        return await store.query(project_id, start_date, end_date, current_user_name, branch)
+    
+    async def _fetch_activity_window(self, project_id: int, start_ts: float,
+                                     end_ts: float) -> Optional[List[ActivityRecord]]:
+        """按时间窗口定位并并发拉取上游活动页（历史范围只需O(log n)次探测）"""
+        return await fetch_activity_window(
+            lambda page, per_page: self._fetch_activity_page(project_id, page, per_page),
+            start_ts, end_ts
+        )
+    
+    async def get_week_activities(self, project_id: int, filter_by_user: bool = False,
+                                  include_overview: bool = True) -> Dict[str, Any]:
+        """获取本周的项目活动"""
+        monday, sunday = self.week_range()
         
-        # 仅在调试时输出
         self.logger.info(f"获取本周的项目活动 ({monday.strftime('%Y-%m-%d')} 至 {sunday.strftime('%Y-%m-%d')})")
         
-        return self.get_project_activities(
+        return await self.get_project_activities(
             project_id,
             start_date=monday,
             end_date=sunday,
             per_page=50,
-            filter_by_user=filter_by_user
+            filter_by_user=filter_by_user,
+            include_overview=include_overview
         )
     
-    def _filter_claude_code_content(self, activities):
-        """简单的Claude Code内容过滤方法"""
-        if not activities:
-            return activities
+    async def get_month_activities(self, project_id: int, filter_by_user: bool = False,
+                                   include_overview: bool = True) -> Dict[str, Any]:
+        """获取本月的项目活动"""
+        start_dt, end_dt = self.month_range()
         
+        return await self.get_project_activities(
+            project_id,
+            start_date=start_dt,
+            end_date=end_dt,
+            per_page=100,
+            filter_by_user=filter_by_user,
+            include_overview=include_overview
+        )
+    
+    @staticmethod
+    def _activity_fanout_concurrency() -> int:
+        """跨项目获取活动时的并发项目数上限"""
+        return max(int(os.getenv('CODEUP_ACTIVITY_FANOUT_CONCURRENCY', '8')), 1)
+    
+    @staticmethod
+    def _project_activity_epoch(project: Dict) -> Optional[int]:
+        """项目最近活动时间（last_activity_at）的时间戳，缺失或无法解析时返回None"""
+        value = project.get('last_activity_at')
+        if not value:
+            return None
         try:
-            filtered_activities = []
-            
-            for activity in activities:
-                try:
-                    # 创建活动副本以避免修改原始数据
-                    cleaned_activity = activity.copy()
-                    
-                    # 检查并清理dataMap中的commits
-                    if isinstance(cleaned_activity.get('dataMap'), dict):
-                        data_map = cleaned_activity['dataMap'].copy()
-                        if ':commits' in data_map and isinstance(data_map[':commits'], list):
-                            cleaned_commits = []
-                            for commit in data_map[':commits']:
-                                if isinstance(commit, dict) and ':message' in commit:
-                                    message = commit[':message']
-                                    
-                                    # 更简单直接的过滤方法
-                                    cleaned_message = self._clean_commit_message(message)
-                                    
-                                    cleaned_commit = commit.copy()
-                                    cleaned_commit[':message'] = cleaned_message
-                                    cleaned_commits.append(cleaned_commit)
-                                else:
-                                    cleaned_commits.append(commit)
-                            
-                            data_map[':commits'] = cleaned_commits
-                            cleaned_activity['dataMap'] = data_map
-                    
-                    filtered_activities.append(cleaned_activity)
-                    
-                except Exception as e:
-                    # 如果单个活动处理失败，使用原始活动
-                    filtered_activities.append(activity)
-                    
-            return filtered_activities
-            
-        except Exception as e:
-            # 如果整个过滤过程失败，返回原始数据
-            return activities
+            return to_epoch(datetime.fromisoformat(str(value).replace('Z', '+00:00')))
+        except ValueError:
+            return None
     
-    def _clean_commit_message(self, message):
-        """清理单个提交消息中的Claude Code内容"""
-        if not message:
-            return message
+    async def get_recently_active_projects(self, since: datetime, archived: bool = False,
+                                           max_projects: Optional[int] = None) -> List[Dict]:
+        """
+        获取 since 之后有活动的授权项目（按最近活动时间倒序）
         
-        try:
-            # 按行分割消息
-            lines = message.split('\n')
-            cleaned_lines = []
-            
-            for line in lines:
-                # 跳过包含Claude Code标识的行
-                if "🤖 Generated with [Claude Code]" in line:
-                    continue
-                if "Co-Authored-By: Claude <noreply@anthropic.com>" in line:
-                    continue
-                # 添加非Claude Code相关的行
-                cleaned_lines.append(line)
-            
-            # 重新组合，清理末尾的空行
-            result = '\n'.join(cleaned_lines).rstrip()
-            return result
-            
-        except Exception as e:
-            # 如果清理失败，返回原始消息
-            return message
+        授权项目列表按 last_activity_at 倒序返回，逐页读取到第一个早于 since 的项目即停止，
+        不需要读取全部项目；缺少 last_activity_at 的项目保守地保留。
+        """
+        since_ts = to_epoch(since)
+        per_page = self._project_page_size()
+        projects = []
+        page = 1
+        while True:
+            data = await self.get_authorized_projects(page=page, per_page=per_page, archived=archived)
+            if not data:
+                return projects
+            for project in data:
+                activity_ts = self._project_activity_epoch(project)
+                if activity_ts is not None and activity_ts < since_ts:
+                    return projects
+                projects.append(project)
+                if max_projects and len(projects) >= max_projects:
+                    return projects
+            if len(data) < per_page:
+                return projects
+            page += 1
+    
+    async def get_my_activities(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                                per_project: int = 100, concurrency: Optional[int] = None,
+                                max_projects: Optional[int] = None) -> Dict[str, Any]:
+        """
+        跨项目获取当前用户的活动，按时间倒序合并
+        
+        只请求开始时间之后有活动的项目；用户信息只获取一次，不请求项目概览；
+        各项目的活动在并发上限内获取，单个项目失败时跳过并记录在 failed_projects 中。
+        返回的活动结构与单项目活动接口相同（含 project 字段），可直接作为跨项目报告的数据源。
+        
+        Args:
+            per_project: 每个项目最多返回的活动数
+            concurrency: 并发项目数上限，默认读取 CODEUP_ACTIVITY_FANOUT_CONCURRENCY
+            max_projects: 最多扫描的项目数（按最近活动时间），None表示不限
+        
+        Raises:
+            UserInfoUnavailableError: 无法获取当前用户信息（不会退化为返回所有人的活动）
+        """
+        start_date, end_date = self._normalize_date_range(start_date, end_date)
+        if not (start_date and end_date):
+            start_date, end_date = self.week_range()
+        
+        user_info, projects = await asyncio.gather(
+            self.get_user_info(cached=True),
+            self.get_recently_active_projects(start_date, max_projects=max_projects)
+        )
+        if not user_info or not user_info.name:
+            raise UserInfoUnavailableError("无法获取当前用户信息")
+        current_user_name = user_info.name
+        semaphore = asyncio.Semaphore(concurrency or self._activity_fanout_concurrency())
+        
+        async def fetch(project: Dict) -> List[ActivityRecord]:
+            async with semaphore:
+                return await self._fetch_activities(
+                    project.get('id'), 1, per_project, start_date, end_date, current_user_name
+                )
+        
+        results = await asyncio.gather(*(fetch(project) for project in projects), return_exceptions=True)
+        
+        activities: List[ActivityRecord] = []
+        project_summaries = []
+        failed_projects = []
+        for project, result in zip(projects, results):
+            if isinstance(result, AuthenticationError):
+                raise result
+            if isinstance(result, BaseException):
+                self.logger.warning(f"获取项目 {project.get('id')} 的活动失败: {result}")
+                failed_projects.append(project.get('id'))
+                continue
+            if result:
+                activities.extend(result)
+                project_summaries.append({
+                    'id': project.get('id'),
+                    'name': project.get('name'),
+                    'activity_count': len(result)
+                })
+        
+        # 各项目的活动已按时间倒序，排序时只需合并这些有序段
+        activities.sort(key=lambda activity: activity.epoch or 0, reverse=True)
+        cleaned_activities = commit_scrubber.scrub_activities(activities)
+        self.logger.info(f"扫描 {len(projects)} 个近期活跃项目，共 {len(cleaned_activities)} 条当前用户活动")
+        
+        return {
+            'activities': [activity.to_dict() for activity in cleaned_activities],
+            'projects': project_summaries,
+            'scanned_projects': len(projects),
+            'failed_projects': failed_projects,
+            'date_range': {
+                'start_date': start_date.strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d')
+            }
+        }
 
 def main():
     """主函数 - 演示用法"""
@@ -597,15 +1158,19 @@ def main():
         print("无法提取login_ticket，使用默认值")
         login_ticket = '3RctYK12wchSG5MTNmpZhQ3r.1118LAazv7na8qekPAeBrv2iiHacFRbKGgXDXzANt7QN6N8pyY84EQDTNZGaDVLhBFLZ5XgoeFDGREq9PrCu4CnqBm6JJZj9iCfseHqV8WEH64gGQWxXmNHpFvR3PwhTMxpnuaEYgmafon78ZfBMyaoTrJsyAFkQtW9k4tDytrFJcughVYz.2mWNaj2meJqzns1bZmuQNPXNXDq2nB1m7yRG3c87UXgsLJ1T62nu5Qzr84prtBFd3y'
     
-    # 初始化客户端
-    client = CodeupClient(login_ticket)
-    
+    # 初始化客户端（演示结束时关闭连接）
+    with CodeupClient(login_ticket) as client:
+        demo(client)
+
+
+def demo(client: CodeupClient):
+    """演示各接口的调用"""
     # 获取用户信息
     print("\n获取系统事件（用户信息）...")
     print("-" * 50)
     user_info = client.get_user_info()
     if user_info:
-        self.logger.debug(f"当前用户: {user_info.name}")
+        client.logger.debug(f"当前用户: {user_info.name}")
         print(f"邮箱: {user_info.email}")
     
     # 项目 ID
@@ -640,77 +1205,6 @@ def main():
         if all_result.get('date_range'):
             date_range = all_result['date_range']
             print(f"日期范围: {date_range['start_date']} 至 {date_range['end_date']}")
-    
-    def _clean_claude_code_content(self, activities: List[Dict]) -> List[Dict]:
-        """
-        清理活动数据中的Claude Code相关内容
-        
-        Args:
-            activities: 原始活动数据列表
-            
-        Returns:
-            清理后的活动数据列表
-        """
-        import copy
-        
-        def clean_commit_message(message: str) -> str:
-            """清理提交消息中的Claude Code相关内容"""
-            if not message or not isinstance(message, str):
-                return message
-                
-            # 使用简单的字符串替换，避免复杂的正则表达式
-            cleaned_message = message
-            
-            # 移除Claude Code相关的标记
-            claude_markers = [
-                "🤖 Generated with [Claude Code](https://claude.ai/code)",
-                "Co-Authored-By: Claude <noreply@anthropic.com>"
-            ]
-            
-            for marker in claude_markers:
-                cleaned_message = cleaned_message.replace(marker, "")
-            
-            # 清理多余的空行和空白字符
-            lines = cleaned_message.split('\n')
-            cleaned_lines = []
-            
-            for line in lines:
-                stripped_line = line.strip()
-                if stripped_line:  # 保留非空行
-                    cleaned_lines.append(line)
-            
-            # 重新组合，去掉末尾多余的空行
-            result = '\n'.join(cleaned_lines).strip()
-            return result
-        
-        try:
-            # 深拷贝活动列表以避免修改原数据
-            cleaned_activities = copy.deepcopy(activities)
-            
-            for activity in cleaned_activities:
-                try:
-                    # 清理dataMap中的提交消息
-                    if 'dataMap' in activity and ':commits' in activity['dataMap']:
-                        commits = activity['dataMap'][':commits']
-                        if isinstance(commits, list):
-                            for commit in commits:
-                                if isinstance(commit, dict) and ':message' in commit:
-                                    commit[':message'] = clean_commit_message(commit[':message'])
-                    
-                    # 也清理data字段中的内容（如果存在）
-                    if 'data' in activity and isinstance(activity['data'], str):
-                        activity['data'] = clean_commit_message(activity['data'])
-                        
-                except Exception as e:
-                    print(f"Error cleaning activity: {e}")
-                    continue
-            
-            return cleaned_activities
-            
-        except Exception as e:
-            print(f"Error in _clean_claude_code_content: {e}")
-            # 如果清理失败，返回原始数据
-            return activities
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+"""
+提交消息清理模块 - 预编译多模式匹配，移除提交消息中自动生成的尾注
+"""
+import json
+import logging
+import os
+import re
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from activity_records import ActivityRecord
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 内置规则：命中任一规则的整行会被移除
+DEFAULT_RULES = [
+    {'name': 'claude_code_footer', 'text': '🤖 Generated with [Claude Code]'},
+    {'name': 'claude_co_author', 'text': 'Co-Authored-By: Claude <noreply@anthropic.com>'},
+]
+
+
+class CommitScrubber:
+    """
+    提交消息清理器
+
+    所有规则编译为一个多分支正则，每条消息只扫描一遍；
+    没有被改写的消息、提交和活动记录原样返回，只复制实际被改写的对象。
+    与原有过滤逻辑一致，消息末尾的空白总是被去掉（末尾没有空白且未命中规则的消息不产生新对象）。
+
+    规则格式（JSON列表）：
+        [{"name": "signed_off", "pattern": "^Signed-off-by: .+$"},
+         {"name": "bot_footer", "text": "Generated by bot"}]
+    pattern 为正则表达式，text 为普通文本；消息中包含匹配内容的整行会被移除。
+    """
+
+    def __init__(self, rules: Optional[List[Dict[str, str]]] = None):
+        self.rules: List[Dict[str, str]] = []
+        branches = []
+        for rule in DEFAULT_RULES if rules is None else rules:
+            if not isinstance(rule, dict):
+                logger.warning(f"忽略无效的提交消息清理规则（应为对象）: {rule!r}")
+                continue
+            pattern = rule.get('pattern')
+            if pattern is None and rule.get('text'):
+                pattern = re.escape(str(rule['text']))
+            if not pattern or not isinstance(pattern, str):
+                logger.warning(f"忽略无效的提交消息清理规则: {rule}")
+                continue
+            branch = f'(?P<r{len(self.rules)}>{pattern})'
+            try:
+                # 先单独编译，再与已有规则一起编译（命名分组冲突、位置不当的内联标志等只在合并后才会报错）
+                re.compile(pattern)
+                self._compile(branches + [branch])
+            except re.error as e:
+                logger.warning(f"忽略无法编译的提交消息清理规则 {rule.get('name')}: {e}")
+                continue
+            name = rule.get('name') or f'rule_{len(self.rules)}'
+            branches.append(branch)
+            self.rules.append({'name': name, 'pattern': pattern})
+
+        self._regex = self._compile(branches) if branches else None
+        self._stats = {'activities_scanned': 0, 'commits_scanned': 0, 'commits_rewritten': 0}
+        self._rule_hits = {rule['name']: 0 for rule in self.rules}
+
+    @staticmethod
+    def _compile(branches: List[str]) -> re.Pattern:
+        """匹配包含任一规则的整行（连同行尾换行符）"""
+        return re.compile(r'^[^\n]*?(?:' + '|'.join(branches) + r')[^\n]*(?:\n|$)', re.MULTILINE)
+
+    @classmethod
+    def from_env(cls) -> "CommitScrubber":
+        """
+        从环境变量创建清理器（规则文件或其中的单条规则无效时记录警告并跳过，不影响启动）
+
+        环境变量:
+            COMMIT_SCRUB_RULES_FILE: 自定义规则JSON文件路径
+            COMMIT_SCRUB_DEFAULT_RULES: 是否保留内置规则（默认true）
+        """
+        rules = list(DEFAULT_RULES) if os.getenv('COMMIT_SCRUB_DEFAULT_RULES', 'true').lower() == 'true' else []
+        rules_file = os.getenv('COMMIT_SCRUB_RULES_FILE')
+        if rules_file:
+            try:
+                with open(rules_file, encoding='utf-8') as f:
+                    loaded = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"加载提交消息清理规则失败 {rules_file}: {e}")
+            else:
+                if isinstance(loaded, list):
+                    rules.extend(loaded)
+                else:
+                    logger.warning(f"忽略提交消息清理规则文件 {rules_file}: 顶层应为JSON列表")
+        return cls(rules)
+
+    def scrub_message(self, message: Any) -> Any:
+        """清理单条提交消息，未命中任何规则且末尾没有空白时返回原对象"""
+        if self._regex is None or not message or not isinstance(message, str):
+            return message
+
+        hits = []
+
+        def remove_line(match: re.Match) -> str:
+            hits.append(self.rules[int(match.lastgroup[1:])]['name'])
+            return ''
+
+        cleaned = self._regex.sub(remove_line, message)
+        if not hits:
+            return message if not message[-1].isspace() else message.rstrip()
+        for name in hits:
+            self._rule_hits[name] += 1
+        # 清理末尾的空行
+        return cleaned.rstrip()
+
+    def scrub_activity(self, activity: ActivityRecord) -> ActivityRecord:
+        """清理单个活动中的提交消息（写时复制，未改动时返回原对象）"""
+        self._stats['activities_scanned'] += 1
+        new_commits = None
+        for i, commit in enumerate(activity.commits):
+            self._stats['commits_scanned'] += 1
+            cleaned = self.scrub_message(commit.message)
+            if cleaned is commit.message:
+                continue
+            self._stats['commits_rewritten'] += 1
+            if new_commits is None:
+                new_commits = list(activity.commits)
+            new_commits[i] = replace(commit, message=cleaned)
+
+        if new_commits is None:
+            return activity
+        return replace(activity, commits=tuple(new_commits))
+
+    def scrub_activities(self, activities: List[ActivityRecord]) -> List[ActivityRecord]:
+        """清理活动列表，没有活动被改写时返回原列表"""
+        if not activities or self._regex is None:
+            return activities
+
+        result = None
+        for i, activity in enumerate(activities):
+            cleaned = self.scrub_activity(activity)
+            if cleaned is not activity:
+                if result is None:
+                    result = list(activities)
+                result[i] = cleaned
+        return result if result is not None else activities
+
+    def stats(self) -> Dict[str, Any]:
+        """返回清理统计信息"""
+        return dict(self._stats, rules=[rule['name'] for rule in self.rules], rule_hits=dict(self._rule_hits))
+
+
+# 进程级共享的提交消息清理器（启动时加载规则）
+commit_scrubber = CommitScrubber.from_env()
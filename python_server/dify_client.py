@@ -2,10 +2,12 @@
 Dify AI客户端模块
 """
 import json
-import requests
-from typing import List, Dict
+import httpx
+from typing import Any, AsyncIterator, List, Dict, Optional
 from fastapi import HTTPException
 from models import DifyRequest
+from dify_dispatcher import dify_dispatcher, DifySaturatedError, INTERACTIVE
+from prompt_compaction import ActivityDigest
 from logger_config import setup_logger, INFO
 import os
 from dotenv import load_dotenv
@@ -23,6 +25,79 @@ logger = setup_logger(
     filter_libs=True
 )
 
+# 提示词模板版本：修改 generate_report_prompt 的模板或活动格式时递增，使已缓存的报告失效
+PROMPT_TEMPLATE_VERSION = 3
+
+# 进程级共享的Dify异步连接池，所有报告/聊天流复用（不再为每个流占用一个线程）
+_dify_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_dify_http_client() -> httpx.AsyncClient:
+    """
+    获取（必要时创建）共享的Dify异步HTTP客户端
+    
+    环境变量:
+        DIFY_HTTP_MAX_CONNECTIONS: 最大并发连接数（默认500）
+        DIFY_HTTP_MAX_KEEPALIVE: 最大保活连接数（默认50）
+        DIFY_HTTP_CONNECT_TIMEOUT: 建立连接超时秒数（默认10）
+        DIFY_HTTP_TIMEOUT: 读取超时秒数，即两个流式块之间的最长间隔（默认120）
+    """
+    global _dify_http_client
+    if _dify_http_client is None or _dify_http_client.is_closed:
+        _dify_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv('DIFY_HTTP_MAX_CONNECTIONS', '500')),
+                max_keepalive_connections=int(os.getenv('DIFY_HTTP_MAX_KEEPALIVE', '50')),
+            ),
+            timeout=httpx.Timeout(
+                float(os.getenv('DIFY_HTTP_TIMEOUT', '120')),
+                connect=float(os.getenv('DIFY_HTTP_CONNECT_TIMEOUT', '10')),
+            ),
+        )
+    return _dify_http_client
+
+
+async def close_dify_http_client():
+    """关闭共享的Dify异步HTTP客户端（应用关闭时调用）"""
+    global _dify_http_client
+    if _dify_http_client is not None:
+        await _dify_http_client.aclose()
+        _dify_http_client = None
+
+
+# Codeup活动类型
+ACTION_NAMES = {1: '创建', 2: '更新', 5: '推送'}
+# 提示词中每条提交消息保留的最大长度
+COMMIT_MESSAGE_MAX_CHARS = 200
+
+
+def format_activity_line(activity: Dict) -> str:
+    """
+    将一条活动（ActivityRecord.to_dict() 的结构）格式化为提示词中的一行
+
+    包含时间、成员、操作、分支，以及每个提交消息的首行
+    """
+    created_at = (activity.get('createdAt') or '')[:16].replace('T', ' ')
+    user = activity.get('user') or {}
+    user_name = user.get('name') or user.get('memberName') or '未知成员'
+    action = ACTION_NAMES.get(activity.get('action'), '活动')
+    data_map = activity.get('dataMap') or {}
+    ref = (data_map.get(':ref') or '').replace('refs/heads/', '')
+    commits = data_map.get(':commits') or []
+    
+    line = f"• {created_at} {user_name} {action}"
+    if ref:
+        line += f" {ref}"
+    if commits:
+        line += f"（{len(commits)}个提交）"
+    for commit in commits:
+        message = (commit.get(':message') or '').strip().split('\n', 1)[0]
+        if message:
+            line += f"\n  - {message[:COMMIT_MESSAGE_MAX_CHARS]}"
+    if activity.get('note'):
+        line += f"\n  备注：{activity['note']}"
+    return line
+
 
 class DifyAIClient:
     """Dify AI客户端，处理AI报告生成"""
@@ -41,11 +116,17 @@ class DifyAIClient:
     
     def generate_report_prompt(self, report_type: str, activities_data: List[Dict], 
                               project_name: str, time_range_desc: str, 
-                              additional_context: str = "") -> str:
-        """根据报告类型和活动数据生成合适的提示词"""
+                              additional_context: str = "",
+                              activities_summary: Optional[str] = None) -> str:
+        """
+        根据报告类型和活动数据生成合适的提示词
+        
+        activities_summary 不为空时直接作为活动数据部分（例如分段摘要的合并结果）
+        """
         
         # 格式化活动数据
-        activities_summary = self._format_activities_for_prompt(activities_data)
+        if activities_summary is None:
+            activities_summary = self._format_activities_for_prompt(activities_data)
         
         base_context = f"""
 项目名称：{project_name}
@@ -125,82 +206,92 @@ class DifyAIClient:
         return prompt
     
     def _format_activities_for_prompt(self, activities_data: List[Dict]) -> str:
-        """将活动数据格式化为适合AI处理的文本"""
+        """将活动数据格式化为适合AI处理的文本：统计 + 按提交类型分组的去重提交（预算控制见报告流水线）"""
         if not activities_data:
             return "暂无活动数据"
         
-        formatted_activities = []
-        for activity in activities_data[:20]:  # 限制数量避免token过多
-            activity_text = f"• {activity.get('created_at', '')} - {activity.get('author_name', '')} - {activity.get('action_name', '')} - {activity.get('target_title', '')}"
-            formatted_activities.append(activity_text)
+        return ActivityDigest(activities_data).render()
+    
+    async def stream_events(self, dify_request: DifyRequest, priority: int = INTERACTIVE,
+                            owner: Optional[str] = None, admitted: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式调用Dify，逐块产出内部事件（由接口层格式化为SSE）
         
-        if len(activities_data) > 20:
-            formatted_activities.append(f"... 等共{len(activities_data)}条活动记录")
+        事件格式：
+            {'type': 'content', 'content': 增量文本}
+            {'type': 'done', 'message': ...}
+            {'type': 'error', 'message': ..., 'retry_after': 秒（仅Dify调用饱和时）}
         
-        return "\n".join(formatted_activities)
-    
-    def create_streaming_response(self, dify_request: DifyRequest):
-        """创建流式响应"""
+        调用前经调度器按优先级获取并发名额，流结束前一直占用（admitted 见 DifyDispatcher.slot）。
+        生成器被关闭（例如客户端断开）时，上游连接和名额随之释放。
+        只有收到 message_end 才产出 done；上游流未结束就中断时产出 error，避免不完整的报告被当作成功结果缓存。
+        """
+        finished = False
         try:
-            url = f"{self.base_url}/chat-messages"
-            payload = dify_request.model_dump(exclude_none=True)
-            
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                stream=True,
-                timeout=120
-            )
-            response.raise_for_status()
-            
-            # 处理流式响应
-            complete_answer = ""
-            
-            for line in response.iter_lines(decode_unicode=True):
-                if line and line.startswith('data: '):
-                    try:
-                        data = json.loads(line[6:])  # 去掉 'data: ' 前缀
-                        if data.get('event') == 'message':
+            async with dify_dispatcher.slot(priority, owner, admitted):
+                url = f"{self.base_url}/chat-messages"
+                payload = dify_request.model_dump(exclude_none=True)
+                
+                async with get_dify_http_client().stream("POST", url, headers=self.headers, json=payload) as response:
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+                    
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data: '):
+                            continue
+                        try:
+                            data = json.loads(line[6:])  # 去掉 'data: ' 前缀
+                        except json.JSONDecodeError:
+                            continue
+                        
+                        event = data.get('event')
+                        if event == 'message':
                             # answer字段本身就是增量文本，直接发送
                             incremental_text = data.get('answer', '')
                             if incremental_text:
-                                yield f"data: {json.dumps({'type': 'content', 'content': incremental_text}, ensure_ascii=False)}\n\n"
-                                complete_answer += incremental_text
-                        elif data.get('event') == 'message_end':
-                            yield f"data: {json.dumps({'type': 'done', 'message': '生成完成'}, ensure_ascii=False)}\n\n"
+                                yield {'type': 'content', 'content': incremental_text}
+                        elif event == 'message_end':
+                            finished = True
                             break
-                    except json.JSONDecodeError:
-                        continue
+                        elif event == 'error':
+                            yield {'type': 'error', 'message': f"AI报告生成失败: {data.get('message', '未知错误')}"}
+                            return
+            
+            if not finished:
+                logger.warning("Dify流在 message_end 之前结束，内容不完整")
+                yield {'type': 'error', 'message': 'AI报告生成失败: AI服务连接中断，内容不完整'}
+                return
             
             # 发送结束事件
-            yield f"data: {json.dumps({'type': 'done', 'message': 'AI报告生成完成'}, ensure_ascii=False)}\n\n"
+            yield {'type': 'done', 'message': '生成完成'}
             
-        except Exception as e:
-            error_event = {
-                'type': 'error',
-                'message': f'AI报告生成失败: {str(e)}'
-            }
-            yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
+        except DifySaturatedError as e:
+            yield {'type': 'error', 'message': str(e), 'retry_after': e.retry_after}
+        except httpx.HTTPError as e:
+            logger.error(f"Dify流式调用失败: {e}")
+            yield {'type': 'error', 'message': f'AI报告生成失败: {str(e)}'}
     
-    def create_blocking_response(self, dify_request: DifyRequest) -> Dict:
-        """创建阻塞式响应"""
-        try:
-            url = f"{self.base_url}/chat-messages"
-            payload = dify_request.model_dump(exclude_none=True)
-            payload["response_mode"] = "blocking"  # 确保使用阻塞模式
-            
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=120
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Dify API调用失败: {e}")
-            raise HTTPException(status_code=500, detail=f"AI服务调用失败: {str(e)}")
+    async def create_blocking_response(self, dify_request: DifyRequest, priority: int = INTERACTIVE,
+                                       owner: Optional[str] = None) -> Dict:
+        """
+        创建阻塞式响应（经调度器获取并发名额）
+        
+        Raises:
+            DifySaturatedError: Dify调用已饱和，由接口层返回429
+        """
+        async with dify_dispatcher.slot(priority, owner):
+            try:
+                url = f"{self.base_url}/chat-messages"
+                payload = dify_request.model_dump(exclude_none=True)
+                payload["response_mode"] = "blocking"  # 确保使用阻塞模式
+                
+                response = await get_dify_http_client().post(url, headers=self.headers, json=payload)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                logger.error(f"Dify API调用失败: {e}")
+                raise HTTPException(status_code=500, detail=f"AI服务调用失败: {str(e)}")
 
 
 # 创建Dify客户端实例
@@ -0,0 +1,207 @@
+"""
+Dify调度模块 - 按优先级排队并限制全局与单用户的Dify并发，饱和时快速拒绝
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 优先级（数值越小越优先）
+INTERACTIVE = 0  # AI聊天
+REPORT = 1       # 用户发起的报告（流式、阻塞、报告任务）
+BATCH = 2        # 定时预生成等后台批量任务
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', REPORT: 'report', BATCH: 'batch'}
+
+
+class DifySaturatedError(Exception):
+    """Dify调用已饱和（排队已满或排队超时），retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'owner', 'admitted', 'future', 'enqueued_at')
+
+    def __init__(self, priority: int, seq: int, owner: Optional[str], admitted: bool):
+        self.priority = priority
+        self.seq = seq
+        self.owner = owner
+        self.admitted = admitted
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class DifyDispatcher:
+    """
+    Dify调用调度器
+
+    每次Dify调用（流式调用持续到流结束）占用一个并发名额。名额不足时按优先级排队，
+    同一优先级先到先得；释放名额时优先唤醒高优先级的等待者。
+    为保证聊天不被报告占满，非交互调用最多使用 全局上限 - 交互预留 个名额；
+    单个用户同时占用的名额也有上限（用户已达上限时不影响其他用户的等待者）。
+    交互和报告调用在排队已满或等待超时时抛出 DifySaturatedError，由接口层返回429和Retry-After；
+    批量调用只排队等待，不计入排队上限。
+    一个报告需要多次调用Dify时（分段摘要），报告整体先通过一次 admit 准入，
+    之后的各次调用以 admitted=True 获取名额：不受单用户上限限制、不计入排队上限、不会排队超时，
+    避免已准入的报告排在自己的分段调用之后而失败。
+
+    环境变量:
+        DIFY_MAX_CONCURRENCY: 同时进行的Dify调用上限（默认8，按Dify实例的并发配额设置）
+        DIFY_MAX_CONCURRENCY_PER_USER: 单个用户同时进行的Dify调用上限（默认2）
+        DIFY_RESERVED_INTERACTIVE: 为交互调用预留的名额（默认2）
+        DIFY_MAX_QUEUE: 交互和报告调用的排队上限，超出时立即拒绝（默认50）
+        DIFY_QUEUE_TIMEOUT_SECONDS: 交互和报告调用的最长排队时间（默认30秒）
+        DIFY_RETRY_AFTER_SECONDS: 拒绝时建议的重试等待时间（默认5秒）
+    """
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv('DIFY_MAX_CONCURRENCY', '8'))
+        self.max_per_user = int(os.getenv('DIFY_MAX_CONCURRENCY_PER_USER', '2'))
+        self.reserved_interactive = int(os.getenv('DIFY_RESERVED_INTERACTIVE', '2'))
+        self.max_queue = int(os.getenv('DIFY_MAX_QUEUE', '50'))
+        self.queue_timeout = float(os.getenv('DIFY_QUEUE_TIMEOUT_SECONDS', '30'))
+        self.retry_after = int(os.getenv('DIFY_RETRY_AFTER_SECONDS', '5'))
+        self._active = 0
+        self._active_by_priority: Counter = Counter()
+        self._active_by_owner: Counter = Counter()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._stats = {name: {'admitted': 0, 'queued': 0, 'rejected': 0, 'timeouts': 0, 'max_wait_ms': 0}
+                       for name in PRIORITY_NAMES.values()}
+
+    def _limit(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.max_concurrency
+        return max(1, self.max_concurrency - self.reserved_interactive)
+
+    def _can_run(self, priority: int, owner: Optional[str], admitted: bool = False) -> bool:
+        if self._active >= self._limit(priority):
+            return False
+        return admitted or owner is None or self._active_by_owner[owner] < self.max_per_user
+
+    def _queue_depth(self) -> int:
+        """计入排队上限的等待数（不含批量调用和已准入报告的后续调用）"""
+        return sum(1 for waiter in self._waiters if waiter.priority != BATCH and not waiter.admitted)
+
+    def _grant(self, priority: int, owner: Optional[str]):
+        self._active += 1
+        self._active_by_priority[priority] += 1
+        if owner is not None:
+            self._active_by_owner[owner] += 1
+        self._stats[PRIORITY_NAMES[priority]]['admitted'] += 1
+
+    def _release(self, priority: int, owner: Optional[str]):
+        self._active -= 1
+        self._active_by_priority[priority] -= 1
+        if owner is not None:
+            self._active_by_owner[owner] -= 1
+            if self._active_by_owner[owner] <= 0:
+                del self._active_by_owner[owner]
+        self._wake()
+
+    def _wake(self):
+        """按优先级和到达顺序唤醒可以运行的等待者"""
+        for waiter in sorted(self._waiters, key=lambda item: (item.priority, item.seq)):
+            if waiter.future.done():
+                # 已超时或被取消，由等待方自行移出队列
+                continue
+            if self._can_run(waiter.priority, waiter.owner, waiter.admitted):
+                self._waiters.remove(waiter)
+                self._grant(waiter.priority, waiter.owner)
+                wait_ms = int((time.monotonic() - waiter.enqueued_at) * 1000)
+                stats = self._stats[PRIORITY_NAMES[waiter.priority]]
+                stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+                waiter.future.set_result(None)
+
+    def _reject(self, priority: int, reason: str) -> DifySaturatedError:
+        self._stats[PRIORITY_NAMES[priority]]['rejected'] += 1
+        logger.warning(f"🚦 Dify调用被拒绝（{PRIORITY_NAMES[priority]}）: {reason}")
+        return DifySaturatedError(f"AI服务繁忙，请{self.retry_after}秒后重试", self.retry_after)
+
+    def admit(self, priority: int, owner: Optional[str] = None):
+        """
+        接口层的快速准入检查：需要排队且排队已满时立即抛出 DifySaturatedError，不占用名额
+        """
+        if priority != BATCH and not self._can_run(priority, owner) and self._queue_depth() >= self.max_queue:
+            raise self._reject(priority, f"排队已满（{self.max_queue}）")
+
+    async def _acquire(self, priority: int, owner: Optional[str], admitted: bool):
+        if self._can_run(priority, owner, admitted):
+            self._grant(priority, owner)
+            return
+        patient = priority == BATCH or admitted
+        if not patient and self._queue_depth() >= self.max_queue:
+            raise self._reject(priority, f"排队已满（{self.max_queue}）")
+
+        waiter = _Waiter(priority, next(self._seq), owner, admitted)
+        self._waiters.append(waiter)
+        self._stats[PRIORITY_NAMES[priority]]['queued'] += 1
+        try:
+            if patient:
+                await waiter.future
+            else:
+                await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 取消与获得名额同时发生：归还名额
+                self._release(priority, owner)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats[PRIORITY_NAMES[priority]]['timeouts'] += 1
+                raise self._reject(priority, f"排队超过{self.queue_timeout:g}秒") from None
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE, owner: Optional[str] = None,
+                   admitted: bool = False) -> AsyncIterator[None]:
+        """
+        占用一个Dify并发名额（排队直到获得名额），退出时归还
+
+        Args:
+            priority: INTERACTIVE / REPORT / BATCH
+            owner: 用户标识（用于单用户并发上限），None表示不限
+            admitted: 是否为已通过 admit 准入的报告的后续调用（不受单用户上限和排队限制）
+
+        Raises:
+            DifySaturatedError: 交互或报告调用排队已满或排队超时
+        """
+        await self._acquire(priority, owner, admitted)
+        try:
+            yield
+        finally:
+            self._release(priority, owner)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息（含当前各优先级的运行数和排队深度）"""
+        waiting = Counter(waiter.priority for waiter in self._waiters)
+        return {
+            'active': self._active,
+            'queued': len(self._waiters),
+            'users': len(self._active_by_owner),
+            'priorities': {
+                name: dict(self._stats[name], active=self._active_by_priority[priority],
+                           waiting=waiting[priority])
+                for priority, name in PRIORITY_NAMES.items()
+            },
+            'max_concurrency': self.max_concurrency,
+            'max_per_user': self.max_per_user,
+            'reserved_interactive': self.reserved_interactive,
+            'max_queue': self.max_queue,
+        }
+
+
+# 进程级共享的Dify调度器
+dify_dispatcher = DifyDispatcher()
@@ -0,0 +1,188 @@
+"""
+Codeup元数据缓存模块 - TTL + LRU + stale-while-revalidate
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 各接口默认的新鲜期（秒），可通过 CODEUP_CACHE_TTL_<ENDPOINT大写> 覆盖
+DEFAULT_TTLS = {
+    'user_info': 600,
+    'project_counts': 60,
+    'authorized_projects': 60,
+    'project_overview': 120,
+}
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目"""
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+class MetadataCache:
+    """
+    带TTL、LRU容量上限和过期后台刷新的异步缓存
+
+    缓存键为 (login_ticket, endpoint, params)：
+    - 新鲜期内直接命中
+    - 过期但仍在stale窗口内时先返回旧值，同时在后台刷新
+    - 超过stale窗口视为未命中，同步回源
+    获取失败（返回None）的结果不会被缓存。
+    """
+
+    def __init__(self, max_entries: int = 2000, ttls: Optional[Dict[str, float]] = None,
+                 stale_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._refreshing: Dict[Tuple, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "MetadataCache":
+        """从环境变量创建缓存实例"""
+        ttls = {}
+        for endpoint in DEFAULT_TTLS:
+            value = os.getenv(f'CODEUP_CACHE_TTL_{endpoint.upper()}')
+            if value is not None:
+                ttls[endpoint] = float(value)
+        return cls(
+            max_entries=int(os.getenv('CODEUP_CACHE_MAX_ENTRIES', '2000')),
+            ttls=ttls,
+            stale_seconds=float(os.getenv('CODEUP_CACHE_STALE_SECONDS', '300')),
+        )
+
+    @staticmethod
+    def make_key(login_ticket: str, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Tuple:
+        """构建缓存键"""
+        return (login_ticket, endpoint, tuple(sorted((params or {}).items())))
+
+    def _count(self, endpoint: str, name: str):
+        counters = self._stats.setdefault(endpoint, {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'evictions': 0
+        })
+        counters[name] += 1
+
+    async def get_or_fetch(self, login_ticket: str, endpoint: str, params: Optional[Dict[str, Any]],
+                           fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        获取缓存值，未命中时调用fetcher回源
+
+        Args:
+            login_ticket: 登录凭证（缓存按用户隔离）
+            endpoint: 接口名，用于选择TTL和统计
+            params: 请求参数
+            fetcher: 回源协程工厂
+        """
+        key = self.make_key(login_ticket, endpoint, params)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                self._count(endpoint, 'hits')
+                return entry.value
+            if now < entry.stale_until:
+                self._entries.move_to_end(key)
+                self._count(endpoint, 'stale_hits')
+                self._schedule_refresh(key, endpoint, fetcher)
+                return entry.value
+
+        self._count(endpoint, 'misses')
+        value = await fetcher()
+        self._store(key, endpoint, value)
+        return value
+
+    def _store(self, key: Tuple, endpoint: str, value: Any):
+        if value is None:
+            return
+        ttl = self.ttls.get(endpoint, 60)
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value, now + ttl, now + ttl + self.stale_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._count(evicted_key[1], 'evictions')
+
+    def _schedule_refresh(self, key: Tuple, endpoint: str, fetcher: Callable[[], Awaitable[Any]]):
+        """在后台刷新过期条目，同一个键同时只刷新一次"""
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await fetcher()
+                self._store(key, endpoint, value)
+                self._count(endpoint, 'refreshes')
+            except Exception as e:
+                # 刷新失败（如凭证过期）时丢弃旧值，下次请求同步回源
+                logger.warning(f"缓存后台刷新失败 {endpoint}: {e}")
+                self._entries.pop(key, None)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(refresh())
+
+    def invalidate(self, login_ticket: Optional[str] = None, endpoint: Optional[str] = None,
+                   params: Optional[Dict[str, Any]] = None) -> int:
+        """
+        使缓存失效
+
+        Args:
+            login_ticket: 只清除该用户的条目（None表示所有用户）
+            endpoint: 只清除该接口的条目（None表示所有接口）
+            params: 与endpoint一起指定时只清除精确匹配的条目
+
+        Returns:
+            清除的条目数
+        """
+        if login_ticket is not None and endpoint is not None and params is not None:
+            return 1 if self._entries.pop(self.make_key(login_ticket, endpoint, params), None) else 0
+
+        keys = [
+            key for key in self._entries
+            if (login_ticket is None or key[0] == login_ticket)
+            and (endpoint is None or key[1] == endpoint)
+        ]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息（命中率用于调整TTL）"""
+        endpoints = {}
+        for endpoint, counters in self._stats.items():
+            lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+            endpoints[endpoint] = dict(
+                counters,
+                ttl=self.ttls.get(endpoint, 60),
+                hit_rate=round((counters['hits'] + counters['stale_hits']) / lookups, 4) if lookups else 0.0
+            )
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'stale_seconds': self.stale_seconds,
+            'refreshing': len(self._refreshing),
+            'endpoints': endpoints,
+        }
+
+
+# 进程级共享的元数据缓存实例
+metadata_cache = MetadataCache.from_env()
@@ -0,0 +1,160 @@
+"""
+提示词压缩模块 - 将活动预聚合为日期/成员/分支统计和按提交类型分组的去重提交，控制在token预算内
+"""
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# 中日韩字符（大致每个字符一个token）
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+# Conventional Commits 前缀，例如 "feat(api)!: xxx"，兼容中文冒号
+_CONVENTIONAL_PATTERN = re.compile(r'^(?P<type>[a-zA-Z]+)(?:\((?P<scope>[^)]*)\))?!?\s*[:：]\s*(?P<subject>.+)$')
+
+# 提交类型及展示顺序
+COMMIT_TYPES = {
+    'feat': '新功能',
+    'fix': '问题修复',
+    'perf': '性能优化',
+    'refactor': '重构',
+    'revert': '回滚',
+    'docs': '文档',
+    'test': '测试',
+    'style': '代码格式',
+    'build': '构建',
+    'ci': '持续集成',
+    'chore': '杂项',
+}
+OTHER_TYPE = 'other'
+
+# 提交消息截断长度与每类提交的逐级缩减上限（None表示不限）
+SUBJECT_MAX_CHARS = 120
+MESSAGE_LIMITS = (None, 40, 20, 10, 5, 3)
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的token数：中日韩字符按1个token，其余按约4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def parse_commit_subject(message: str) -> Tuple[str, str]:
+    """解析提交消息首行，返回 (提交类型, 展示用主题)；非规范格式归为 other"""
+    first_line = (message or '').strip().split('\n', 1)[0].strip()
+    match = _CONVENTIONAL_PATTERN.match(first_line)
+    if match and match.group('type').lower() in COMMIT_TYPES:
+        subject = match.group('subject').strip()
+        scope = match.group('scope')
+        if scope:
+            subject = f"[{scope}] {subject}"
+        return match.group('type').lower(), subject[:SUBJECT_MAX_CHARS]
+    return OTHER_TYPE, first_line[:SUBJECT_MAX_CHARS]
+
+
+class ActivityDigest:
+    """
+    活动摘要
+
+    一次遍历完成聚合：提交按id去重（同一提交推送到多个分支时只计入最近一次推送的分支），
+    统计每日活动与提交数、成员提交数、分支提交数，并按提交类型分组提交主题。
+    render() 按每类提交数上限输出文本，fit() 在token预算内选择尽量详细的版本。
+    """
+
+    def __init__(self, activities: List[Dict]):
+        self.activity_count = len(activities)
+        self.activities_by_day: Counter = Counter()
+        self.commits_by_day: Counter = Counter()
+        self.commits_by_author: Counter = Counter()
+        self.commits_by_branch: Counter = Counter()
+        # 类型 -> {主题: [作者, 分支, 次数]}（按时间倒序，主题相同的提交如cherry-pick合并为一条）
+        self.groups: Dict[str, Dict[str, list]] = {}
+        self.commit_count = 0
+        self.duplicate_commits = 0
+
+        seen = set()
+        for activity in activities:
+            day = (activity.get('createdAt') or '')[:10] or '未知日期'
+            user = activity.get('user') or {}
+            pusher = user.get('name') or user.get('memberName') or '未知成员'
+            data_map = activity.get('dataMap') or {}
+            branch = (data_map.get(':ref') or '').replace('refs/heads/', '') or '未知分支'
+            self.activities_by_day[day] += 1
+
+            for commit in data_map.get(':commits') or []:
+                author = (commit.get(':author') or {}).get(':name') or pusher
+                message = commit.get(':message') or ''
+                commit_key = commit.get(':id') or (author, message)
+                if commit_key in seen:
+                    self.duplicate_commits += 1
+                    continue
+                seen.add(commit_key)
+                self.commit_count += 1
+                self.commits_by_day[day] += 1
+                self.commits_by_author[author] += 1
+                self.commits_by_branch[branch] += 1
+                commit_type, subject = parse_commit_subject(message)
+                if subject:
+                    entry = self.groups.setdefault(commit_type, {}).get(subject)
+                    if entry is None:
+                        self.groups[commit_type][subject] = [author, branch, 1]
+                    else:
+                        entry[2] += 1
+
+    def statistics_text(self) -> str:
+        """统计部分：总量、每日、成员、分支"""
+        if not self.activity_count:
+            return "暂无活动数据"
+        lines = [
+            f"统计：共{self.activity_count}条活动，{self.commit_count}个提交（已去重{self.duplicate_commits}个重复提交），"
+            f"{len(self.commits_by_author)}位成员，{len(self.commits_by_branch)}个分支",
+            "每日（活动/提交）：" + "，".join(
+                f"{day[5:]} {self.activities_by_day[day]}/{self.commits_by_day[day]}"
+                for day in sorted(self.activities_by_day, reverse=True)
+            ),
+        ]
+        if self.commits_by_author:
+            lines.append("成员提交数：" + "，".join(f"{name} {count}" for name, count in self.commits_by_author.most_common()))
+        if self.commits_by_branch:
+            lines.append("分支提交数：" + "，".join(f"{name} {count}" for name, count in self.commits_by_branch.most_common()))
+        if self.groups:
+            lines.append("提交类型：" + "，".join(
+                f"{COMMIT_TYPES.get(commit_type, '其他')} {sum(entry[2] for entry in self.groups[commit_type].values())}"
+                for commit_type in self._ordered_types()
+            ))
+        return "\n".join(lines)
+
+    def _ordered_types(self) -> List[str]:
+        return [commit_type for commit_type in (*COMMIT_TYPES, OTHER_TYPE) if commit_type in self.groups]
+
+    def render(self, max_messages_per_type: Optional[int] = None) -> str:
+        """输出统计和按类型分组的提交主题，每类最多 max_messages_per_type 条（None不限）"""
+        sections = [self.statistics_text()]
+        for commit_type in self._ordered_types():
+            entries = list(self.groups[commit_type].items())
+            shown = entries if max_messages_per_type is None else entries[:max_messages_per_type]
+            lines = [f"【{COMMIT_TYPES.get(commit_type, '其他')}】"]
+            lines.extend(
+                f"- {subject}（{author}，{branch}）" + (f"×{count}" if count > 1 else "")
+                for subject, (author, branch, count) in shown
+            )
+            if len(shown) < len(entries):
+                lines.append(f"- ……另有{len(entries) - len(shown)}个同类提交")
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def fit(self, budget: int, min_messages_per_type: int = 0) -> Optional[str]:
+        """
+        在token预算内返回尽量详细的摘要
+
+        从不限条数开始逐级减少每类提交的展示条数，直到不超过预算；
+        低于 min_messages_per_type 仍超出预算时返回None（由调用方改用分段摘要）
+        """
+        for limit in MESSAGE_LIMITS:
+            if limit is not None and limit < min_messages_per_type:
+                break
+            text = self.render(limit)
+            if estimate_tokens(text) <= budget:
+                return text
+        return None
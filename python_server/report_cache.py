@@ -0,0 +1,178 @@
+"""
+AI报告缓存模块 - 按报告内容键持久化Dify生成结果（SQLite，LRU/容量淘汰）
+"""
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_key   TEXT    PRIMARY KEY,
+    project_id   INTEGER,
+    report_type  TEXT,
+    answer       TEXT    NOT NULL,
+    size         INTEGER NOT NULL,
+    created_at   REAL    NOT NULL,
+    accessed_at  REAL    NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_reports_accessed ON reports (accessed_at);
+"""
+
+
+class ReportCache:
+    """
+    AI报告的持久化缓存
+
+    键为 report_key()（报告类型、提示词模板版本、规范化的活动集合、额外上下文等的哈希），
+    活动集合或提示词模板变化时键随之变化，因此缓存条目无需过期时间；
+    超过条目数或总字节数上限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'evictions': 0}
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的报告内容，命中时刷新访问时间"""
+        row = self._conn.execute("SELECT answer FROM reports WHERE report_key = ?", (key,)).fetchone()
+        if row is None:
+            self._stats['misses'] += 1
+            return None
+        self._conn.execute(
+            "UPDATE reports SET accessed_at = ?, hits = hits + 1 WHERE report_key = ?",
+            (time.time(), key)
+        )
+        self._conn.commit()
+        self._stats['hits'] += 1
+        return row[0]
+
+    def put(self, key: str, answer: str, project_id: Optional[int] = None, report_type: Optional[str] = None):
+        """写入报告内容并按上限淘汰最久未访问的条目"""
+        if not answer:
+            return
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO reports (report_key, project_id, report_type, answer, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, project_id, report_type, answer, len(answer.encode('utf-8')), now, now)
+        )
+        self._stats['stores'] += 1
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        rows = self._conn.execute("SELECT report_key, size FROM reports ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM reports WHERE report_key = ?", (key,))
+            entries -= 1
+            total -= size
+            evicted += 1
+        self._stats['evictions'] += evicted
+        logger.debug(f"AI报告缓存淘汰 {evicted} 条")
+
+    async def record(self, key: str, events: AsyncIterator[Dict[str, Any]],
+                     project_id: Optional[int] = None, report_type: Optional[str] = None
+                     ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        透传Dify事件流，生成成功结束（done事件）时把完整内容写入缓存
+
+        出错或被取消的生成不会写入缓存。
+        """
+        parts = []
+        async for event in events:
+            if event.get('type') == 'content':
+                parts.append(event.get('content', ''))
+            elif event.get('type') == 'done':
+                self.put(key, ''.join(parts), project_id, report_type)
+            yield event
+
+    def bypass(self):
+        """记录一次跳过缓存读取的请求"""
+        self._stats['bypassed'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        lookups = self._stats['hits'] + self._stats['misses']
+        return dict(
+            self._stats,
+            db_path=self.db_path,
+            entries=entries,
+            bytes=total,
+            max_entries=self.max_entries,
+            max_bytes=self.max_bytes,
+            hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+        )
+
+
+async def replay_report(answer: str) -> AsyncIterator[Dict[str, Any]]:
+    """将缓存的报告重放为与Dify流相同的事件序列"""
+    yield {'type': 'content', 'content': answer}
+    yield {'type': 'done', 'message': '生成完成', 'cached': True}
+
+
+# 进程级共享的报告缓存实例（按需创建）
+_report_cache: Optional[ReportCache] = None
+
+
+def report_cache_enabled() -> bool:
+    """是否启用AI报告缓存（AI_REPORT_CACHE，默认true）"""
+    return os.getenv('AI_REPORT_CACHE', 'true').lower() == 'true'
+
+
+def get_report_cache() -> Optional[ReportCache]:
+    """
+    获取报告缓存实例
+
+    环境变量:
+        AI_REPORT_CACHE: 是否启用AI报告缓存（默认true）
+        AI_REPORT_CACHE_DB: SQLite数据库路径（默认data/reports.db）
+        AI_REPORT_CACHE_MAX_ENTRIES: 最大条目数（默认1000）
+        AI_REPORT_CACHE_MAX_BYTES: 报告内容总字节数上限（默认50MB）
+    """
+    global _report_cache
+    if not report_cache_enabled():
+        return None
+    if _report_cache is None:
+        _report_cache = ReportCache(
+            os.getenv('AI_REPORT_CACHE_DB', 'data/reports.db'),
+            max_entries=int(os.getenv('AI_REPORT_CACHE_MAX_ENTRIES', '1000')),
+            max_bytes=int(os.getenv('AI_REPORT_CACHE_MAX_BYTES', str(50 * 1024 * 1024))),
+        )
+    return _report_cache
+
+
+def close_report_cache():
+    """关闭报告缓存（应用关闭时调用）"""
+    global _report_cache
+    if _report_cache is not None:
+        _report_cache.close()
+        _report_cache = None
@@ -0,0 +1,94 @@
+"""
+报告广播模块 - 相同的进行中AI报告生成只调用一次Dify，结果广播给所有订阅者
+"""
+import hashlib
+import json
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from dify_client import PROMPT_TEMPLATE_VERSION
+from sse_streams import ResumableStream
+
+logger = logging.getLogger(__name__)
+
+
+def report_key(project_id: int, report_type: str, time_range: str, additional_context: str,
+               activities: List[Dict[str, Any]], prompt: Optional[str] = None) -> str:
+    """
+    计算报告的内容键
+
+    由项目、报告类型、提示词模板版本、时间范围、额外上下文和活动集合决定；活动按id排序后参与哈希，
+    与拉取顺序无关。活动集合相同即提示词相同，生成结果可以共享。
+    提示词由调用方直接给出（不经过模板）时传入 prompt。
+    """
+    payload = {
+        'project_id': project_id,
+        'report_type': report_type,
+        'template_version': PROMPT_TEMPLATE_VERSION,
+        'prompt': prompt,
+        'time_range': time_range,
+        'additional_context': additional_context or '',
+        'activities': sorted(activities, key=lambda activity: str(activity.get('id'))),
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class ReportBroadcastHub:
+    """
+    进行中的AI报告生成广播中心
+
+    第一个请求开始生成，生成期间到达的相同报告请求（报告键相同）订阅同一个生成：
+    先收到已生成的前缀，再接收实时输出。生成的完整输出保存在内存中直到结束；
+    所有订阅者都离开后立即取消生成。
+    """
+
+    def __init__(self):
+        self._live: Dict[str, ResumableStream] = {}
+        self._stats = {'started': 0, 'joined': 0, 'expired': 0}
+
+    def _prune(self):
+        for key in [key for key, stream in self._live.items() if stream.finished]:
+            del self._live[key]
+
+    def subscribe(self, key: str, start_events: Callable[[], AsyncIterator[Dict[str, Any]]],
+                  name: str = "AI报告") -> AsyncIterator[Dict[str, Any]]:
+        """
+        订阅报告生成，没有进行中的相同生成时调用 start_events() 开始新的生成
+
+        Args:
+            key: 报告键（见 report_key）
+            start_events: 开始生成的事件流工厂
+            name: 日志中的生成名称
+        """
+        self._prune()
+        stream = self._live.get(key)
+        if stream is None or stream.expired:
+            stream = ResumableStream(start_events(), name, key, buffer_size=None, grace_seconds=0,
+                                     stats=self._stats)
+            self._live[key] = stream
+            self._stats['started'] += 1
+        else:
+            self._stats['joined'] += 1
+            logger.info(f"📡 加入进行中的{name}生成（已生成 {stream.next_seq} 个事件，"
+                        f"订阅者 {stream.subscribers + 1}）")
+        return self._relay(stream)
+
+    async def _relay(self, stream: ResumableStream) -> AsyncIterator[Dict[str, Any]]:
+        async with aclosing(stream.subscribe()) as events:
+            async for _, event in events:
+                yield event
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息"""
+        self._prune()
+        return dict(
+            self._stats,
+            generating=len(self._live),
+            subscribers=sum(stream.subscribers for stream in self._live.values()),
+        )
+
+
+# 进程级共享的报告广播中心
+report_hub = ReportBroadcastHub()
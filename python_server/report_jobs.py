@@ -0,0 +1,244 @@
+"""
+AI报告任务模块 - 提交后在后台生成报告，客户端轮询或通过SSE订阅进度和结果
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import Request
+
+from codeup_client import AsyncCodeupClient
+from dify_dispatcher import REPORT
+from report_service import report_events
+from sse_streams import ResumableStream, open_subscription
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def owner_id(login_ticket: str) -> str:
+    """任务所有者标识（凭证的哈希，不保存凭证本身）"""
+    return hashlib.sha256(login_ticket.encode('utf-8')).hexdigest()
+
+
+class ReportJobQueueFullError(Exception):
+    """等待中的报告任务已达上限"""
+    pass
+
+
+class ReportJob:
+    """一个AI报告任务：参数、状态、进度和已生成的内容"""
+
+    def __init__(self, key: str, owner: str, project_id: int, report_type: str, time_range: str,
+                 additional_context: str, user: str, refresh: bool):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owner = owner
+        self.project_id = project_id
+        self.report_type = report_type
+        self.time_range = time_range
+        self.additional_context = additional_context
+        self.user = user
+        self.refresh = refresh
+        self.status = QUEUED
+        self.progress: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.cached = False
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stream: Optional[ResumableStream] = None
+        self._parts: List[str] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, CANCELLED)
+
+    @property
+    def answer(self) -> str:
+        return ''.join(self._parts)
+
+    def observe(self, event: Dict[str, Any]):
+        """根据生成事件更新任务状态"""
+        event_type = event.get('type')
+        if event_type == 'content':
+            self._parts.append(event.get('content', ''))
+        elif event_type == 'progress':
+            self.progress = {key: value for key, value in event.items() if key != 'type'}
+        elif event_type == 'done':
+            self.status = SUCCEEDED
+            self.cached = bool(event.get('cached'))
+        elif event_type == 'error':
+            self.status = FAILED
+            self.error = event.get('message')
+
+    def to_dict(self, queue_position: Optional[int] = None) -> Dict[str, Any]:
+        """任务详情（进行中时answer为已生成的部分内容）"""
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'project_id': self.project_id,
+            'report_type': self.report_type,
+            'time_range': self.time_range,
+            'progress': self.progress,
+            'answer': self.answer,
+            'cached': self.cached,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if queue_position is not None:
+            job['queue_position'] = queue_position
+        return job
+
+
+class ReportJobManager:
+    """
+    AI报告任务管理
+
+    提交的任务立即在后台排队，同时运行的任务数受并发上限控制（超出的任务按提交顺序等待），
+    结果不依赖任何HTTP连接的生命周期。同一用户参数相同且未结束的任务会合并为一个。
+    任务的全部事件保存在内存中，SSE订阅可以从头或从 Last-Event-ID 续传；结束的任务保留一段时间后清理。
+
+    环境变量:
+        AI_REPORT_JOB_CONCURRENCY: 同时运行的报告任务数上限（默认4）
+        AI_REPORT_JOB_MAX_PENDING: 未结束任务数上限，超出时拒绝提交（默认100）
+        AI_REPORT_JOB_RETENTION_SECONDS: 结束的任务保留时间（默认3600秒）
+    """
+
+    def __init__(self):
+        self.concurrency = int(os.getenv('AI_REPORT_JOB_CONCURRENCY', '4'))
+        self.max_pending = int(os.getenv('AI_REPORT_JOB_MAX_PENDING', '100'))
+        self.retention_seconds = float(os.getenv('AI_REPORT_JOB_RETENTION_SECONDS', '3600'))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._jobs: Dict[str, ReportJob] = {}
+        self._pending: Dict[str, ReportJob] = {}  # 任务键 -> 未结束的任务
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'expired': 0,
+                       SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > self.retention_seconds:
+                del self._jobs[job_id]
+
+    def submit(self, client: AsyncCodeupClient, project_id: int, report_type: str = "activity_summary",
+               time_range: str = "week", additional_context: str = "", user: str = "frontend_user",
+               refresh: bool = False) -> Tuple[ReportJob, bool]:
+        """
+        提交报告任务
+
+        Returns:
+            (任务, 是否新建)；已有相同的未结束任务时返回该任务
+
+        Raises:
+            ReportJobQueueFullError: 未结束任务数已达上限
+        """
+        self._prune()
+        owner = owner_id(client.login_ticket)
+        key = hashlib.sha256(
+            f"{owner}|{project_id}|{report_type}|{time_range}|{additional_context}|{refresh}".encode('utf-8')
+        ).hexdigest()
+
+        existing = self._pending.get(key)
+        if existing is not None and not existing.finished:
+            self._stats['deduplicated'] += 1
+            return existing, False
+        if len(self._pending) >= self.max_pending:
+            self._stats['rejected'] += 1
+            raise ReportJobQueueFullError(f"等待中的报告任务已达上限（{self.max_pending}）")
+
+        job = ReportJob(key, owner, project_id, report_type, time_range, additional_context, user, refresh)
+        self._jobs[job.id] = job
+        self._pending[key] = job
+        self._stats['submitted'] += 1
+        # 任务的事件流不因订阅者离开而取消，完整保存以便随时订阅
+        job.stream = ResumableStream(self._run(job, client), f"报告任务 {job.id}", job.id,
+                                     buffer_size=None, grace_seconds=None, stats=self._stats)
+        logger.info(f"📝 提交报告任务 {job.id}: 项目 {project_id} {report_type}/{time_range}")
+        return job, True
+
+    async def _run(self, job: ReportJob, client: AsyncCodeupClient) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            async with self._semaphore:
+                job.status = RUNNING
+                job.started_at = time.time()
+                events = report_events(client, job.project_id, job.report_type, job.time_range,
+                                       job.additional_context, job.user, job.refresh,
+                                       priority=REPORT, owner=job.owner)
+                async with aclosing(events) as events:
+                    async for event in events:
+                        job.observe(event)
+                        yield event
+        finally:
+            if not job.finished:
+                # 被取消，或事件流未以done/error结束
+                job.status = CANCELLED
+            job.finished_at = time.time()
+            self._stats[job.status] += 1
+            if self._pending.get(job.key) is job:
+                del self._pending[job.key]
+            logger.info(f"📝 报告任务 {job.id} 结束: {job.status}")
+
+    def get(self, job_id: str, login_ticket: str) -> Optional[ReportJob]:
+        """查询任务（只能查询自己提交的任务）"""
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner_id(login_ticket):
+            return None
+        return job
+
+    def queue_position(self, job: ReportJob) -> Optional[int]:
+        """排队中任务的位置（从1开始），非排队状态返回None"""
+        if job.status != QUEUED:
+            return None
+        return 1 + sum(1 for other in self._pending.values()
+                       if other.status == QUEUED and other.created_at < job.created_at)
+
+    def cancel(self, job: ReportJob) -> bool:
+        """取消未结束的任务"""
+        if job.finished or job.stream is None:
+            return False
+        job.stream.cancel()
+        return True
+
+    def events(self, request: Request, job: ReportJob) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """订阅任务的事件流（先回放已产生的事件，再接收实时事件）"""
+        return open_subscription(request, job.stream, f"报告任务 {job.id}")
+
+    def close(self):
+        """取消所有未结束的任务（应用关闭时调用）"""
+        for job in list(self._pending.values()):
+            self.cancel(job)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息"""
+        self._prune()
+        pending = list(self._pending.values())
+        return dict(
+            self._stats,
+            queued=sum(1 for job in pending if job.status == QUEUED),
+            running=sum(1 for job in pending if job.status == RUNNING),
+            retained=len(self._jobs),
+            concurrency=self.concurrency,
+            max_pending=self.max_pending,
+        )
+
+
+# 进程级共享的报告任务管理器
+report_jobs = ReportJobManager()
@@ -0,0 +1,204 @@
+"""
+AI报告生成流水线 - 活动较多时按token预算分段，并发摘要后合并生成最终报告（map-reduce）
+"""
+import asyncio
+import logging
+import os
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from dify_client import dify_client, format_activity_line
+from dify_dispatcher import dify_dispatcher, DifySaturatedError, REPORT
+from models import DifyRequest
+from prompt_compaction import ActivityDigest, estimate_tokens
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = """
+以下是项目「{project_name}」{time_range_desc}的部分代码活动记录（第{index}/{total}部分）：
+
+{activities}
+
+请提炼这部分活动的要点：主要开发内容（按功能或模块归类）、涉及的成员与分支、值得关注的问题。
+只输出要点列表，不要写开头和结尾，不超过300字。
+""".strip()
+
+
+def split_by_tokens(lines: List[str], budget: int) -> List[List[str]]:
+    """按token预算把行顺序切分为若干段（单行超出预算时独占一段）"""
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class ReportGenerationError(Exception):
+    """分段摘要失败"""
+    pass
+
+
+class ReportPipeline:
+    """
+    AI报告生成流水线
+
+    活动先预聚合为统计和按类型分组的去重提交（见 ActivityDigest），能在单次预算内容纳时直接生成；
+    否则按分段预算切分原始活动，在并发上限内向Dify请求各段摘要（map），
+    全部完成后用统计和各段摘要生成最终报告（reduce）。分段摘要期间发送 progress 事件，最终报告照常流式输出。
+
+    环境变量:
+        AI_REPORT_SINGLE_PASS_TOKENS: 提示词中活动数据部分的token预算（默认6000）
+        AI_REPORT_MIN_MESSAGES_PER_TYPE: 压缩时每类提交至少保留的条数，否则改用分段摘要（默认10）
+        AI_REPORT_CHUNK_TOKENS: 每段活动数据的token预算（默认3000）
+        AI_REPORT_MAP_CONCURRENCY: 单个报告并发摘要的段数上限（默认4）
+    """
+
+    def __init__(self):
+        self.single_pass_tokens = int(os.getenv('AI_REPORT_SINGLE_PASS_TOKENS', '6000'))
+        self.chunk_tokens = int(os.getenv('AI_REPORT_CHUNK_TOKENS', '3000'))
+        self.map_concurrency = int(os.getenv('AI_REPORT_MAP_CONCURRENCY', '4'))
+        self.min_messages_per_type = int(os.getenv('AI_REPORT_MIN_MESSAGES_PER_TYPE', '10'))
+        self._stats = {'compacted': 0, 'map_reduce': 0, 'chunks': 0, 'map_failures': 0}
+
+    async def generate(self, report_type: str, activities_data: List[Dict], project_name: str,
+                       time_range_desc: str, additional_context: str = "",
+                       inputs: Optional[Dict[str, Any]] = None, user: str = "frontend_user",
+                       priority: int = REPORT, owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        生成报告，产出与 DifyAIClient.stream_events 相同的事件，另加进度事件：
+            {'type': 'progress', 'stage': 'map'|'reduce', 'completed': n, 'total': m, 'message': ...}
+
+        priority/owner 用于Dify调度（分段摘要和最终生成的每次调用各占一个名额）。
+        分段时报告整体只准入一次，之后的各次调用不受单用户并发上限和排队超时限制。
+        """
+        digest = ActivityDigest(activities_data)
+        activities_summary = digest.fit(self.single_pass_tokens, self.min_messages_per_type)
+        admitted = False
+        if activities_summary is not None:
+            self._stats['compacted'] += 1
+        else:
+            # 压缩后仍超出预算：原始活动分段摘要，最终提示词使用统计 + 各段摘要
+            # 报告整体在此准入一次，之后的分段和最终调用不会因单用户上限排在自己的调用之后
+            try:
+                dify_dispatcher.admit(priority, owner)
+            except DifySaturatedError as e:
+                yield {'type': 'error', 'message': str(e), 'retry_after': e.retry_after}
+                return
+            admitted = True
+            lines = [format_activity_line(activity) for activity in activities_data]
+            total_tokens = sum(estimate_tokens(line) + 1 for line in lines)
+            chunks = split_by_tokens(lines, self.chunk_tokens)
+            self._stats['map_reduce'] += 1
+            self._stats['chunks'] += len(chunks)
+            logger.info(f"📚 {project_name} 活动数据约 {total_tokens} tokens，分 {len(chunks)} 段摘要后合并")
+
+            summaries: List[Optional[str]] = [None] * len(chunks)
+            try:
+                chunk_summaries = self._summarize_chunks(chunks, project_name, time_range_desc, user, priority, owner)
+                async with aclosing(chunk_summaries) as done:
+                    async for index, summary in done:
+                        summaries[index] = summary
+                        completed = sum(1 for item in summaries if item is not None)
+                        yield {'type': 'progress', 'stage': 'map', 'completed': completed, 'total': len(chunks),
+                               'message': f'正在分析活动数据（{completed}/{len(chunks)}）'}
+            except ReportGenerationError as e:
+                self._stats['map_failures'] += 1
+                yield {'type': 'error', 'message': str(e)}
+                return
+
+            yield {'type': 'progress', 'stage': 'reduce', 'completed': 0, 'total': 1, 'message': '正在汇总生成报告'}
+            activities_summary = digest.statistics_text() + "\n\n以下为按时间分段的提交摘要：\n\n" + "\n\n".join(
+                f"【第{index + 1}部分】\n{summary}" for index, summary in enumerate(summaries)
+            )
+
+        prompt = dify_client.generate_report_prompt(
+            report_type=report_type,
+            activities_data=activities_data,
+            project_name=project_name,
+            time_range_desc=time_range_desc,
+            additional_context=additional_context,
+            activities_summary=activities_summary
+        )
+        dify_request = DifyRequest(
+            query=prompt,
+            inputs=inputs or {},
+            response_mode="streaming",
+            user=user,
+            conversation_id=None,
+            files=None,
+            auto_generate_name=True,
+            workflow_id=None,
+            trace_id=None
+        )
+        async with aclosing(dify_client.stream_events(dify_request, priority, owner, admitted)) as events:
+            async for event in events:
+                yield event
+
+    async def _summarize_chunks(self, chunks: List[List[str]], project_name: str, time_range_desc: str,
+                                user: str, priority: int, owner: Optional[str]) -> AsyncIterator[Tuple[int, str]]:
+        """并发摘要各段，按完成顺序产出 (段序号, 摘要)；任一段失败时取消其余并抛出异常"""
+        semaphore = asyncio.Semaphore(self.map_concurrency)
+
+        async def summarize(index: int) -> Tuple[int, str]:
+            async with semaphore:
+                prompt = MAP_PROMPT.format(project_name=project_name, time_range_desc=time_range_desc,
+                                           index=index + 1, total=len(chunks), activities="\n".join(chunks[index]))
+                return index, await self._complete(prompt, user, priority, owner, admitted=True)
+
+        tasks = [asyncio.ensure_future(summarize(index)) for index in range(len(chunks))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _complete(self, prompt: str, user: str, priority: int = REPORT, owner: Optional[str] = None,
+                        admitted: bool = False) -> str:
+        """流式调用Dify并收集完整回答"""
+        dify_request = DifyRequest(
+            query=prompt,
+            inputs={},
+            response_mode="streaming",
+            user=user,
+            conversation_id=None,
+            files=None,
+            auto_generate_name=False,
+            workflow_id=None,
+            trace_id=None
+        )
+        parts = []
+        async with aclosing(dify_client.stream_events(dify_request, priority, owner, admitted)) as events:
+            async for event in events:
+                if event['type'] == 'content':
+                    parts.append(event['content'])
+                elif event['type'] == 'error':
+                    raise ReportGenerationError(event.get('message', '分段摘要失败'))
+        return ''.join(parts).strip()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息"""
+        return dict(
+            self._stats,
+            single_pass_tokens=self.single_pass_tokens,
+            min_messages_per_type=self.min_messages_per_type,
+            chunk_tokens=self.chunk_tokens,
+            map_concurrency=self.map_concurrency,
+        )
+
+
+# 进程级共享的报告生成流水线
+report_pipeline = ReportPipeline()
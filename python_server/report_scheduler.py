@@ -0,0 +1,234 @@
+"""
+报告预生成调度模块 - 在低峰时段为已登记的用户批量预生成本周报告，写入报告缓存
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from activity_records import codeup_now
+from codeup_client import AuthenticationError
+from dify_dispatcher import BATCH
+from report_cache import report_cache_enabled
+from report_jobs import owner_id
+from report_service import fetch_report_activities, generate_report
+from utils import get_client
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def batch_owner(login_ticket: str) -> str:
+    """预生成任务在Dify调度中的用户标识（与交互请求分开计算单用户并发上限）"""
+    return f"batch:{owner_id(login_ticket)}"
+
+
+@dataclass
+class ScheduleRegistration:
+    """一个登记预生成的用户（凭证只保存在内存中）"""
+    login_ticket: str
+    report_types: List[str]
+    user: str = "frontend_user"
+    registered_at: float = field(default_factory=time.time)
+    last_run_at: Optional[float] = None
+    last_result: Optional[Dict[str, Any]] = None
+    running: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'report_types': self.report_types,
+            'user': self.user,
+            'registered_at': self.registered_at,
+            'last_run_at': self.last_run_at,
+            'last_result': self.last_result,
+            'running': self.running,
+        }
+
+
+class ReportScheduler:
+    """
+    本周报告预生成调度器
+
+    每周在指定的北京时间（默认周五7点）为所有登记的用户执行一次：
+    列出用户的全部项目，在并发上限内拉取各项目本周的个人活动，跳过没有活动的项目，
+    为其余项目生成报告并写入报告缓存（已缓存的直接跳过）。
+    之后相同的交互式报告请求直接命中缓存。Dify调用使用最低的批量优先级，不挤占聊天和用户发起的报告；
+    单用户并发按独立的预生成标识计算，不占用该用户交互请求的名额。凭证失效时立即停止其余项目。
+    预生成的结果只能通过报告缓存被使用，未启用报告缓存（AI_REPORT_CACHE=false）时调度不会启用。
+
+    环境变量:
+        AI_REPORT_SCHEDULE: 是否启用定时预生成（默认true，需同时启用AI_REPORT_CACHE）
+        AI_REPORT_SCHEDULE_WEEKDAY: 执行的星期，0为周一（默认4，周五）
+        AI_REPORT_SCHEDULE_HOUR: 执行的整点（北京时间，默认7）
+        AI_REPORT_SCHEDULE_CONCURRENCY: 同时处理的项目数上限（默认3）
+    """
+
+    def __init__(self):
+        self.requested = os.getenv('AI_REPORT_SCHEDULE', 'true').lower() == 'true'
+        self.cache_enabled = report_cache_enabled()
+        self.enabled = self.requested and self.cache_enabled
+        self.weekday = int(os.getenv('AI_REPORT_SCHEDULE_WEEKDAY', '4'))
+        self.hour = int(os.getenv('AI_REPORT_SCHEDULE_HOUR', '7'))
+        self.concurrency = int(os.getenv('AI_REPORT_SCHEDULE_CONCURRENCY', '3'))
+        self._registrations: Dict[str, ScheduleRegistration] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._manual_runs: set = set()
+        self._stats = {'runs': 0, 'projects': 0, 'skipped': 0, 'generated': 0, 'cached': 0, 'failed': 0}
+
+    def register(self, login_ticket: str, report_types: Optional[List[str]] = None,
+                 user: str = "frontend_user") -> ScheduleRegistration:
+        """登记（或更新）用户的预生成设置"""
+        registration = ScheduleRegistration(login_ticket, report_types or ['activity_summary'], user)
+        previous = self._registrations.get(owner_id(login_ticket))
+        if previous is not None:
+            registration.last_run_at = previous.last_run_at
+            registration.last_result = previous.last_result
+        self._registrations[owner_id(login_ticket)] = registration
+        return registration
+
+    def unregister(self, login_ticket: str) -> bool:
+        """取消登记"""
+        return self._registrations.pop(owner_id(login_ticket), None) is not None
+
+    def get(self, login_ticket: str) -> Optional[ScheduleRegistration]:
+        return self._registrations.get(owner_id(login_ticket))
+
+    def next_run(self, now: Optional[datetime] = None) -> datetime:
+        """下一次执行时间（北京时间）"""
+        now = now or codeup_now()
+        candidate = now.replace(hour=self.hour, minute=0, second=0, microsecond=0) \
+            + timedelta(days=(self.weekday - now.weekday()) % 7)
+        if candidate <= now:
+            candidate += timedelta(days=7)
+        return candidate
+
+    def start(self):
+        """启动调度循环（应用启动时调用）"""
+        if self.requested and not self.cache_enabled:
+            logger.warning("⏰ 未启用AI报告缓存（AI_REPORT_CACHE=false），预生成的报告无法保存，报告预生成已禁用")
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+            logger.info(f"⏰ 报告预生成调度已启动，下次执行: {self.next_run().strftime('%Y-%m-%d %H:%M')}")
+
+    def run_soon(self, registration: ScheduleRegistration):
+        """立即在后台为一个用户执行一次预生成（不等待下一次定时执行）"""
+        task = asyncio.ensure_future(self.run(registration))
+        self._manual_runs.add(task)
+        task.add_done_callback(self._manual_runs.discard)
+
+    async def close(self):
+        """停止调度循环和进行中的预生成（应用关闭时调用）"""
+        tasks = list(self._manual_runs)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(max(0.0, (self.next_run() - codeup_now()).total_seconds()))
+            await self.run_all()
+            # 避免在同一整点内重复执行
+            await asyncio.sleep(1)
+
+    async def run_all(self):
+        """为所有登记的用户执行一次预生成（逐个用户执行，避免同时占满Dify）"""
+        logger.info(f"⏰ 开始预生成本周报告，共 {len(self._registrations)} 个用户")
+        for registration in list(self._registrations.values()):
+            await self.run(registration)
+
+    async def run(self, registration: ScheduleRegistration) -> Dict[str, Any]:
+        """为一个用户预生成本周报告，返回本次结果统计"""
+        if registration.running:
+            return registration.last_result or {}
+        registration.running = True
+        started_at = time.time()
+        result = {'projects': 0, 'skipped': 0, 'generated': 0, 'cached': 0, 'failed': 0, 'error': None}
+        client = get_client(registration.login_ticket)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(project: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    outcome = await self._pregenerate_project(client, project, registration)
+                except AuthenticationError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"⏰ 项目 {project.get('name')} 预生成失败: {e}")
+                    outcome = {'failed': 1}
+                for name, count in outcome.items():
+                    result[name] += count
+
+        try:
+            self._stats['runs'] += 1
+            projects = await client.get_all_projects()
+            result['projects'] = len(projects)
+            tasks = [asyncio.ensure_future(process(project)) for project in projects]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # 凭证失效（或本次执行被取消）时停止其余项目，等待其结束后再保存结果
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except AuthenticationError as e:
+            result['error'] = f'认证失败: {str(e)}'
+            logger.warning(f"⏰ 预生成失败，凭证已失效: {e}")
+        finally:
+            registration.running = False
+            registration.last_run_at = started_at
+            registration.last_result = result
+            for name in ('projects', 'skipped', 'generated', 'cached', 'failed'):
+                self._stats[name] += result[name]
+
+        logger.info(f"⏰ 预生成完成（{time.time() - started_at:.1f}s）: {result}")
+        return result
+
+    async def _pregenerate_project(self, client, project: Dict[str, Any],
+                                   registration: ScheduleRegistration) -> Dict[str, int]:
+        project_id = project.get('id')
+        project_name = project.get('name', f'Project-{project_id}')
+        outcome = {'skipped': 0, 'generated': 0, 'cached': 0, 'failed': 0}
+        # 与交互式报告使用相同的活动拉取方式（本周、当前用户，即 get_week_activities），保证报告键一致
+        activities_data, time_range_desc = await fetch_report_activities(client, project_id, 'week')
+        if not activities_data:
+            outcome['skipped'] += 1
+            return outcome
+
+        for report_type in registration.report_types:
+            events = generate_report(project_id, project_name, report_type, 'week', time_range_desc,
+                                     activities_data, user=registration.user,
+                                     priority=BATCH, owner=batch_owner(registration.login_ticket))
+            status = 'failed'
+            async with aclosing(events) as events:
+                async for event in events:
+                    if event['type'] == 'done':
+                        status = 'cached' if event.get('cached') else 'generated'
+                    elif event['type'] == 'error':
+                        logger.warning(f"⏰ 项目 {project_name} 报告预生成失败: {event.get('message')}")
+            outcome[status] += 1
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息"""
+        return dict(
+            self._stats,
+            enabled=self.enabled,
+            cache_enabled=self.cache_enabled,
+            registered=len(self._registrations),
+            next_run=self.next_run().strftime('%Y-%m-%d %H:%M') if self.enabled else None,
+            concurrency=self.concurrency,
+        )
+
+
+# 进程级共享的报告预生成调度器
+report_scheduler = ReportScheduler()
@@ -0,0 +1,143 @@
+"""
+AI报告服务模块 - 拉取活动、命中缓存或生成报告的完整流程（流式接口、报告任务和定时预生成共用）
+"""
+import asyncio
+import logging
+from contextlib import aclosing
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from activity_records import codeup_now
+from codeup_client import AsyncCodeupClient, AuthenticationError
+from dify_dispatcher import REPORT
+from report_cache import get_report_cache, replay_report
+from report_hub import report_hub, report_key
+from report_pipeline import report_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def report_time_range(client: AsyncCodeupClient, time_range: str) -> Tuple[datetime, datetime, str]:
+    """根据时间范围返回 (开始时间, 结束时间, 描述)，未知的时间范围按本周处理"""
+    if time_range == "today":
+        start_dt = codeup_now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return start_dt, start_dt.replace(hour=23, minute=59, second=59), "今日"
+    if time_range == "month":
+        start_dt, end_dt = client.month_range()
+        return start_dt, end_dt, "本月"
+    # 默认使用本周数据
+    start_dt, end_dt = client.week_range()
+    return start_dt, end_dt, "本周"
+
+
+async def fetch_report_activities(client: AsyncCodeupClient, project_id: int, time_range: str
+                                  ) -> Tuple[List[Dict[str, Any]], str]:
+    """拉取报告需要的当前用户活动（不需要项目概览），返回 (活动列表, 时间范围描述)"""
+    start_dt, end_dt, time_range_desc = report_time_range(client, time_range)
+    if time_range not in ("today", "month"):
+        # 本周报告与预生成调度共用 get_week_activities，保证活动集合（即报告键）一致
+        result = await client.get_week_activities(project_id, filter_by_user=True, include_overview=False)
+        return result.get('activities', []), time_range_desc
+    result = await client.get_project_activities(
+        project_id=project_id,
+        start_date=start_dt,
+        end_date=end_dt,
+        per_page=100,
+        filter_by_user=True,
+        include_overview=False
+    )
+    return result.get('activities', []), time_range_desc
+
+
+def generate_report(project_id: int, project_name: str, report_type: str, time_range: str,
+                    time_range_desc: str, activities_data: List[Dict[str, Any]],
+                    additional_context: str = "", user: str = "frontend_user",
+                    refresh: bool = False, priority: int = REPORT,
+                    owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    基于已拉取的活动生成报告事件流
+
+    命中报告缓存时直接重放；否则加入进行中的相同生成，或通过报告流水线开始新的生成并写入缓存。
+    priority/owner 为新生成调用Dify时的调度优先级和用户标识（加入进行中的生成时沿用其设置）。
+    """
+    key = report_key(project_id, report_type, time_range, additional_context, activities_data)
+    report_cache = get_report_cache()
+    if report_cache and refresh:
+        report_cache.bypass()
+    cached_answer = report_cache.get(key) if report_cache and not refresh else None
+
+    if cached_answer is not None:
+        # 相同活动集合的报告已生成过，直接重放缓存
+        logger.info(f"📦 命中AI报告缓存: 项目 {project_name}")
+        return replay_report(cached_answer)
+
+    def start_generation():
+        # 活动较多时流水线会分段摘要后再合并生成
+        events = report_pipeline.generate(
+            report_type=report_type,
+            activities_data=activities_data,
+            project_name=project_name,
+            time_range_desc=time_range_desc,
+            additional_context=additional_context,
+            inputs={
+                "project_name": project_name,
+                "project_id": str(project_id),
+                "report_type": report_type,
+                "time_range": time_range_desc,
+                "activities_count": len(activities_data)
+            },
+            user=user,
+            priority=priority,
+            owner=owner
+        )
+        if report_cache:
+            events = report_cache.record(key, events, project_id, report_type)
+        return events
+
+    # 相同报告正在生成时直接订阅，不重复调用Dify
+    return report_hub.subscribe(key, start_generation, f"项目 {project_name} 的AI报告")
+
+
+async def report_events(client: AsyncCodeupClient, project_id: int, report_type: str = "activity_summary",
+                        time_range: str = "week", additional_context: str = "",
+                        user: str = "frontend_user", refresh: bool = False,
+                        project_info: Optional[Dict[str, Any]] = None, priority: int = REPORT,
+                        owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    完整的报告流程：拉取项目信息和活动后生成报告，失败时产出 error 事件
+
+    Args:
+        project_info: 已知的项目信息（为None时从授权项目列表中查找）
+        priority: Dify调度优先级
+        owner: Dify调度的用户标识（单用户并发上限）
+    """
+    try:
+        if project_info is None:
+            # 项目信息与活动数据互不依赖，并发获取
+            projects, (activities_data, time_range_desc) = await asyncio.gather(
+                client.get_authorized_projects(per_page=100),
+                fetch_report_activities(client, project_id, time_range)
+            )
+            for project in projects or []:
+                if project.get('id') == project_id:
+                    project_info = project
+                    break
+            if not project_info:
+                yield {'type': 'error', 'message': f'项目 {project_id} 未找到或无权限访问'}
+                return
+        else:
+            activities_data, time_range_desc = await fetch_report_activities(client, project_id, time_range)
+
+        project_name = project_info.get('name', f'Project-{project_id}')
+        events = generate_report(project_id, project_name, report_type, time_range, time_range_desc,
+                                 activities_data, additional_context, user, refresh, priority, owner)
+        async with aclosing(events) as events:
+            async for event in events:
+                yield event
+
+    except AuthenticationError as e:
+        yield {'type': 'error', 'message': f'认证失败: {str(e)}'}
+
+    except Exception as e:
+        logger.error(f"AI报告生成失败: {str(e)}", exc_info=True)
+        yield {'type': 'error', 'message': f'服务器错误: {str(e)}'}
@@ -0,0 +1,67 @@
+"""
+请求合并模块 - 相同的并发上游请求只发送一次
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求（single-flight）
+
+    同一个键同时只会有一个请求在途，后到的调用方等待并共享同一个结果
+    （包括异常）。返回的对象被多个调用方共享，调用方不应原地修改。
+    部分调用方被取消不会影响在途请求，其余调用方仍能拿到结果；
+    最后一个调用方也被取消时（例如SSE客户端断开）在途请求随之取消，不再为无人等待的结果占用上游。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入一个在途请求
+
+        Args:
+            key: 请求键（需包含凭证范围，避免跨用户共享结果）
+            fn: 实际发起请求的协程工厂
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters[key] - 1
+            if remaining:
+                self._waiters[key] = remaining
+            else:
+                del self._waiters[key]
+                if not task.done():
+                    # 没有调用方在等待（全部被取消）：取消在途请求，之后的相同请求重新发起
+                    self._calls.pop(key, None)
+                    task.cancel()
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有调用方都已取消时，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """返回合并统计信息"""
+        return {'in_flight': len(self._calls), 'leaders': self.leaders, 'coalesced': self.coalesced}
+
+
+# 进程级共享的Codeup上游请求合并器
+codeup_singleflight = SingleFlight()
@@ -0,0 +1,403 @@
+"""
+SSE流管理模块 - 客户端断开检测与上游取消、可续传的AI流（Last-Event-ID回放）
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import Request
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class StreamStats:
+    """AI流式响应统计"""
+
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.active = 0
+        self.content_events = 0
+        self.content_frames = 0
+
+    def stats(self) -> Dict[str, int]:
+        """返回统计信息"""
+        return {
+            'started': self.started,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+            'active': self.active,
+            'content_events': self.content_events,
+            'content_frames': self.content_frames,
+        }
+
+
+# 进程级共享的流统计
+stream_stats = StreamStats()
+
+
+def disconnect_poll_interval() -> float:
+    """检测客户端断开的轮询间隔（秒）"""
+    return float(os.getenv('SSE_DISCONNECT_POLL_SECONDS', '1'))
+
+
+def coalesce_settings() -> Tuple[float, int]:
+    """增量文本合并的时间窗口（秒）与字节阈值"""
+    return float(os.getenv('SSE_COALESCE_MS', '50')) / 1000, int(os.getenv('SSE_COALESCE_BYTES', '2048'))
+
+
+async def _wait_disconnected(request: Request, interval: float):
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+async def cancel_on_disconnect(request: Request, events: AsyncIterator[Any],
+                               name: str = "AI流") -> AsyncIterator[Any]:
+    """
+    转发事件流，客户端断开时取消上游
+
+    上游的每一步（Codeup活动拉取、Dify流读取）都与断开检测竞争，
+    一旦检测到断开（或响应任务被取消），立即取消正在等待的上游步骤并关闭事件生成器，
+    从而释放Dify连接、停止剩余的Codeup分页请求。
+
+    Args:
+        request: 当前请求（用于检测断开）
+        events: 上游事件生成器
+        name: 日志中的流名称
+    """
+    stream_stats.started += 1
+    stream_stats.active += 1
+    iterator = events.__aiter__()
+    watcher = asyncio.ensure_future(_wait_disconnected(request, disconnect_poll_interval()))
+    pending = None
+    outcome = 'cancelled'
+    try:
+        while True:
+            pending = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({pending, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not pending.done():
+                logger.info(f"🔌 客户端已断开，结束{name}连接")
+                break
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                outcome = 'completed'
+                break
+            yield event
+    except Exception:
+        outcome = 'failed'
+        raise
+    finally:
+        stream_stats.active -= 1
+        setattr(stream_stats, outcome, getattr(stream_stats, outcome) + 1)
+        watcher.cancel()
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        await iterator.aclose()
+
+
+async def coalesce_content(events: AsyncIterator[Tuple[Optional[str], Dict[str, Any]]],
+                           interval: Optional[float] = None, max_bytes: Optional[int] = None
+                           ) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    合并连续的增量文本事件
+
+    Dify的每个message事件往往只有一个token，逐个发送时每个token都是一次JSON编码和一次写操作。
+    连续的content事件在时间窗口内合并为一帧（事件id取合并的最后一个），
+    累计超过字节阈值时立即发送；done、error等其他事件到达时先发送已合并的内容再原样转发。
+    时间窗口为0时不合并。
+    """
+    default_interval, default_max_bytes = coalesce_settings()
+    interval = default_interval if interval is None else interval
+    max_bytes = default_max_bytes if max_bytes is None else max_bytes
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    pending = None
+    parts = []
+    size = 0
+    last_id = None
+    deadline = 0.0
+
+    def flush() -> Tuple[Optional[str], Dict[str, Any]]:
+        nonlocal parts, size
+        stream_stats.content_frames += 1
+        frame = (last_id, {'type': 'content', 'content': ''.join(parts)})
+        parts, size = [], 0
+        return frame
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # 有待发送内容时最多等到窗口结束；等待超时不取消上游步骤，下一轮继续等待
+            timeout = max(0.0, deadline - loop.time()) if parts else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield flush()
+                continue
+            task, pending = pending, None
+            try:
+                event_id, event = task.result()
+            except StopAsyncIteration:
+                break
+
+            if event.get('type') == 'content' and interval > 0:
+                stream_stats.content_events += 1
+                if not parts:
+                    deadline = loop.time() + interval
+                content = event.get('content', '')
+                parts.append(content)
+                size += len(content.encode('utf-8'))
+                last_id = event_id
+                if size >= max_bytes:
+                    yield flush()
+                continue
+
+            if parts:
+                yield flush()
+            if event.get('type') == 'content':
+                stream_stats.content_events += 1
+                stream_stats.content_frames += 1
+            yield event_id, event
+        if parts:
+            yield flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        await iterator.aclose()
+
+
+class ResumableStream:
+    """
+    可续传的AI流
+
+    上游事件生成器在后台任务中运行，每个事件分配递增序号并写入有界回放缓冲；
+    连接只是订阅者，断开后生成继续，在宽限期内带 Last-Event-ID 重连即可回放错过的事件并接上实时输出。
+    宽限期内没有订阅者重连时取消生成，释放Dify连接（grace_seconds为None时不因无订阅者而取消）。
+    """
+
+    def __init__(self, events: AsyncIterator[Dict[str, Any]], name: str, scope: str,
+                 buffer_size: Optional[int], grace_seconds: Optional[float], stats: Dict[str, int]):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.scope = scope
+        self.grace_seconds = grace_seconds
+        self.buffer: deque = deque(maxlen=buffer_size)  # [(序号, 事件), ...]，buffer_size为None时不限长度
+        self.next_seq = 0
+        self.subscribers = 0
+        self.finished_at: Optional[float] = None
+        self.expired = False
+        self._stats = stats
+        self._changed = asyncio.Event()
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self._task = asyncio.ensure_future(self._run(events))
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.id}:{seq}"
+
+    def seq_from_event_id(self, last_event_id: Optional[str]) -> int:
+        """从本流的 Last-Event-ID 解析已收到的最后序号，不属于本流时返回-1（从头回放）"""
+        stream_id, _, seq = (last_event_id or '').partition(':')
+        return int(seq) if stream_id == self.id and seq.isdigit() else -1
+
+    def _append(self, event: Dict[str, Any]):
+        self.buffer.append((self.next_seq, event))
+        self.next_seq += 1
+        # 唤醒所有等待中的订阅者，后续等待使用新的事件对象
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, events: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for event in events:
+                self._append(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"{self.name}生成失败: {e}", exc_info=True)
+            self._append({'type': 'error', 'message': f'服务器错误: {str(e)}'})
+        finally:
+            self.finished_at = time.monotonic()
+            self._changed.set()
+            await events.aclose()
+
+    def _expire(self):
+        self._grace_handle = None
+        if self.subscribers == 0 and not self.finished:
+            logger.info(f"🔌 {self.grace_seconds:g}秒内无客户端重连，取消{self.name}")
+            self.expired = True
+            self._stats['expired'] += 1
+            self._task.cancel()
+
+    def cancel(self):
+        """立即取消生成（应用关闭时使用）"""
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+        self._task.cancel()
+
+    async def subscribe(self, after_seq: int = -1) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        订阅事件流：先回放序号大于 after_seq 的缓冲事件，再接收实时事件，生成结束后返回
+
+        Yields:
+            (事件id, 事件)
+        """
+        self.subscribers += 1
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+        try:
+            seq = after_seq + 1
+            while True:
+                first = self.buffer[0][0] if self.buffer else self.next_seq
+                if seq < first:
+                    # 需要的事件已被挤出回放缓冲，无法保证内容完整
+                    logger.warning(f"{self.name}回放缓冲已不包含事件 {seq}（最早 {first}）")
+                    yield None, {'type': 'error', 'message': '断线期间的内容已超出缓存，请重新生成'}
+                    return
+                if seq < self.next_seq:
+                    # 逐条按序号取，yield期间缓冲可能追加或挤出旧事件
+                    event_seq, event = self.buffer[seq - first]
+                    seq += 1
+                    yield self.event_id(event_seq), event
+                    continue
+                if self.finished:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self.grace_seconds is not None:
+                self._grace_handle = asyncio.get_running_loop().call_later(self.grace_seconds, self._expire)
+
+
+# 无法续传时发送的重置事件：客户端应清空已显示的内容，再以新连接（不带Last-Event-ID）重新开始
+RESET_MESSAGE = '断线时间过长，已无法续传，需要重新生成'
+
+
+async def reset_events() -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """只包含一个 reset 事件的流（不带事件id）"""
+    yield None, {'type': 'reset', 'message': RESET_MESSAGE}
+
+
+def open_subscription(request: Request, stream: ResumableStream,
+                      name: str = "AI流") -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """为已有的流打开一个带事件id的SSE订阅（按请求的Last-Event-ID续传），断开时只结束订阅"""
+    after_seq = stream.seq_from_event_id(request.headers.get('last-event-id'))
+    return coalesce_content(cancel_on_disconnect(request, stream.subscribe(after_seq), name))
+
+
+class ResumableStreams:
+    """
+    可续传AI流的注册表
+
+    环境变量:
+        SSE_REPLAY_BUFFER_EVENTS: 每个流的回放缓冲事件数（默认2000）
+        SSE_RESUME_GRACE_SECONDS: 客户端断开后保留生成等待重连的时间（默认15秒）
+        SSE_RESUME_RETENTION_SECONDS: 生成结束后保留回放缓冲的时间（默认60秒）
+    """
+
+    def __init__(self):
+        self.buffer_size = int(os.getenv('SSE_REPLAY_BUFFER_EVENTS', '2000'))
+        self.grace_seconds = float(os.getenv('SSE_RESUME_GRACE_SECONDS', '15'))
+        self.retention_seconds = float(os.getenv('SSE_RESUME_RETENTION_SECONDS', '60'))
+        self._streams: Dict[str, ResumableStream] = {}
+        self._stats = {'started': 0, 'resumed': 0, 'resume_misses': 0, 'expired': 0}
+
+    def _prune(self):
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.finished and now - stream.finished_at > self.retention_seconds:
+                del self._streams[stream_id]
+
+    def start(self, events: AsyncIterator[Dict[str, Any]], name: str, scope: str) -> ResumableStream:
+        """在后台开始一次生成"""
+        self._prune()
+        stream = ResumableStream(events, name, scope, self.buffer_size, self.grace_seconds, self._stats)
+        self._streams[stream.id] = stream
+        self._stats['started'] += 1
+        return stream
+
+    def resume(self, last_event_id: Optional[str], scope: str) -> Optional[Tuple[ResumableStream, int]]:
+        """
+        根据 Last-Event-ID 找回仍在保留期内的流
+
+        只有同一请求地址（scope）发起的重连才能接上，返回 (流, 已收到的最后序号)，找不到时返回None
+        """
+        if not last_event_id:
+            return None
+        self._prune()
+        stream_id, _, seq = last_event_id.partition(':')
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.scope != scope or stream.expired or not seq.isdigit():
+            self._stats['resume_misses'] += 1
+            return None
+        self._stats['resumed'] += 1
+        return stream, int(seq)
+
+    def open(self, request: Request, start_events: Callable[[], AsyncIterator[Dict[str, Any]]],
+             name: str = "AI流") -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        打开一个带事件id的AI流连接
+
+        请求携带有效的 Last-Event-ID 时接上原来的生成并回放错过的事件；
+        携带的 Last-Event-ID 已无法续传（流已过期或未知）时只发送 reset 事件，不会悄悄从头重新生成，
+        以免客户端把新内容拼接在已显示的部分内容之后；不带 Last-Event-ID 时调用 start_events() 开始新的生成。
+        连接断开只结束订阅，由宽限期决定是否取消生成。
+        输出的增量文本按时间窗口合并（见 coalesce_content）。
+        """
+        scope = str(request.url)
+        last_event_id = request.headers.get('last-event-id')
+        resumed = self.resume(last_event_id, scope)
+        if resumed is not None:
+            stream, after_seq = resumed
+            logger.info(f"🔁 客户端重连，从事件 {after_seq + 1} 续传{stream.name}")
+        elif last_event_id:
+            logger.info(f"🔁 客户端重连但{name}已无法续传，通知客户端重新开始")
+            return reset_events()
+        else:
+            stream, after_seq = self.start(start_events(), name, scope), -1
+        return coalesce_content(cancel_on_disconnect(request, stream.subscribe(after_seq), name))
+
+    def close(self):
+        """取消所有进行中的生成"""
+        for stream in self._streams.values():
+            stream.cancel()
+        self._streams.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回统计信息"""
+        self._prune()
+        return dict(
+            self._stats,
+            streams=len(self._streams),
+            generating=sum(1 for stream in self._streams.values() if not stream.finished),
+            buffer_size=self.buffer_size,
+            grace_seconds=self.grace_seconds,
+        )
+
+
+# 进程级共享的可续传流注册表
+resumable_streams = ResumableStreams()
@@ -0,0 +1,10 @@
+"""
+测试公共配置：将 python_server 加入导入路径，并提供不依赖外部服务的环境变量
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# dify_client 导入时要求配置API Key，测试中不会真正请求Dify
+os.environ.setdefault('DIFY_API_KEY', 'test-key')
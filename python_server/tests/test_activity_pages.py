@@ -0,0 +1,119 @@
+"""
+活动页定位测试：PageProber 的指数+二分探测与按时间窗口拉取
+"""
+import asyncio
+
+import pytest
+
+from activity_pages import PageProber, fetch_activity_window
+from activity_records import ActivityRecord
+
+PER_PAGE = 10
+NEWEST = 1_000_000
+
+
+def make_feed(count):
+    """按时间倒序的活动流，相邻活动间隔60秒"""
+    return [ActivityRecord(id=count - i, created_at='', epoch=NEWEST - 60 * i, action=5, user_name='alice')
+            for i in range(count)]
+
+
+def paged(feed):
+    requested = []
+
+    async def fetch_page(page, per_page):
+        requested.append(page)
+        return feed[(page - 1) * per_page:page * per_page]
+
+    return fetch_page, requested
+
+
+def first_page_linear(feed, predicate):
+    page = 1
+    while True:
+        data = feed[(page - 1) * PER_PAGE:page * PER_PAGE]
+        if predicate(data):
+            return page
+        page += 1
+
+
+def older_than(ts):
+    return lambda data: not data or data[-1].epoch < ts
+
+
+def window(feed, start_ts, end_ts):
+    return [activity.id for activity in feed if start_ts <= activity.epoch <= end_ts]
+
+
+def run_window(feed, start_ts, end_ts):
+    fetch_page, requested = paged(feed)
+    result = asyncio.run(fetch_activity_window(fetch_page, start_ts, end_ts, per_page=PER_PAGE, concurrency=2))
+    return [activity.id for activity in result], requested
+
+
+@pytest.mark.parametrize('count', [1, 10, 95, 100, 101])
+def test_first_page_where_matches_linear_scan(count):
+    feed = make_feed(count)
+    for index in range(count):
+        predicate = older_than(feed[index].epoch + 1)
+        prober = PageProber(paged(feed)[0], PER_PAGE)
+        assert asyncio.run(prober.first_page_where(predicate)) == first_page_linear(feed, predicate), index
+
+
+def test_boundary_on_first_page():
+    feed = make_feed(95)
+    fetch_page, requested = paged(feed)
+    page = asyncio.run(PageProber(fetch_page, PER_PAGE).first_page_where(older_than(NEWEST)))
+    assert page == 1
+    assert requested == [1]
+
+
+def test_boundary_on_last_page():
+    feed = make_feed(95)
+    prober = PageProber(paged(feed)[0], PER_PAGE)
+    page = asyncio.run(prober.first_page_where(older_than(feed[-1].epoch + 1)))
+    assert page == 10
+    # 指数探测 + 二分，远少于逐页请求
+    assert prober.requests <= 2 * 4 + 1
+
+
+def test_empty_feed():
+    ids, requested = run_window([], 0, NEWEST)
+    assert ids == []
+    assert requested == [1]
+
+
+def test_window_past_the_end():
+    feed = make_feed(95)
+    # 窗口整体早于最早的活动
+    ids, _ = run_window(feed, feed[-1].epoch - 10_000, feed[-1].epoch - 1)
+    assert ids == []
+
+
+def test_window_newer_than_everything():
+    feed = make_feed(95)
+    ids, requested = run_window(feed, NEWEST + 1, NEWEST + 10_000)
+    assert ids == []
+    assert requested == [1]
+
+
+def test_failed_probe_returns_none():
+    feed = make_feed(95)
+
+    async def fetch_page(page, per_page):
+        return None if page == 4 else feed[(page - 1) * per_page:page * per_page]
+
+    assert asyncio.run(fetch_activity_window(fetch_page, 0, NEWEST, per_page=PER_PAGE)) is None
+
+
+@pytest.mark.parametrize('count', [10, 95, 100])
+def test_window_matches_brute_force(count):
+    feed = make_feed(count)
+    epochs = [activity.epoch for activity in feed]
+    bounds = sorted({epochs[0] + 1, epochs[-1] - 1} | {epoch + delta for epoch in epochs[::7] for delta in (-1, 0, 1)})
+    for start_ts in bounds:
+        for end_ts in bounds:
+            if start_ts > end_ts:
+                continue
+            ids, _ = run_window(feed, start_ts, end_ts)
+            assert ids == window(feed, start_ts, end_ts), (start_ts, end_ts)
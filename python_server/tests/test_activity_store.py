@@ -0,0 +1,98 @@
+"""
+ActivityStore 增量同步测试
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from activity_records import CODEUP_TZ, to_records
+from activity_store import ActivityStore
+
+NOW = datetime.now(CODEUP_TZ).replace(microsecond=0)
+
+
+def make_activities(project_id, count):
+    """按时间倒序生成活动（与上游活动流顺序一致）"""
+    return [
+        {
+            'id': project_id * 100000 + count - i,
+            'action': 5,
+            'createdAt': (NOW - timedelta(minutes=10 * i)).isoformat(),
+            'user': {'id': 'u1', 'name': 'alice'},
+            'project': {'id': project_id, 'name': f'proj{project_id}'},
+            'dataMap': {':ref': 'refs/heads/master', ':commits': []},
+        }
+        for i in range(count)
+    ]
+
+
+def paged_source(activities, fail_on_page=None, waits=None):
+    """模拟上游分页：fail_on_page 页返回None（请求失败），waits 中的页等待对应事件后才返回"""
+    waits = waits or {}
+
+    async def fetch_page(page, per_page):
+        if page in waits:
+            await waits[page].wait()
+        else:
+            await asyncio.sleep(0)
+        if page == fail_on_page:
+            return None
+        return to_records(activities[(page - 1) * per_page:page * per_page])
+
+    return fetch_page
+
+
+def count_rows(store, project_id):
+    return store._conn.execute("SELECT COUNT(*) FROM activities WHERE project_id = ?", (project_id,)).fetchone()[0]
+
+
+def test_failed_sync_does_not_discard_other_project_rows(tmp_path):
+    store = ActivityStore(str(tmp_path / 'activities.db'))
+    since = NOW - timedelta(days=365)
+    release_last_page = asyncio.Event()
+
+    async def failing_sync():
+        result = await store.sync(2, since, paged_source(make_activities(2, 250), fail_on_page=2))
+        # 项目2失败时项目1仍在等待第3页
+        release_last_page.set()
+        return result
+
+    async def run():
+        return await asyncio.gather(
+            store.sync(1, since, paged_source(make_activities(1, 250), waits={3: release_last_page})),
+            failing_sync(),
+        )
+
+    ok_1, ok_2 = asyncio.run(run())
+    assert ok_1 is True and ok_2 is False
+    assert count_rows(store, 1) == 250
+    assert asyncio.run(store.head_covered_from(1)) == 0.0
+    # 失败的同步不写入任何数据，也不记录覆盖范围
+    assert count_rows(store, 2) == 0
+    assert asyncio.run(store.head_covered_from(2)) is None
+    # 同步结束后不再保留项目锁
+    assert len(store._locks) == 0
+    store.close()
+
+
+def test_incremental_sync_fetches_only_new_activities(tmp_path):
+    store = ActivityStore(str(tmp_path / 'activities.db'))
+    since = NOW - timedelta(days=365)
+    activities = make_activities(1, 150)
+    assert asyncio.run(store.sync(1, since, paged_source(activities)))
+
+    newer = [dict(activity, id=activity['id'] + 1000,
+                  createdAt=(NOW + timedelta(minutes=10 * (i + 1))).isoformat())
+             for i, activity in enumerate(make_activities(1, 5))]
+    requested = []
+    source = paged_source(newer + activities)
+
+    async def fetch_page(page, per_page):
+        requested.append(page)
+        return await source(page, per_page)
+
+    assert asyncio.run(store.sync(1, None, fetch_page))
+    assert requested == [1]
+    assert count_rows(store, 1) == 155
+    assert len(asyncio.run(store.query(1, (NOW - timedelta(days=2)).replace(tzinfo=None),
+                                       (NOW + timedelta(days=1)).replace(tzinfo=None), user_name='alice'))) == 155
+    store.close()
@@ -0,0 +1,116 @@
+"""
+提交消息清理测试：规则文件与规则校验、与原有过滤逻辑的一致性、写时复制
+"""
+import json
+
+import pytest
+
+from activity_records import to_records
+from commit_scrubber import DEFAULT_RULES, CommitScrubber
+
+FOOTER = '🤖 Generated with [Claude Code](https://claude.ai/code)'
+
+
+def from_rules_file(monkeypatch, tmp_path, content):
+    path = tmp_path / 'rules.json'
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding='utf-8')
+    monkeypatch.setenv('COMMIT_SCRUB_RULES_FILE', str(path))
+    monkeypatch.setenv('COMMIT_SCRUB_DEFAULT_RULES', 'true')
+    return CommitScrubber.from_env()
+
+
+def rule_names(scrubber):
+    return [rule['name'] for rule in scrubber.rules]
+
+
+def test_rules_file_with_non_list_top_level_is_ignored(monkeypatch, tmp_path):
+    scrubber = from_rules_file(monkeypatch, tmp_path, {'name': 'x', 'pattern': 'x'})
+    assert rule_names(scrubber) == [rule['name'] for rule in DEFAULT_RULES]
+    assert scrubber.scrub_message(f'feat: a\n\n{FOOTER}') == 'feat: a'
+
+
+def test_unreadable_rules_file_keeps_default_rules(monkeypatch, tmp_path):
+    scrubber = from_rules_file(monkeypatch, tmp_path, '[{"name": ')
+    assert rule_names(scrubber) == [rule['name'] for rule in DEFAULT_RULES]
+
+
+def test_invalid_rules_are_skipped(monkeypatch, tmp_path):
+    scrubber = from_rules_file(monkeypatch, tmp_path, [
+        'not an object',
+        {'name': 'empty'},
+        {'name': 'broken', 'pattern': '(unclosed'},
+        # 与合并正则中的分组名冲突
+        {'name': 'group_clash', 'pattern': '(?P<r0>x)'},
+        # 单独可编译，合并后内联标志不在开头
+        {'name': 'inline_flag', 'pattern': '(?i)wip'},
+        {'name': 'signed_off', 'pattern': '^Signed-off-by: .+$'},
+    ])
+    assert rule_names(scrubber) == [rule['name'] for rule in DEFAULT_RULES] + ['signed_off']
+    assert scrubber.scrub_message('fix: b\n\nSigned-off-by: dev <dev@example.com>') == 'fix: b'
+
+
+def legacy_clean_commit_message(message):
+    """原 CodeupClient._clean_commit_message 的实现，用于对照"""
+    if not message:
+        return message
+    try:
+        lines = message.split('\n')
+        cleaned_lines = []
+        for line in lines:
+            if "🤖 Generated with [Claude Code]" in line:
+                continue
+            if "Co-Authored-By: Claude <noreply@anthropic.com>" in line:
+                continue
+            cleaned_lines.append(line)
+        return '\n'.join(cleaned_lines).rstrip()
+    except Exception:
+        return message
+
+
+CO_AUTHOR = 'Co-Authored-By: Claude <noreply@anthropic.com>'
+LEGACY_CASES = [
+    None,
+    '',
+    'fix: plain message',
+    'fix: trailing newline\n',
+    'fix: trailing spaces  \n\n',
+    f'feat: add x\n\n{FOOTER}\n\n{CO_AUTHOR}',
+    f'feat: add x\n\n{FOOTER}\n\n{CO_AUTHOR}\n',
+    f'{FOOTER}',
+    f'{FOOTER}\nfeat: footer first',
+    f'feat: middle\n{CO_AUTHOR}\nmore body\n',
+    f'feat: inline {FOOTER} text\nsecond line',
+    f'feat: crlf\r\n\r\n{FOOTER}\r\n{CO_AUTHOR}\r\n',
+    f'  {CO_AUTHOR}  \nfeat: indented trailer',
+    'feat: 中文消息\n\n- 第一条\n- 第二条\n\n',
+    '🤖 Generated with Claude (no brackets)',
+    f'Co-Authored-By: Someone <a@b.c>\n{CO_AUTHOR}',
+    123,
+]
+
+
+@pytest.mark.parametrize('message', LEGACY_CASES)
+def test_matches_legacy_filter(message):
+    assert CommitScrubber().scrub_message(message) == legacy_clean_commit_message(message)
+
+
+def test_unchanged_message_and_activity_are_not_copied():
+    scrubber = CommitScrubber()
+    message = 'fix: nothing to remove\n\nbody'
+    assert scrubber.scrub_message(message) is message
+
+    activities = to_records([
+        {'id': 1, 'action': 5, 'createdAt': '2026-10-16T10:00:00+08:00', 'user': {'name': 'alice'},
+         'dataMap': {':commits': [{':id': 'a', ':message': message}]}},
+        {'id': 2, 'action': 5, 'createdAt': '2026-10-16T09:00:00+08:00', 'user': {'name': 'alice'},
+         'dataMap': {':commits': [{':id': 'b', ':message': f'feat: y\n\n{FOOTER}'}]}},
+    ])
+    untouched = activities[:1]
+    assert scrubber.scrub_activities(untouched) is untouched
+
+    cleaned = scrubber.scrub_activities(activities)
+    assert cleaned is not activities
+    assert cleaned[0] is activities[0]
+    assert cleaned[1] is not activities[1]
+    assert cleaned[1].commits[0].message == 'feat: y'
+    assert activities[1].commits[0].message == f'feat: y\n\n{FOOTER}'
@@ -0,0 +1,121 @@
+"""
+Dify调度器测试：优先级、单用户上限、排队超时与快速拒绝
+"""
+import asyncio
+
+import pytest
+
+from dify_dispatcher import BATCH, INTERACTIVE, REPORT, DifyDispatcher, DifySaturatedError
+
+
+def make_dispatcher(**settings):
+    dispatcher = DifyDispatcher()
+    for name, value in settings.items():
+        setattr(dispatcher, name, value)
+    return dispatcher
+
+
+async def hold(dispatcher, order, name, priority, owner=None, seconds=0.05, admitted=False):
+    try:
+        async with dispatcher.slot(priority, owner, admitted):
+            order.append(name)
+            await asyncio.sleep(seconds)
+    except DifySaturatedError:
+        order.append(f'{name}:rejected')
+
+
+def test_waiters_are_served_by_priority():
+    dispatcher = make_dispatcher(max_concurrency=1, reserved_interactive=0, max_per_user=10, queue_timeout=5)
+    order = []
+
+    async def run():
+        first = asyncio.ensure_future(hold(dispatcher, order, 'first', REPORT))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(hold(dispatcher, order, name, priority))
+                   for name, priority in (('batch', BATCH), ('report', REPORT), ('chat', INTERACTIVE))]
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(run())
+    assert order == ['first', 'chat', 'report', 'batch']
+
+
+def test_interactive_slots_are_reserved():
+    dispatcher = make_dispatcher(max_concurrency=3, reserved_interactive=1, max_per_user=10)
+    order = []
+
+    async def run():
+        tasks = [asyncio.ensure_future(hold(dispatcher, order, f'report{i}', REPORT)) for i in range(3)]
+        tasks.append(asyncio.ensure_future(hold(dispatcher, order, 'chat', INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        running = list(order)
+        await asyncio.gather(*tasks)
+        return running
+
+    assert asyncio.run(run()) == ['report0', 'report1', 'chat']
+
+
+def test_per_user_cap_does_not_block_other_users():
+    dispatcher = make_dispatcher(max_concurrency=8, reserved_interactive=0, max_per_user=2, queue_timeout=5)
+    order = []
+
+    async def run():
+        tasks = [asyncio.ensure_future(hold(dispatcher, order, f'a{i}', REPORT, 'a')) for i in range(3)]
+        tasks.append(asyncio.ensure_future(hold(dispatcher, order, 'b0', REPORT, 'b')))
+        await asyncio.sleep(0.01)
+        running = list(order)
+        await asyncio.gather(*tasks)
+        return running
+
+    assert asyncio.run(run()) == ['a0', 'a1', 'b0']
+    assert order[-1] == 'a2'
+
+
+def test_admitted_calls_bypass_per_user_cap_and_timeout():
+    dispatcher = make_dispatcher(max_concurrency=8, reserved_interactive=0, max_per_user=1, queue_timeout=0.01)
+    order = []
+
+    async def run():
+        await asyncio.gather(*(hold(dispatcher, order, f'chunk{i}', REPORT, 'a', admitted=True) for i in range(3)))
+
+    asyncio.run(run())
+    assert sorted(order) == ['chunk0', 'chunk1', 'chunk2']
+
+
+def test_queue_timeout_and_full_queue_reject():
+    dispatcher = make_dispatcher(max_concurrency=1, reserved_interactive=0, max_queue=1, queue_timeout=0.02)
+    order = []
+
+    async def run():
+        await asyncio.gather(
+            hold(dispatcher, order, 'running', REPORT, seconds=0.1),
+            hold(dispatcher, order, 'queued', REPORT),
+            hold(dispatcher, order, 'overflow', REPORT),
+            hold(dispatcher, order, 'batch', BATCH),
+        )
+
+    asyncio.run(run())
+    assert 'queued:rejected' in order and 'overflow:rejected' in order
+    assert order[-1] == 'batch'
+    stats = dispatcher.stats()['priorities']['report']
+    assert stats['timeouts'] == 1 and stats['rejected'] == 2
+    # 所有名额占满且不允许排队时，接口层准入检查立即拒绝
+    dispatcher._active, dispatcher.max_queue = 1, 0
+    with pytest.raises(DifySaturatedError):
+        dispatcher.admit(REPORT)
+
+
+def test_cancelled_waiter_leaves_queue():
+    dispatcher = make_dispatcher(max_concurrency=1, reserved_interactive=0, queue_timeout=5)
+    order = []
+
+    async def run():
+        running = asyncio.ensure_future(hold(dispatcher, order, 'running', REPORT, seconds=0.05))
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(hold(dispatcher, order, 'waiting', REPORT))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(running, waiting, return_exceptions=True)
+
+    asyncio.run(run())
+    assert order == ['running']
+    assert dispatcher.stats()['active'] == 0 and dispatcher.stats()['queued'] == 0
@@ -0,0 +1,162 @@
+"""
+元数据缓存测试：TTL过期、LRU淘汰、过期后台刷新与失效（使用假时钟）
+"""
+import asyncio
+
+import pytest
+
+import metadata_cache as metadata_cache_module
+from metadata_cache import MetadataCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(metadata_cache_module, 'time', clock)
+    return clock
+
+
+class Source:
+    """按调用次数返回递增值的回源函数"""
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('upstream down')
+        return {'version': self.calls}
+
+
+def make_cache(**kwargs):
+    return MetadataCache(ttls={'project_counts': 60}, stale_seconds=300, **kwargs)
+
+
+def get(cache, source, ticket='t1', endpoint='project_counts', params=None):
+    return cache.get_or_fetch(ticket, endpoint, params, source)
+
+
+def test_fresh_hit_then_miss_after_stale_window(clock):
+    cache = make_cache()
+    source = Source()
+
+    async def run():
+        first = await get(cache, source)
+        clock.now += 59
+        fresh = await get(cache, source)
+        clock.now += 1 + 300
+        expired = await get(cache, source)
+        return first, fresh, expired
+
+    first, fresh, expired = asyncio.run(run())
+    assert first == fresh == {'version': 1}
+    assert expired == {'version': 2}
+    assert source.calls == 2
+    counters = cache.stats()['endpoints']['project_counts']
+    assert (counters['hits'], counters['stale_hits'], counters['misses']) == (1, 0, 2)
+
+
+def test_stale_hit_returns_old_value_and_refreshes_once(clock):
+    cache = make_cache()
+    source = Source()
+
+    async def run():
+        await get(cache, source)
+        clock.now += 61
+        stale = [await get(cache, source), await get(cache, source)]
+        assert cache.stats()['refreshing'] == 1
+        await asyncio.sleep(0)
+        refreshed = await get(cache, source)
+        return stale, refreshed
+
+    stale, refreshed = asyncio.run(run())
+    assert stale == [{'version': 1}, {'version': 1}]
+    assert refreshed == {'version': 2}
+    assert source.calls == 2
+    counters = cache.stats()['endpoints']['project_counts']
+    assert counters['stale_hits'] == 2 and counters['refreshes'] == 1 and counters['hits'] == 1
+
+
+def test_failed_refresh_drops_entry(clock):
+    cache = make_cache()
+    source = Source()
+
+    async def run():
+        await get(cache, source)
+        clock.now += 61
+        source.fail = True
+        stale = await get(cache, source)
+        await asyncio.sleep(0)
+        return stale
+
+    assert asyncio.run(run()) == {'version': 1}
+    assert cache.stats()['size'] == 0
+
+
+def test_none_is_not_cached(clock):
+    cache = make_cache()
+    calls = []
+
+    async def missing():
+        calls.append(1)
+        return None
+
+    async def run():
+        await get(cache, missing)
+        await get(cache, missing)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats()['size'] == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = make_cache(max_entries=2)
+    source = Source()
+
+    async def run():
+        await get(cache, source, params={'page': 1})
+        await get(cache, source, params={'page': 2})
+        # 访问第1页后，第2页成为最久未使用
+        await get(cache, source, params={'page': 1})
+        await get(cache, source, params={'page': 3})
+        calls = source.calls
+        await get(cache, source, params={'page': 1})
+        await get(cache, source, params={'page': 2})
+        return calls
+
+    calls_before = asyncio.run(run())
+    assert calls_before == 3
+    # 第1页命中，第2页被淘汰后重新回源
+    assert source.calls == 4
+    assert cache.stats()['endpoints']['project_counts']['evictions'] == 2
+
+
+def test_invalidate_by_ticket_endpoint_and_params(clock):
+    cache = make_cache()
+    source = Source()
+
+    async def run():
+        await get(cache, source, ticket='t1', params={'page': 1})
+        await get(cache, source, ticket='t1', params={'page': 2})
+        await get(cache, source, ticket='t1', endpoint='project_overview')
+        await get(cache, source, ticket='t2', params={'page': 1})
+
+    asyncio.run(run())
+    assert cache.invalidate('t1', 'project_counts', {'page': 1}) == 1
+    assert cache.invalidate('t1', 'project_counts', {'page': 1}) == 0
+    assert cache.invalidate('t1', 'project_overview') == 1
+    assert cache.invalidate('t1') == 1
+    assert cache.stats()['size'] == 1
+    assert cache.invalidate() == 1
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,54 @@
+"""
+运行指标接口测试：必须携带有效的登录凭证
+"""
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import codeup_api
+import utils
+from codeup_client import AsyncCodeupClient
+from metadata_cache import MetadataCache
+
+HEADERS = {'X-Codeup-Cookies': 'login_aliyunid_ticket=ticket'}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """模拟 /users/me 的上游响应，返回测试客户端"""
+    monkeypatch.setenv('CODEUP_ACTIVITY_STORE', 'false')
+    state = {'status': 200, 'user': {'id': 'u1', 'name': 'alice'}}
+
+    def handler(request):
+        if state['status'] != 200:
+            return httpx.Response(state['status'])
+        if state['user'] is None:
+            return httpx.Response(200, json={'success': False})
+        return httpx.Response(200, json={'success': True, 'result': {'user': state['user']}})
+
+    client = AsyncCodeupClient('ticket', http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                               cache=MetadataCache())
+    monkeypatch.setattr(utils, 'get_client', lambda login_ticket: client)
+    state['api'] = TestClient(codeup_api.app)
+    return state
+
+
+def test_metrics_require_cookies(api):
+    assert api['api'].get('/api/v1/metrics').status_code == 422
+    response = api['api'].get('/api/v1/metrics', headers={'X-Codeup-Cookies': 'other=1'})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize('status, user', [(302, None), (200, None)])
+def test_metrics_reject_unverified_ticket(api, status, user):
+    api['status'], api['user'] = status, user
+    response = api['api'].get('/api/v1/metrics', headers=HEADERS)
+    assert response.status_code == 401
+    assert 'dify_dispatcher' not in response.text
+
+
+def test_metrics_with_valid_ticket(api):
+    response = api['api'].get('/api/v1/metrics', headers=HEADERS)
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert 'dify_dispatcher' in data and 'report_scheduler' in data
@@ -0,0 +1,116 @@
+"""
+跨项目活动测试：按时间倒序合并、只保留当前用户、无法获取用户信息时拒绝请求
+"""
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import codeup_api
+from codeup_client import AsyncCodeupClient, UserInfoUnavailableError
+from metadata_cache import MetadataCache
+
+START = datetime(2026, 10, 12)
+END = datetime(2026, 10, 18, 23, 59, 59)
+
+
+def activity(activity_id, created_at, user_name, project_id):
+    return {
+        'id': activity_id,
+        'action': 5,
+        'createdAt': created_at,
+        'user': {'name': user_name},
+        'project': {'id': project_id, 'name': f'project-{project_id}'},
+        'dataMap': {':commits': [{':id': f'c{activity_id}', ':message': f'fix: {activity_id}'}]},
+    }
+
+
+PROJECTS = [
+    {'id': 1, 'name': 'project-1', 'last_activity_at': '2026-10-16T10:00:00+08:00'},
+    {'id': 2, 'name': 'project-2', 'last_activity_at': '2026-10-15T10:00:00+08:00'},
+    # 早于开始时间，不应被扫描
+    {'id': 3, 'name': 'project-3', 'last_activity_at': '2026-10-01T10:00:00+08:00'},
+]
+
+FEEDS = {
+    1: [
+        activity(11, '2026-10-16T10:00:00+08:00', 'alice', 1),
+        activity(12, '2026-10-15T12:00:00+08:00', 'bob', 1),
+        activity(13, '2026-10-14T09:00:00+08:00', 'alice', 1),
+        activity(14, '2026-10-05T09:00:00+08:00', 'alice', 1),
+    ],
+    2: [
+        activity(21, '2026-10-15T10:00:00+08:00', 'alice', 2),
+        activity(22, '2026-10-14T18:00:00+08:00', 'bob', 2),
+        activity(23, '2026-10-13T08:00:00+08:00', 'alice', 2),
+    ],
+    3: [activity(31, '2026-10-01T10:00:00+08:00', 'alice', 3)],
+}
+
+
+@pytest.fixture
+def codeup(monkeypatch):
+    """模拟 Codeup 上游，记录请求过的项目"""
+    monkeypatch.setenv('CODEUP_ACTIVITY_STORE', 'false')
+    state = {'user': {'id': 'u1', 'name': 'alice'}, 'requested_projects': set()}
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith('/users/me'):
+            if state['user'] is None:
+                return httpx.Response(200, json={'success': False})
+            return httpx.Response(200, json={'success': True, 'result': {'user': state['user']}})
+        if path.endswith('/projects/authorized/list'):
+            return httpx.Response(200, json=PROJECTS if request.url.params.get('page') == '1' else [])
+        project_id = int(path.split('/')[-2])
+        state['requested_projects'].add(project_id)
+        page = int(request.url.params['page'])
+        per_page = int(request.url.params['per_page'])
+        return httpx.Response(200, json=FEEDS[project_id][(page - 1) * per_page:page * per_page])
+
+    def make_client(ticket='ticket'):
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return AsyncCodeupClient(ticket, http_client=http_client, cache=MetadataCache())
+
+    state['make_client'] = make_client
+    return state
+
+
+def test_merges_projects_newest_first_and_keeps_only_current_user(codeup):
+    client = codeup['make_client']()
+    result = asyncio.run(client.get_my_activities(START, END))
+
+    assert [item['id'] for item in result['activities']] == [11, 21, 13, 23]
+    assert {item['user']['name'] for item in result['activities']} == {'alice'}
+    assert result['projects'] == [
+        {'id': 1, 'name': 'project-1', 'activity_count': 2},
+        {'id': 2, 'name': 'project-2', 'activity_count': 2},
+    ]
+    assert result['scanned_projects'] == 2
+    assert result['failed_projects'] == []
+    assert codeup['requested_projects'] == {1, 2}
+
+
+def test_unknown_user_is_refused(codeup):
+    codeup['user'] = None
+    client = codeup['make_client']()
+    with pytest.raises(UserInfoUnavailableError):
+        asyncio.run(client.get_my_activities(START, END))
+    # 不会退化为拉取所有人的活动
+    assert codeup['requested_projects'] == set()
+
+
+def test_endpoint_returns_401_for_unknown_user(codeup, monkeypatch):
+    codeup['user'] = None
+    client = codeup['make_client']()
+    monkeypatch.setattr(codeup_api, 'get_client_from_cookies', lambda cookies: client)
+
+    response = TestClient(codeup_api.app).get(
+        '/api/v1/users/me/activities',
+        params={'start_date': '2026-10-12', 'end_date': '2026-10-18'},
+        headers={'X-Codeup-Cookies': 'login_aliyunid_ticket=ticket'},
+    )
+    assert response.status_code == 401
+    assert '无法获取当前用户信息' in response.json()['message']
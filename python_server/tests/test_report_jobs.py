@@ -0,0 +1,141 @@
+"""
+报告任务测试：相同任务合并、并发上限、排队上限、取消与订阅续传
+"""
+import asyncio
+
+import pytest
+
+import report_jobs as report_jobs_module
+from dify_dispatcher import REPORT
+from report_jobs import (
+    CANCELLED, QUEUED, SUCCEEDED, ReportJobManager, ReportJobQueueFullError, owner_id
+)
+
+
+class FakeClient:
+    def __init__(self, login_ticket='ticket'):
+        self.login_ticket = login_ticket
+
+
+class FakeRequest:
+    def __init__(self, last_event_id=None):
+        self.headers = {'last-event-id': last_event_id} if last_event_id else {}
+
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture
+def fake_reports(monkeypatch):
+    """替换报告生成，每个报告输出3段内容，记录同时运行的报告数和调度参数"""
+    monkeypatch.setenv('SSE_COALESCE_MS', '0')
+    state = {'delay': 0.02, 'active': 0, 'max_active': 0, 'calls': []}
+
+    async def report_events(client, project_id, report_type, time_range, additional_context,
+                            user, refresh, priority, owner):
+        state['calls'].append((project_id, priority, owner))
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+        try:
+            yield {'type': 'progress', 'stage': 'generating'}
+            for i in range(3):
+                await asyncio.sleep(state['delay'])
+                yield {'type': 'content', 'content': f'{project_id}-{i},'}
+            yield {'type': 'done', 'message': '生成完成'}
+        finally:
+            state['active'] -= 1
+
+    monkeypatch.setattr(report_jobs_module, 'report_events', report_events)
+    return state
+
+
+async def wait_finished(*jobs):
+    while not all(job.finished for job in jobs):
+        await asyncio.sleep(0.01)
+
+
+def test_duplicates_share_a_job_and_runs_are_bounded(fake_reports, monkeypatch):
+    monkeypatch.setenv('AI_REPORT_JOB_CONCURRENCY', '1')
+
+    async def run():
+        manager = ReportJobManager()
+        first, created = manager.submit(FakeClient(), 1)
+        duplicate, duplicate_created = manager.submit(FakeClient(), 1)
+        second, _ = manager.submit(FakeClient(), 2)
+        other_user, other_created = manager.submit(FakeClient('other'), 1)
+        assert created and not duplicate_created and other_created
+        assert duplicate is first and other_user is not first
+        await asyncio.sleep(0.01)
+        assert second.status == QUEUED and manager.queue_position(second) == 1
+        await wait_finished(first, second, other_user)
+        return manager, first, second, other_user
+
+    manager, first, second, other_user = asyncio.run(run())
+    assert fake_reports['max_active'] == 1
+    assert len(fake_reports['calls']) == 3
+    assert first.status == second.status == SUCCEEDED
+    assert first.answer == '1-0,1-1,1-2,'
+    assert first.progress == {'stage': 'generating'}
+    assert (1, REPORT, owner_id('ticket')) in fake_reports['calls']
+    # 只能查询自己提交的任务
+    assert manager.get(first.id, 'ticket') is first
+    assert manager.get(first.id, 'other') is None
+    assert manager.stats()['deduplicated'] == 1
+
+
+def test_submit_rejected_when_pending_limit_reached(fake_reports, monkeypatch):
+    monkeypatch.setenv('AI_REPORT_JOB_MAX_PENDING', '1')
+
+    async def run():
+        manager = ReportJobManager()
+        job, _ = manager.submit(FakeClient(), 1)
+        with pytest.raises(ReportJobQueueFullError):
+            manager.submit(FakeClient(), 2)
+        await wait_finished(job)
+        # 结束的任务不再占用名额
+        next_job, created = manager.submit(FakeClient(), 2)
+        await wait_finished(next_job)
+        return manager, created
+
+    manager, created = asyncio.run(run())
+    assert created
+    assert manager.stats()['rejected'] == 1
+
+
+def test_cancel_stops_generation(fake_reports):
+    fake_reports['delay'] = 0.5
+
+    async def run():
+        manager = ReportJobManager()
+        job, _ = manager.submit(FakeClient(), 1)
+        await asyncio.sleep(0.05)
+        assert manager.cancel(job)
+        await wait_finished(job)
+        assert not manager.cancel(job)
+        return manager, job
+
+    manager, job = asyncio.run(run())
+    assert job.status == CANCELLED
+    assert fake_reports['active'] == 0
+    assert manager.stats()[CANCELLED] == 1
+
+
+def test_subscription_resumes_after_last_event_id(fake_reports):
+    async def read(subscription):
+        events = []
+        async for event_id, event in subscription:
+            events.append((event_id, event))
+        await subscription.aclose()
+        return events
+
+    async def run():
+        manager = ReportJobManager()
+        job, _ = manager.submit(FakeClient(), 1)
+        await wait_finished(job)
+        full = await read(manager.events(FakeRequest(), job))
+        resumed = await read(manager.events(FakeRequest(full[2][0]), job))
+        return full, resumed
+
+    full, resumed = asyncio.run(run())
+    assert [event['type'] for _, event in full] == ['progress', 'content', 'content', 'content', 'done']
+    assert resumed == full[3:]
@@ -0,0 +1,139 @@
+"""
+报告生成流水线测试：分段摘要（map-reduce）在Dify调度限制下的行为
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import dify_client as dify_client_module
+import report_pipeline as report_pipeline_module
+from dify_dispatcher import DifyDispatcher, REPORT
+from report_cache import ReportCache
+from report_pipeline import ReportPipeline
+
+
+def make_activities(count):
+    now = datetime(2026, 10, 16, 18, 0)
+    return [
+        {
+            'id': count - i,
+            'action': 5,
+            'createdAt': (now - timedelta(minutes=20 * i)).isoformat(),
+            'user': {'name': 'alice'},
+            'dataMap': {':ref': 'refs/heads/master', ':commits': [
+                {':id': f'c{i}', ':message': f'feat: 功能 {i} 的实现细节', ':author': {':name': 'alice'}}
+            ]},
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def fake_dify(monkeypatch):
+    """替换Dify连接池为本地模拟，每次调用耗时 latency 秒，记录最大并发数"""
+    state = {'latency': 0.3, 'calls': 0, 'active': 0, 'max_active': 0, 'complete': True}
+
+    async def handler(request):
+        state['calls'] += 1
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+        try:
+            await asyncio.sleep(state['latency'])
+        finally:
+            state['active'] -= 1
+        body = f"data: {json.dumps({'event': 'message', 'answer': '要点'})}\n\n"
+        if state['complete']:
+            body += f"data: {json.dumps({'event': 'message_end'})}\n\n"
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(dify_client_module, 'get_dify_http_client', lambda: client)
+    return state
+
+
+def use_dispatcher(monkeypatch, **settings):
+    dispatcher = DifyDispatcher()
+    for name, value in settings.items():
+        setattr(dispatcher, name, value)
+    monkeypatch.setattr(dify_client_module, 'dify_dispatcher', dispatcher)
+    monkeypatch.setattr(report_pipeline_module, 'dify_dispatcher', dispatcher)
+    return dispatcher
+
+
+def make_pipeline():
+    pipeline = ReportPipeline()
+    pipeline.single_pass_tokens = 100
+    pipeline.min_messages_per_type = 10
+    pipeline.chunk_tokens = 200
+    pipeline.map_concurrency = 4
+    return pipeline
+
+
+def collect_events(pipeline, activities, owner='user-1'):
+    return pipeline.generate('activity_summary', activities, 'proj', '本周', priority=REPORT, owner=owner)
+
+
+async def collect(pipeline, activities, owner='user-1'):
+    return [event async for event in collect_events(pipeline, activities, owner)]
+
+
+def test_map_reduce_is_not_blocked_by_own_per_user_cap(monkeypatch, fake_dify):
+    # 单次调用耗时超过排队超时：分段调用若受单用户上限排队，会以“AI服务繁忙”失败
+    dispatcher = use_dispatcher(monkeypatch, max_concurrency=8, reserved_interactive=2,
+                                max_per_user=2, queue_timeout=0.1)
+    pipeline = make_pipeline()
+
+    events = asyncio.run(collect(pipeline, make_activities(60)))
+
+    assert events[-1]['type'] == 'done', events[-1]
+    assert not [event for event in events if event['type'] == 'error']
+    assert pipeline.stats()['map_reduce'] == 1
+    chunks = pipeline.stats()['chunks']
+    assert chunks > 2
+    assert fake_dify['calls'] == chunks + 1
+    assert fake_dify['max_active'] == min(4, chunks)
+    assert dispatcher.stats()['active'] == 0 and dispatcher.stats()['queued'] == 0
+
+
+def test_map_reduce_respects_global_limit(monkeypatch, fake_dify):
+    fake_dify['latency'] = 0.05
+    use_dispatcher(monkeypatch, max_concurrency=4, reserved_interactive=2, max_per_user=2, queue_timeout=0.01)
+
+    events = asyncio.run(collect(make_pipeline(), make_activities(60)))
+
+    assert events[-1]['type'] == 'done'
+    assert fake_dify['max_active'] == 2
+
+
+def test_map_reduce_rejected_up_front_when_queue_full(monkeypatch, fake_dify):
+    dispatcher = use_dispatcher(monkeypatch, max_queue=0)
+    dispatcher._active = dispatcher.max_concurrency
+
+    events = asyncio.run(collect(make_pipeline(), make_activities(60)))
+
+    assert [event['type'] for event in events] == ['error']
+    assert events[0]['retry_after'] == dispatcher.retry_after
+    assert fake_dify['calls'] == 0
+
+
+def test_stream_cut_before_message_end_is_an_error_and_not_cached(monkeypatch, fake_dify, tmp_path):
+    fake_dify['latency'] = 0
+    fake_dify['complete'] = False
+    use_dispatcher(monkeypatch)
+    cache = ReportCache(str(tmp_path / 'reports.db'))
+
+    async def run():
+        events = []
+        async for event in cache.record('key', collect_events(make_pipeline(), make_activities(3))):
+            events.append(event)
+        return events
+
+    events = asyncio.run(run())
+    cache.close()
+
+    assert events[-1]['type'] == 'error'
+    assert not [event for event in events if event['type'] == 'done']
+    assert ReportCache(str(tmp_path / 'reports.db')).get('key') is None
@@ -0,0 +1,99 @@
+"""
+报告预生成调度测试：凭证失效时停止其余项目、预生成使用独立的调度标识
+"""
+import asyncio
+
+import pytest
+
+import report_scheduler as report_scheduler_module
+from codeup_client import AuthenticationError
+from dify_dispatcher import BATCH
+from report_jobs import owner_id
+from report_scheduler import ReportScheduler, ScheduleRegistration
+
+
+class FakeClient:
+    def __init__(self, count):
+        self.count = count
+
+    async def get_all_projects(self):
+        return [{'id': i, 'name': f'p{i}'} for i in range(1, self.count + 1)]
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(report_scheduler_module, 'get_client', lambda ticket: FakeClient(6))
+    scheduler = ReportScheduler()
+    scheduler.concurrency = 3
+    return scheduler
+
+
+def test_auth_failure_cancels_remaining_projects(scheduler, monkeypatch):
+    state = {'started': [], 'cancelled': 0, 'finished': 0}
+
+    async def fetch(client, project_id, time_range):
+        state['started'].append(project_id)
+        if project_id == 2:
+            await asyncio.sleep(0.05)
+            raise AuthenticationError('凭证已失效')
+        try:
+            await asyncio.sleep(0.5)
+        except asyncio.CancelledError:
+            state['cancelled'] += 1
+            raise
+        state['finished'] += 1
+        return [], '本周'
+
+    monkeypatch.setattr(report_scheduler_module, 'fetch_report_activities', fetch)
+
+    async def main():
+        registration = ScheduleRegistration('ticket', ['activity_summary'])
+        result = await scheduler.run(registration)
+        snapshot = dict(result)
+        await asyncio.sleep(0.6)
+        return registration, result, snapshot
+
+    registration, result, snapshot = asyncio.run(main())
+    assert result['error'].startswith('认证失败')
+    # 失败后进行中的项目被取消，尚未开始的项目不再请求
+    assert 5 not in state['started'] and 6 not in state['started']
+    assert state['cancelled'] == len(state['started']) - 1
+    assert state['finished'] == 0
+    assert result == snapshot
+    assert registration.running is False
+
+
+def test_pregeneration_uses_batch_owner(scheduler, monkeypatch):
+    calls = []
+
+    async def fetch(client, project_id, time_range):
+        return ([{'id': project_id}] if project_id % 2 else []), '本周'
+
+    async def generate(project_id, project_name, report_type, time_range, time_range_desc,
+                       activities_data, user, priority, owner):
+        calls.append((priority, owner))
+        yield {'type': 'done', 'cached': project_id == 1}
+
+    monkeypatch.setattr(report_scheduler_module, 'fetch_report_activities', fetch)
+    monkeypatch.setattr(report_scheduler_module, 'generate_report', generate)
+
+    result = asyncio.run(scheduler.run(ScheduleRegistration('ticket', ['activity_summary'])))
+    assert result == {'projects': 6, 'skipped': 3, 'generated': 2, 'cached': 1, 'failed': 0, 'error': None}
+    assert len(calls) == 3
+    for priority, owner in calls:
+        assert priority == BATCH
+        assert owner != owner_id('ticket')
+
+
+def test_disabled_without_report_cache(monkeypatch):
+    monkeypatch.setenv('AI_REPORT_SCHEDULE', 'true')
+    monkeypatch.setenv('AI_REPORT_CACHE', 'false')
+    scheduler = ReportScheduler()
+
+    async def run():
+        scheduler.start()
+        return scheduler._task
+
+    assert asyncio.run(run()) is None
+    assert not scheduler.enabled
+    assert scheduler.stats()['next_run'] is None
@@ -0,0 +1,73 @@
+"""
+请求合并测试：共享结果、部分调用方取消与全部调用方取消
+"""
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def make_fetch(state, delay=0.05):
+    async def fetch():
+        state['started'] += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            state['cancelled'] += 1
+            raise
+        return {'value': state['started']}
+
+    return fetch
+
+
+def new_state():
+    return {'started': 0, 'cancelled': 0}
+
+
+def test_concurrent_calls_share_one_request():
+    flight = SingleFlight()
+    state = new_state()
+
+    async def run():
+        return await asyncio.gather(*(flight.do('key', make_fetch(state)) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert state['started'] == 1
+    assert results[0] is results[1] is results[2]
+    assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'coalesced': 2}
+
+
+def test_cancelling_one_caller_keeps_request_for_others():
+    flight = SingleFlight()
+    state = new_state()
+
+    async def run():
+        first = asyncio.ensure_future(flight.do('key', make_fetch(state)))
+        second = asyncio.ensure_future(flight.do('key', make_fetch(state)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == {'value': 1}
+    assert state == {'started': 1, 'cancelled': 0}
+
+
+def test_cancelling_last_caller_cancels_request():
+    flight = SingleFlight()
+    state = new_state()
+
+    async def run():
+        callers = [asyncio.ensure_future(flight.do('key', make_fetch(state))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        in_flight = flight.stats()['in_flight']
+        # 之后的相同请求重新发起，不会拿到已取消的请求
+        result = await flight.do('key', make_fetch(state))
+        return in_flight, result
+
+    in_flight, result = asyncio.run(run())
+    assert state['cancelled'] == 1
+    assert in_flight == 0
+    assert result == {'value': 2}
@@ -0,0 +1,115 @@
+"""
+可续传AI流测试：断线续传、宽限期过期与无法续传时的重置
+"""
+import asyncio
+
+from sse_streams import RESET_MESSAGE, ResumableStreams
+
+URL = 'http://testserver/api/v1/ai/chat-stream?query=hi'
+
+
+class FakeRequest:
+    """只提供续传所需属性的请求对象；disconnect_after 个事件后模拟客户端断开"""
+
+    def __init__(self, last_event_id=None, url=URL):
+        self.url = url
+        self.headers = {'last-event-id': last_event_id} if last_event_id else {}
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def make_source(calls, count=6, delay=0.01):
+    def start():
+        calls.append(1)
+
+        async def events():
+            for i in range(count):
+                await asyncio.sleep(delay)
+                yield {'type': 'content', 'content': f'{i},'}
+            yield {'type': 'done', 'message': '生成完成'}
+
+        return events()
+
+    return start
+
+
+async def read(subscription, limit=None):
+    """读取订阅，返回 (最后的事件id, 事件列表)；读到 limit 个事件后断开"""
+    last_id, events = None, []
+    async for event_id, event in subscription:
+        last_id = event_id or last_id
+        events.append(event)
+        if limit is not None and len(events) >= limit:
+            break
+    await subscription.aclose()
+    return last_id, events
+
+
+def text(events):
+    return ''.join(event.get('content', '') for event in events)
+
+
+def test_reconnect_replays_missed_events_without_new_generation(monkeypatch):
+    monkeypatch.setenv('SSE_COALESCE_MS', '0')
+    streams = ResumableStreams()
+    calls = []
+
+    async def run():
+        last_id, first = await read(streams.open(FakeRequest(), make_source(calls), 'AI聊天'), limit=2)
+        await asyncio.sleep(0.03)
+        _, rest = await read(streams.open(FakeRequest(last_id), make_source(calls), 'AI聊天'))
+        return first, rest
+
+    first, rest = asyncio.run(run())
+    assert calls == [1]
+    assert text(first) + text(rest) == '0,1,2,3,4,5,'
+    assert rest[-1]['type'] == 'done'
+
+
+def test_expired_stream_sends_reset_instead_of_restarting(monkeypatch):
+    monkeypatch.setenv('SSE_COALESCE_MS', '0')
+    streams = ResumableStreams()
+    streams.grace_seconds = 0.01
+    calls = []
+
+    async def run():
+        last_id, first = await read(streams.open(FakeRequest(), make_source(calls, delay=0.05), 'AI聊天'), limit=1)
+        # 宽限期内没有重连，生成被取消
+        await asyncio.sleep(0.1)
+        _, resumed = await read(streams.open(FakeRequest(last_id), make_source(calls), 'AI聊天'))
+        return first, resumed
+
+    first, resumed = asyncio.run(run())
+    assert calls == [1]
+    assert resumed == [{'type': 'reset', 'message': RESET_MESSAGE}]
+    assert streams.stats()['expired'] == 1
+
+
+def test_unknown_event_id_sends_reset(monkeypatch):
+    streams = ResumableStreams()
+    calls = []
+
+    async def run():
+        return await read(streams.open(FakeRequest('unknown:3'), make_source(calls), 'AI聊天'))
+
+    _, events = asyncio.run(run())
+    assert calls == []
+    assert [event['type'] for event in events] == ['reset']
+    assert streams.stats()['resume_misses'] == 1
+
+
+def test_event_id_from_other_url_is_not_resumed(monkeypatch):
+    monkeypatch.setenv('SSE_COALESCE_MS', '0')
+    streams = ResumableStreams()
+    calls = []
+
+    async def run():
+        last_id, _ = await read(streams.open(FakeRequest(), make_source(calls), 'AI聊天'), limit=1)
+        other = FakeRequest(last_id, url=URL + '&user=other')
+        return await read(streams.open(other, make_source(calls), 'AI聊天'))
+
+    _, events = asyncio.run(run())
+    assert calls == [1]
+    assert [event['type'] for event in events] == ['reset']
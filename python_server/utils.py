@@ -1,15 +1,16 @@
 """
 工具函数模块
 """
-from typing import Dict, Optional, Any
+import json
+from typing import AsyncIterator, Dict, Optional, Any, Tuple
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 from models import SuccessResponse, ErrorResponse
-from codeup_client import CodeupClient
+from codeup_client import AsyncCodeupClient
 
 
 # 存储客户端实例（生产环境中应该使用Redis等）
-clients: Dict[str, CodeupClient] = {}
+clients: Dict[str, AsyncCodeupClient] = {}
 
 
 def parse_cookies(cookie_string: str) -> Dict[str, str]:
@@ -28,14 +29,14 @@ def extract_login_ticket_from_cookies(cookie_string: str) -> Optional[str]:
     return cookies.get('login_aliyunid_ticket')
 
 
-def get_client(login_ticket: str) -> CodeupClient:
+def get_client(login_ticket: str) -> AsyncCodeupClient:
     """获取或创建客户端实例"""
     if login_ticket not in clients:
-        clients[login_ticket] = CodeupClient(login_ticket)
+        clients[login_ticket] = AsyncCodeupClient(login_ticket)
     return clients[login_ticket]
 
 
-def get_client_from_cookies(cookies: str) -> CodeupClient:
+def get_client_from_cookies(cookies: str) -> AsyncCodeupClient:
     """从cookies中提取login_ticket并获取客户端实例"""
     login_ticket = extract_login_ticket_from_cookies(cookies)
     if not login_ticket:
@@ -59,4 +60,22 @@ def create_error_response(message: str, error_code: str = None,
     return JSONResponse(
         status_code=status_code,
         content=error_response.model_dump()
-    )
\ No newline at end of file
+    )
+
+
+def format_sse(event: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """将内部事件格式化为SSE数据帧（带事件id时客户端断线重连会携带Last-Event-ID）"""
+    data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    return f"id: {event_id}\n{data}" if event_id else data
+
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """将内部事件流转换为SSE文本流（只在接口层做格式化）"""
+    async for event in events:
+        yield format_sse(event)
+
+
+async def sse_stream_with_ids(events: AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]) -> AsyncIterator[str]:
+    """将 (事件id, 事件) 流转换为带id的SSE文本流"""
+    async for event_id, event in events:
+        yield format_sse(event, event_id)
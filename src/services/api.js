@@ -17,6 +17,70 @@ const getAPIBaseURL = () => {
 
 const API_BASE_URL = getAPIBaseURL()
 
+// SSE断线后允许浏览器自动重连的连续次数
+const MAX_SSE_RETRIES = 3
+// 服务端无法续传（reset事件）时清空内容重新开始的次数
+const MAX_SSE_RESETS = 1
+
+// 打开AI流式响应：断线时由浏览器携带 Last-Event-ID 重连续传；
+// 服务端已无法续传时发送 reset 事件，此时清空已收到的内容，用新连接重新开始
+const streamAIResponse = (url, onProgress, defaultErrorMessage) => {
+  return new Promise((resolve, reject) => {
+    let fullResponse = '';
+    let resets = 0;
+    
+    const connect = () => {
+      const eventSource = new EventSource(url);
+      let retries = 0;
+      
+      eventSource.onmessage = function(event) {
+        retries = 0;
+        try {
+          const eventData = JSON.parse(event.data);
+          if (eventData.type === 'content') {
+            fullResponse += eventData.content;
+            // 通过回调函数实时返回内容
+            if (onProgress) {
+              onProgress(fullResponse);
+            }
+          } else if (eventData.type === 'done') {
+            eventSource.close();
+            resolve({ answer: fullResponse, status: 'completed' });
+          } else if (eventData.type === 'reset') {
+            eventSource.close();
+            if (++resets > MAX_SSE_RESETS) {
+              reject(new Error(eventData.message || defaultErrorMessage));
+              return;
+            }
+            fullResponse = '';
+            if (onProgress) {
+              onProgress(fullResponse);
+            }
+            connect();
+          } else if (eventData.type === 'error') {
+            console.error('AI流式响应错误:', eventData.message);
+            eventSource.close();
+            reject(new Error(eventData.message || defaultErrorMessage));
+          }
+        } catch (e) {
+          console.error('解析SSE数据失败:', e);
+        }
+      };
+      
+      eventSource.onerror = function(error) {
+        // 连接中断时浏览器会携带 Last-Event-ID 自动重连，服务端续传未收到的内容
+        if (eventSource.readyState === EventSource.CONNECTING && ++retries <= MAX_SSE_RETRIES) {
+          return;
+        }
+        eventSource.close();
+        reject(new Error('连接AI服务失败'));
+      };
+    };
+    
+    connect();
+  });
+}
+
 // 创建axios实例
 const api = axios.create({
   baseURL: API_BASE_URL,
@@ -106,49 +170,19 @@ export const projectsApi = {
   
   // AI报告生成 - 流式响应
   generateAIReport: (projectId, data, onProgress) => {
-    return new Promise((resolve, reject) => {
-      const params = new URLSearchParams({
-        report_type: data.report_type || 'activity_summary',
-        time_range: data.time_range || 'week',
-        additional_context: data.additional_context || '',
-        user: data.user || 'frontend_user'
-      });
-      
-      const cookies = Cookies.get('codeup_cookies');
-      const baseUrl = API_BASE_URL || window.location.origin; // 生产环境使用当前域名
-      const url = `${baseUrl}/api/v1/projects/${projectId}/reports/ai-generate-stream?${params}&X-Codeup-Cookies=${encodeURIComponent(cookies || '')}`;
-      
-      const eventSource = new EventSource(url);
-      
-      let fullResponse = '';
-      
-      eventSource.onmessage = function(event) {
-        try {
-          const eventData = JSON.parse(event.data);
-          if (eventData.type === 'content') {
-            fullResponse += eventData.content;
-            // 通过回调函数实时返回内容
-            if (onProgress) {
-              onProgress(fullResponse);
-            }
-          } else if (eventData.type === 'done') {
-            eventSource.close();
-            resolve({ answer: fullResponse, status: 'completed' });
-          } else if (eventData.type === 'error') {
-            console.error('AI报告生成错误:', eventData.message);
-            eventSource.close();
-            reject(new Error(eventData.message || '生成报告时发生错误'));
-          }
-        } catch (e) {
-          console.error('解析SSE数据失败:', e);
-        }
-      };
-      
-      eventSource.onerror = function(error) {
-        eventSource.close();
-        reject(new Error('连接AI服务失败'));
-      };
+    const params = new URLSearchParams({
+      report_type: data.report_type || 'activity_summary',
+      time_range: data.time_range || 'week',
+      additional_context: data.additional_context || '',
+      user: data.user || 'frontend_user',
+      refresh: data.refresh ? 'true' : 'false'
     });
+    
+    const cookies = Cookies.get('codeup_cookies');
+    const baseUrl = API_BASE_URL || window.location.origin; // 生产环境使用当前域名
+    const url = `${baseUrl}/api/v1/projects/${projectId}/reports/ai-generate-stream?${params}&X-Codeup-Cookies=${encodeURIComponent(cookies || '')}`;
+    
+    return streamAIResponse(url, onProgress, '生成报告时发生错误');
   },
   
   // AI报告生成 - 阻塞式响应
@@ -166,40 +200,13 @@ export const projectsApi = {
 export const aiApi = {
   // AI聊天 - 流式响应
   chatStream: (query, onProgress) => {
-    return new Promise((resolve, reject) => {
-      const baseUrl = API_BASE_URL || window.location.origin; // 生产环境使用当前域名
-      const eventSource = new EventSource(`${baseUrl}/api/v1/ai/chat-stream?${new URLSearchParams({
-        query: query,
-        user: 'frontend_user'
-      })}`);
-      
-      let fullResponse = '';
-      
-      eventSource.onmessage = function(event) {
-        try {
-          const data = JSON.parse(event.data);
-          if (data.type === 'content') {
-            fullResponse += data.content;
-            if (onProgress) {
-              onProgress(fullResponse);
-            }
-          } else if (data.type === 'done') {
-            eventSource.close();
-            resolve({ answer: fullResponse, status: 'completed' });
-          } else if (data.type === 'error') {
-            eventSource.close();
-            reject(new Error(data.message || '聊天时发生错误'));
-          }
-        } catch (e) {
-          console.error('解析SSE数据失败:', e);
-        }
-      };
-      
-      eventSource.onerror = function(error) {
-        eventSource.close();
-        reject(new Error('连接AI服务失败'));
-      };
-    });
+    const baseUrl = API_BASE_URL || window.location.origin; // 生产环境使用当前域名
+    const url = `${baseUrl}/api/v1/ai/chat-stream?${new URLSearchParams({
+      query: query,
+      user: 'frontend_user'
+    })}`;
+    
+    return streamAIResponse(url, onProgress, '聊天时发生错误');
   },
   
   // AI聊天 - 阻塞式响应